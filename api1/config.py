@@ -34,6 +34,9 @@ class Config:
     SUPABASE_KEY = os.getenv("SUPABASE_ANON_KEY") or os.getenv("SUPABASE_KEY")
     SECRET_KEY = os.getenv("SECRET_KEY")
 
+    # Face recognition service (api2) that identifies uploaded videos
+    FACE_SERVICE_URL = os.getenv("FACE_SERVICE_URL", "http://localhost:5002")
+    FACE_SERVICE_TIMEOUT = float(os.getenv("FACE_SERVICE_TIMEOUT", "120"))
 
 
     @classmethod
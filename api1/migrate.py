@@ -91,6 +91,9 @@ def migrate():
                 values.append(emb_right)
                 
             if updates:
+                if 'tpl_center' in columns:
+                    # Packed copies (api2 TEMPLATE_FORMAT=bytea) would shadow these
+                    updates.append("tpl_left = NULL, tpl_center = NULL, tpl_right = NULL")
                 values.append(roll)
                 query = f"UPDATE students SET {', '.join(updates)} WHERE roll = %s"
                 cur.execute(query, tuple(values))
@@ -6,6 +6,7 @@ except ImportError:
     from config import Config
 import random
 import string
+import requests
 from flask_smorest import abort
 from werkzeug.exceptions import HTTPException
 import logging
@@ -25,6 +26,12 @@ def get_supabase() -> Client:
     
     return create_client(url, secret_key, options=ClientOptions(headers=headers))
 
+def _error_message(response, default):
+    try:
+        return response.json().get("error", default)
+    except ValueError:
+        return default
+
 class AdminService:
     @staticmethod
     def _get_client():
@@ -225,22 +232,46 @@ class AdminService:
             
             logger.debug(f"Processing video file: {filename}")
 
-            # Process video in memory (Stream processing)
-            video_data = file_or_stream.read()
-            logger.debug(f"Read {len(video_data)} bytes from video stream")
-            
-            # Mock result for successful identification
-            result_data = {
-                "name": "Test Student",
-                "roll": "STU001",
-                "confidence": 0.98,
-                "status": "marked"
-            }
-            
-            logger.info("Video processed successfully (Mock)")
+            # Stream the upload to the face service in chunks (chunked transfer
+            # encoding), so the clip is never held in memory here
+            chunks = iter(lambda: file_or_stream.read(1024 * 1024), b"")
+            try:
+                response = requests.post(
+                    f"{Config.FACE_SERVICE_URL.rstrip('/')}/api/identify_video",
+                    data=chunks,
+                    headers={"Content-Type": "video/webm"},
+                    timeout=Config.FACE_SERVICE_TIMEOUT,
+                )
+            except requests.RequestException as e:
+                logger.error(f"Face service unavailable: {e}")
+                abort(502, message="Face service unavailable")
+
+            # Check the status before parsing: error pages from a proxy or a
+            # gunicorn timeout are not JSON
+            if response.status_code == 413:
+                abort(413, message=_error_message(response, "Video too large"))
+            if response.status_code >= 500:
+                logger.error(f"Face service error {response.status_code}: {response.text[:500]}")
+                abort(502, message="Face service failed to process the video")
+            # 200 carries the match, 400 an unrecognized face; both are JSON
+            try:
+                result = response.json()
+            except ValueError:
+                logger.error(f"Face service returned non-JSON {response.status_code}: {response.text[:500]}")
+                abort(502, message="Face service failed to process the video")
+
+            if result.get("status") == "success":
+                result_data = {**result["data"], "status": "marked"}
+            else:
+                result_data = {"status": "not_recognized", "confidence": result.get("confidence")}
+            for key in ("frames_read", "frames_sampled", "inferences", "stopped_early"):
+                if key in result:
+                    result_data[key] = result[key]
+
+            logger.info(f"Video processed: {result_data}")
 
             return {
-                "message": "Video processed successfully",
+                "message": result.get("message", "Video processed successfully"),
                 "filename": filename,
                 "data": result_data
             }
@@ -0,0 +1,88 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import io
+import sys
+import os
+from werkzeug.exceptions import HTTPException
+
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+try:
+    from services import AdminService
+except ImportError:
+    from .services import AdminService
+
+
+def _response(status_code, json=None, text=''):
+    response = MagicMock(status_code=status_code, text=text)
+    if json is None:
+        response.json.side_effect = ValueError("No JSON object could be decoded")
+    else:
+        response.json.return_value = json
+    return response
+
+
+class TestUploadVideo(unittest.TestCase):
+    def setUp(self):
+        self.patches = [patch.object(AdminService, '_require_supabase', create=True),
+                        patch('services.requests.post')]
+        for p in self.patches:
+            p.start()
+        import services
+        self.post = services.requests.post
+        self.sent = []
+
+        def post(url, data, **kwargs):
+            # Drain the generator like requests does for a chunked body
+            self.sent = list(data)
+            return self.response
+        self.post.side_effect = post
+        self.response = _response(200, {'status': 'success', 'data': {'roll_number': '7'},
+                                        'frames_read': 30, 'inferences': 3})
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+
+    def assertAborts(self, code, stream=b'video'):
+        with self.assertRaises(HTTPException) as cm:
+            AdminService.upload_video(io.BytesIO(stream), filename='clip.webm')
+        self.assertEqual(cm.exception.code, code)
+
+    def test_stream_forwarded_in_chunks(self):
+        body = b'a' * (1024 * 1024) + b'b' * (1024 * 1024) + b'c' * 10
+        result = AdminService.upload_video(io.BytesIO(body), filename='clip.webm')
+
+        self.assertEqual([len(c) for c in self.sent], [1024 * 1024, 1024 * 1024, 10])
+        self.assertEqual(b''.join(self.sent), body)
+        kwargs = self.post.call_args[1]
+        self.assertNotIn('Content-Length', kwargs['headers'])
+        self.assertEqual(kwargs['headers']['Content-Type'], 'video/webm')
+        self.assertTrue(self.post.call_args[0][0].endswith('/api/identify_video'))
+        self.assertEqual(result['filename'], 'clip.webm')
+        self.assertEqual(result['data'], {'roll_number': '7', 'status': 'marked',
+                                          'frames_read': 30, 'inferences': 3})
+
+    def test_not_recognized(self):
+        self.response = _response(400, {'status': 'not_recognized', 'confidence': 0.4})
+        result = AdminService.upload_video(io.BytesIO(b'video'), filename='clip.webm')
+        self.assertEqual(result['data'], {'status': 'not_recognized', 'confidence': 0.4})
+
+    def test_too_large(self):
+        self.response = _response(413, {'error': 'Video exceeds 100 bytes'})
+        self.assertAborts(413)
+        self.response = _response(413, text='<html>Request Entity Too Large</html>')
+        self.assertAborts(413)
+
+    def test_non_json_error_checked_before_parsing(self):
+        self.response = _response(502, text='<html>Bad Gateway</html>')
+        self.assertAborts(502)
+        self.response.json.assert_not_called()
+
+    def test_non_json_success_body(self):
+        self.response = _response(200, text='<html>maintenance</html>')
+        self.assertAborts(502)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,177 @@
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def top_k(scores, k):
+    """Row-wise top-k of a ``(q, n)`` score matrix, best first."""
+    k = min(k, scores.shape[1])
+    if k == 1:
+        idx = np.argmax(scores, axis=1)[:, None]
+    elif k == scores.shape[1]:
+        idx = np.argsort(-scores, axis=1)
+    else:
+        idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        order = np.argsort(-np.take_along_axis(scores, idx, axis=1), axis=1)
+        idx = np.take_along_axis(idx, order, axis=1)
+    return np.take_along_axis(scores, idx, axis=1), idx
+
+
+def scores_for(matrix, queries):
+    # TemplateMatrix widens compact rows chunk by chunk; plain arrays use BLAS
+    if hasattr(matrix, 'scores'):
+        return matrix.scores(queries)
+    return queries @ matrix.T
+
+
+class ExactIndex:
+    """Brute-force inner product search over the whole gallery matrix.
+
+    Every index exposes the same interface: ``fresh()`` returns an untrained
+    copy with the same parameters, ``build(matrix)`` returns a ready index,
+    ``updated(matrix, keep, n_added)`` returns one that reflects rows
+    dropped by ``keep`` and ``n_added`` rows appended at the end, and
+    ``search(matrix, queries, k)`` returns ``(scores, rows)`` of shape
+    ``(len(queries), k)``. Indexes never hold the matrix themselves, so the
+    gallery can swap matrix and index together under one lock.
+    """
+
+    kind = "exact"
+
+    def fresh(self):
+        return ExactIndex()
+
+    def build(self, matrix):
+        return self
+
+    def updated(self, matrix, keep, n_added):
+        return self
+
+    def search(self, matrix, queries, k=1):
+        queries = np.atleast_2d(queries)
+        if matrix.shape[0] == 0:
+            return (np.empty((len(queries), 0), np.float32),
+                    np.empty((len(queries), 0), np.int64))
+        return top_k(scores_for(matrix, queries), k)
+
+
+class IVFFlatIndex:
+    """Inverted-file index with flat (uncompressed) lists.
+
+    Rows are clustered by spherical k-means into ``nlist`` lists; a query is
+    scored against the ``nprobe`` closest centroids and only the rows in
+    those lists. Galleries smaller than ``min_train`` are searched exactly
+    until enough rows exist to train.
+    """
+
+    kind = "ivf"
+
+    def __init__(self, nlist=0, nprobe=8, iters=10, sample=256, min_train=1024, seed=0):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.iters = iters
+        self.sample = sample
+        self.min_train = min_train
+        self.seed = seed
+        self.centroids = None
+        self.assign = None
+        self.order = None
+        self.offsets = None
+
+    @property
+    def trained(self):
+        return self.centroids is not None
+
+    def fresh(self):
+        return IVFFlatIndex(self.nlist, self.nprobe, self.iters, self.sample, self.min_train, self.seed)
+
+    def build(self, matrix):
+        n = matrix.shape[0]
+        if n < max(self.min_train, 1):
+            self.centroids = None
+            return self
+        nlist = self.nlist or max(1, int(np.sqrt(n)))
+        nlist = min(nlist, n)
+        rng = np.random.default_rng(self.seed)
+        train = matrix
+        if n > nlist * self.sample:
+            train = matrix[rng.choice(n, nlist * self.sample, replace=False)]
+        self.centroids = _spherical_kmeans(train, nlist, self.iters, rng)
+        self._set_assign(_nearest(matrix, self.centroids))
+        logger.info(f"IVF index trained: {n} rows, {nlist} lists")
+        return self
+
+    def updated(self, matrix, keep, n_added):
+        if not self.trained:
+            return self.fresh().build(matrix)
+        other = self.fresh()
+        other.centroids = self.centroids
+        assign = self.assign if keep is None else self.assign[keep]
+        if n_added:
+            assign = np.concatenate([assign, _nearest(matrix[-n_added:], self.centroids)])
+        other._set_assign(assign)
+        return other
+
+    def _set_assign(self, assign):
+        self.assign = assign
+        self.order = np.argsort(assign, kind="stable")
+        counts = np.bincount(assign, minlength=len(self.centroids))
+        self.offsets = np.concatenate([[0], np.cumsum(counts)])
+
+    def search(self, matrix, queries, k=1):
+        if not self.trained:
+            return ExactIndex().search(matrix, queries, k)
+        queries = np.atleast_2d(queries)
+        nprobe = min(self.nprobe, len(self.centroids))
+        _, probes = top_k(queries @ self.centroids.T, nprobe)
+        all_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        all_rows = np.full((len(queries), k), -1, dtype=np.int64)
+        for i, lists in enumerate(probes):
+            rows = np.concatenate([self.order[self.offsets[l]:self.offsets[l + 1]] for l in lists])
+            if rows.size == 0:
+                continue
+            scores, idx = top_k((matrix[rows] @ queries[i])[None, :], k)
+            all_scores[i, :idx.shape[1]] = scores[0]
+            all_rows[i, :idx.shape[1]] = rows[idx[0]]
+        return all_scores, all_rows
+
+
+def _nearest(matrix, centroids, chunk=65536):
+    out = np.empty(matrix.shape[0], dtype=np.int64)
+    for start in range(0, matrix.shape[0], chunk):
+        out[start:start + chunk] = np.argmax(matrix[start:start + chunk] @ centroids.T, axis=1)
+    return out
+
+
+def _spherical_kmeans(x, k, iters, rng):
+    centroids = x[rng.choice(x.shape[0], k, replace=False)].copy()
+    for _ in range(iters):
+        assign = _nearest(x, centroids)
+        order = np.argsort(assign, kind="stable")
+        counts = np.bincount(assign, minlength=k)
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        sums = np.zeros_like(centroids)
+        present = counts > 0
+        sums[present] = np.add.reduceat(x[order], starts[present], axis=0)
+        empty = counts == 0
+        if empty.any():
+            sums[empty] = x[rng.choice(x.shape[0], int(empty.sum()), replace=False)]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        centroids = (sums / norms).astype(np.float32)
+    return centroids
+
+
+INDEXES = {
+    "exact": ExactIndex,
+    "ivf": IVFFlatIndex,
+}
+
+
+def make_index(kind="exact", **params):
+    try:
+        cls = INDEXES[kind]
+    except KeyError:
+        raise ValueError(f"Unknown gallery index '{kind}', expected one of: {', '.join(INDEXES)}")
+    return cls(**params)
@@ -0,0 +1,291 @@
+import fcntl
+import glob
+import json
+import os
+import threading
+import uuid
+from datetime import datetime
+import psycopg2
+import psycopg2.extras
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Idempotency key for write-behind marks (NULL for rows inserted directly)
+MARK_ID_SQL = """
+    ALTER TABLE attendance ADD COLUMN IF NOT EXISTS mark_id UUID;
+    CREATE UNIQUE INDEX IF NOT EXISTS attendance_mark_id ON attendance (mark_id);
+"""
+
+COLUMNS = ('mark_id', 'roll', 'name', 'course', 'time', 'confidence')
+
+# The rows themselves are bad (a student deleted since the mark, a value out
+# of range): retrying the same rows cannot succeed. Anything else, such as a
+# lost connection, is retried until the database is back.
+REJECTED_ERRORS = (psycopg2.IntegrityError, psycopg2.DataError)
+
+INSERT_SQL = """
+    INSERT INTO attendance (mark_id, roll, name, course, time, confidence)
+    VALUES %s
+    ON CONFLICT (mark_id) DO NOTHING
+"""
+
+
+def insert_rows(cur, rows):
+    # One multi-row statement per flush; mark_id makes replays idempotent
+    psycopg2.extras.execute_values(
+        cur, INSERT_SQL, [tuple(r[c] for c in COLUMNS) for r in rows],
+        template="(%s::uuid, %s, %s, %s, %s, %s)", page_size=max(len(rows), 1))
+
+
+def _dump_row(row):
+    return json.dumps({**row, 'time': row['time'].isoformat()})
+
+
+def _load_row(line):
+    try:
+        row = json.loads(line)
+        row['time'] = datetime.fromisoformat(row['time'])
+        return row
+    except (ValueError, KeyError, TypeError):
+        return None  # torn last line after a crash
+
+
+def _still_linked(f, path):
+    # The open file is still the one at ``path`` (not removed or replaced)
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return False
+    opened = os.fstat(f.fileno())
+    return (st.st_dev, st.st_ino) == (opened.st_dev, opened.st_ino)
+
+
+class AttendanceWriter(threading.Thread):
+    """Write-behind buffer for attendance marks.
+
+    ``submit`` assigns the mark its server time and a ``mark_id`` and
+    returns at once; a background thread inserts buffered marks with one
+    multi-row statement every ``flush_ms`` or as soon as ``flush_rows`` are
+    waiting. With ``spool_dir`` every mark is also appended to this
+    process's JSONL spool (``attendance-<pid>.jsonl``, held under an
+    exclusive lock) before it is acknowledged, and the spool is cut back to
+    the unflushed marks after every flush. On start, spools left behind by
+    dead processes (their lock is free) are adopted and replayed, so a crash
+    loses nothing. Replays are harmless: ``mark_id`` is unique and
+    duplicates are skipped.
+
+    When the database rejects a batch, its rows are inserted one at a time;
+    a row rejected ``max_attempts`` times is appended to ``dead_letter_path``
+    (or only logged without one) and dropped from the buffer.
+    """
+
+    def __init__(self, connect, flush_rows=200, flush_ms=500, spool_dir=None, fsync=False,
+                 retry_delay=2.0, insert=insert_rows, max_attempts=5, dead_letter_path=None):
+        super().__init__(name="attendance-writer", daemon=True)
+        self.connect = connect
+        self.flush_rows = flush_rows
+        self.flush_ms = flush_ms
+        self.spool_path = os.path.join(spool_dir, f"attendance-{os.getpid()}.jsonl") if spool_dir else None
+        self.fsync = fsync
+        self.retry_delay = retry_delay
+        self.insert = insert
+        self.max_attempts = max_attempts
+        self.dead_letter_path = dead_letter_path
+        self._cond = threading.Condition()
+        self._pending = []
+        self._flushed_seq = 0
+        self._submitted_seq = 0
+        self._spool = None
+        self._conn = None
+        self._cur = None
+        self._stop_event = threading.Event()
+        self.flushes = 0
+        self.rows_written = 0
+        self.failures = 0
+        self.dead_lettered = 0
+        if spool_dir:
+            os.makedirs(spool_dir, exist_ok=True)
+            self._open_spool()
+            self._adopt_spools(spool_dir)
+
+    def _open_spool(self):
+        # A restarted process can get the pid of an earlier one: keep its marks
+        self._spool = open(self.spool_path, "a+", encoding="utf-8")
+        fcntl.flock(self._spool.fileno(), fcntl.LOCK_EX)
+        self._spool.seek(0)
+        self._pending.extend(r for r in map(_load_row, self._spool) if r is not None)
+
+    def _adopt_spools(self, spool_dir):
+        for path in glob.glob(os.path.join(spool_dir, "attendance-*.jsonl")):
+            if path == self.spool_path:
+                continue
+            try:
+                f = open(path, encoding="utf-8")
+            except FileNotFoundError:
+                continue  # adopted and removed by another worker since the glob
+            with f:
+                try:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    continue  # a live process owns it
+                if not _still_linked(f, path):
+                    continue  # another worker replayed and removed it before we locked
+                rows = [_load_row(line) for line in f]
+                rows = [r for r in rows if r is not None]
+                for row in rows:
+                    self._spool_row(row)
+                self._fsync_spool()
+                os.remove(path)
+            self._pending.extend(rows)
+            if rows:
+                logger.info(f"Replaying {len(rows)} spooled attendance marks from {path}")
+        self._submitted_seq = len(self._pending)
+
+    def _spool_row(self, row):
+        self._spool.write(_dump_row(row) + "\n")
+
+    def _fsync_spool(self):
+        self._spool.flush()
+        if self.fsync:
+            os.fsync(self._spool.fileno())
+
+    def submit(self, student, score):
+        row = {
+            'mark_id': str(uuid.uuid4()),
+            'roll': student['roll'],
+            'name': student['name'],
+            'course': student.get('course'),
+            'time': datetime.now(),
+            'confidence': float(score),
+        }
+        with self._cond:
+            if self._spool is not None:
+                self._spool_row(row)
+                self._fsync_spool()
+            self._pending.append(row)
+            self._submitted_seq += 1
+            if len(self._pending) >= self.flush_rows:
+                self._cond.notify_all()
+        return {'id': None, 'mark_id': row['mark_id'], 'time': row['time']}
+
+    def flush(self, timeout=10.0):
+        """Wait until everything submitted so far is in the database."""
+        with self._cond:
+            target = self._submitted_seq
+            self._cond.notify_all()
+            return self._cond.wait_for(lambda: self._flushed_seq >= target, timeout)
+
+    def stop(self, timeout=10.0):
+        self.flush(timeout)
+        self._stop_event.set()
+        with self._cond:
+            self._cond.notify_all()
+
+    def _write(self, rows):
+        if self._conn is None or self._conn.closed:
+            self._conn, self._cur = self.connect()
+        try:
+            self.insert(self._cur, rows)
+        except Exception:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
+            raise
+
+    def _write_each(self, batch):
+        # One rejected row fails the whole multi-row insert: find it, and
+        # give up on it after max_attempts instead of retrying forever
+        written, retry, dead = [], [], []
+        for row in batch:
+            try:
+                self._write([row])
+                written.append(row)
+            except REJECTED_ERRORS as e:
+                row['attempts'] = row.get('attempts', 0) + 1
+                row['error'] = str(e).strip()
+                (dead if row['attempts'] >= self.max_attempts else retry).append(row)
+            except Exception:
+                retry.append(row)
+        if dead:
+            self._dead_letter(dead)
+        return written, retry
+
+    def _dead_letter(self, rows):
+        self.dead_lettered += len(rows)
+        logger.error(f"Giving up on {len(rows)} attendance marks after {self.max_attempts} attempts: "
+                     f"{[r['mark_id'] for r in rows]}, last error: {rows[-1]['error']}")
+        if not self.dead_letter_path:
+            return
+        with open(self.dead_letter_path, "a", encoding="utf-8") as f:
+            for row in rows:
+                f.write(_dump_row(row) + "\n")
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+
+    def _truncate_spool(self):
+        # Called with the lock held once a batch is committed: keep only
+        # marks that are not in the database yet (rewritten in place, so
+        # the file keeps its lock)
+        if self._spool is None:
+            return
+        self._spool.seek(0)
+        self._spool.truncate()
+        for row in self._pending:
+            self._spool_row(row)
+        self._fsync_spool()
+
+    def run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: len(self._pending) >= self.flush_rows
+                                    or self._stop_event.is_set(), self.flush_ms / 1000)
+                if not self._pending:
+                    if self._stop_event.is_set():
+                        return
+                    continue
+                batch, self._pending = self._pending, []
+                batch_seq = self._submitted_seq
+
+            retry = []
+            try:
+                self._write(batch)
+                written = batch
+            except REJECTED_ERRORS as e:
+                self.failures += 1
+                logger.error(f"Attendance flush of {len(batch)} rows rejected, inserting them one by one: {e}")
+                written, retry = self._write_each(batch)
+            except Exception as e:
+                self.failures += 1
+                logger.error(f"Attendance flush of {len(batch)} rows failed, retrying: {e}")
+                with self._cond:
+                    self._pending = batch + self._pending
+                self._stop_event.wait(self.retry_delay)
+                continue
+
+            with self._cond:
+                self.flushes += 1
+                self.rows_written += len(written)
+                if retry:
+                    self._pending = retry + self._pending
+                else:
+                    self._flushed_seq = batch_seq
+                # Dead-lettered rows leave the spool along with the written ones
+                self._truncate_spool()
+                self._cond.notify_all()
+            if retry:
+                self._stop_event.wait(self.retry_delay)
+
+    def metrics(self):
+        with self._cond:
+            return {
+                'pending': len(self._pending),
+                'flushes': self.flushes,
+                'rows_written': self.rows_written,
+                'failures': self.failures,
+                'dead_lettered': self.dead_lettered,
+                'spool': self.spool_path,
+            }
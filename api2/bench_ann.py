@@ -0,0 +1,89 @@
+"""Recall@1 and build time of gallery indexes against exact search.
+
+Runs on a synthetic gallery (one identity vector per student, three noisy
+pose templates each) so it needs neither the database nor the face models:
+
+    python bench_ann.py --students 100000 --nlist 0 316 1000 --nprobe 4 8 16
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+from tabulate import tabulate
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from ann import ExactIndex, IVFFlatIndex
+from gallery import normalize_rows
+
+
+def synthetic_gallery(students, templates=3, dim=512, noise=0.35, seed=0):
+    rng = np.random.default_rng(seed)
+    identities = normalize_rows(rng.standard_normal((students, dim), dtype=np.float32))
+    poses = identities[:, None, :] + noise * rng.standard_normal((students, templates, dim), dtype=np.float32) / np.sqrt(dim)
+    return identities, normalize_rows(poses.reshape(-1, dim))
+
+
+def probes_for(identities, n, noise=0.45, seed=1):
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(len(identities), n, replace=len(identities) < n)
+    dim = identities.shape[1]
+    return normalize_rows(identities[picks] + noise * rng.standard_normal((n, dim), dtype=np.float32) / np.sqrt(dim))
+
+
+def timed_search(index, matrix, queries):
+    # One probe at a time, as identify_student_web issues them
+    rows = np.empty(len(queries), dtype=np.int64)
+    start = time.perf_counter()
+    for i, q in enumerate(queries):
+        rows[i] = index.search(matrix, q, 1)[1][0, 0]
+    return rows, (time.perf_counter() - start) / len(queries)
+
+
+def run(args):
+    identities, matrix = synthetic_gallery(args.students, seed=args.seed)
+    queries = probes_for(identities, args.queries, seed=args.seed + 1)
+
+    exact = ExactIndex()
+    truth, exact_latency = timed_search(exact, matrix, queries)
+    results = [{
+        "index": "exact", "nlist": None, "nprobe": None, "templates": matrix.shape[0],
+        "build_s": 0.0, "query_ms": exact_latency * 1e3, "recall_at_1": 1.0,
+    }]
+
+    for nlist in args.nlist:
+        start = time.perf_counter()
+        base = IVFFlatIndex(nlist=nlist, min_train=1, seed=args.seed).build(matrix)
+        build_s = time.perf_counter() - start
+        for nprobe in args.nprobe:
+            base.nprobe = nprobe
+            rows, latency = timed_search(base, matrix, queries)
+            results.append({
+                "index": "ivf", "nlist": len(base.centroids), "nprobe": nprobe,
+                "templates": matrix.shape[0], "build_s": build_s,
+                "query_ms": latency * 1e3, "recall_at_1": float(np.mean(rows == truth)),
+            })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--students", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--nlist", type=int, nargs="+", default=[0], help="0 = sqrt(templates)")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    results = run(args)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(tabulate(results, headers="keys", floatfmt=".4f"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Per-face latency and embedding parity of the facenet inference backends.
+
+Runs every backend in ``inference_backends.BACKENDS`` on the same random
+crops and reports latency per batch size and the largest deviation from
+eager PyTorch:
+
+    python bench_backends.py --batch-sizes 1 8 16 --threads 4
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+from tabulate import tabulate
+from facenet_pytorch import InceptionResnetV1
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from inference_backends import BACKENDS, INPUT_SHAPE, make_backend
+
+
+def run(args):
+    model = InceptionResnetV1(pretrained="vggface2" if args.pretrained else None).eval()
+    rng = np.random.default_rng(args.seed)
+    batches = {n: rng.random((n, *INPUT_SHAPE), dtype=np.float32) for n in args.batch_sizes}
+
+    results = []
+    reference = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in args.backends:
+            start = time.perf_counter()
+            backend = make_backend(name, model, artifact_dir=tmp,
+                                   intra_op_threads=args.threads, inter_op_threads=args.interop_threads)
+            build = time.perf_counter() - start
+            for n, batch in batches.items():
+                embs = backend(batch)  # warm-up
+                start = time.perf_counter()
+                for _ in range(args.repeats):
+                    backend(batch)
+                elapsed = (time.perf_counter() - start) / args.repeats
+                ref = reference.setdefault(n, embs)
+                results.append({
+                    "backend": name,
+                    "batch": n,
+                    "build_s": build,
+                    "ms_per_batch": elapsed * 1000,
+                    "ms_per_face": elapsed * 1000 / n,
+                    "max_abs_diff": float(np.abs(embs - ref).max()),
+                })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 8, 16])
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--threads", type=int, default=None, help="intra-op threads")
+    parser.add_argument("--interop-threads", type=int, default=None)
+    parser.add_argument("--pretrained", action="store_true", help="use the vggface2 weights")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    results = run(args)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(tabulate(results, headers="keys", floatfmt=".4f"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+"""Per-stage latency, throughput and peak memory of the face pipeline.
+
+Runs offline: facenet is randomly initialized (the MTCNN weights ship with
+facenet_pytorch), photos are drawn synthetic faces and galleries are
+synthetic templates, so it needs neither the network nor the database.
+Save a baseline and compare a change against it:
+
+    python bench_pipeline.py --output before.json
+    python bench_pipeline.py --compare before.json --gallery-sizes 1000 1000000
+"""
+import os
+
+# Every photo is new, so the embedding cache would only add lookups; the
+# gallery listener would try to reach Postgres
+os.environ.setdefault("EMBEDDING_CACHE_SIZE", "0")
+os.environ.setdefault("GALLERY_LISTEN", "false")
+
+import argparse
+import base64
+import json
+import platform
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+import cv2
+import numpy as np
+import torch
+from tabulate import tabulate
+from facenet_pytorch import InceptionResnetV1
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import logic
+import template_storage
+from bench_ann import synthetic_gallery, probes_for
+from gallery import Gallery
+from inference_backends import BACKENDS, INPUT_SHAPE, make_backend
+from model_registry import ModelRegistry
+
+
+def synthetic_photo(rng, size=480):
+    """JPEG of a drawn face (skin ellipse, eyes, nose, mouth) on a blurred noise background."""
+    img = cv2.GaussianBlur(rng.integers(30, 220, (size, size, 3), dtype=np.uint8), (0, 0), 6)
+    w = int(size * rng.uniform(0.16, 0.22))
+    h = int(w * 1.3)
+    cx, cy = (int(size / 2 + rng.integers(-size // 10, size // 10)) for _ in range(2))
+    skin = tuple(int(c) for c in rng.integers((80, 110, 150), (140, 170, 230)))
+    cv2.ellipse(img, (cx, cy), (w, h), 0, 0, 360, skin, -1)
+    for side in (-1, 1):
+        eye = (cx + side * w // 2, cy - h // 5)
+        cv2.ellipse(img, eye, (w // 5, w // 10), 0, 0, 360, (235, 235, 235), -1)
+        cv2.circle(img, eye, w // 14, (40, 30, 20), -1)
+        cv2.line(img, (eye[0] - w // 5, eye[1] - w // 5), (eye[0] + w // 5, eye[1] - w // 4), (40, 40, 60), 3)
+    cv2.line(img, (cx, cy - h // 8), (cx - w // 10, cy + h // 6), (60, 80, 120), 2)
+    cv2.ellipse(img, (cx, cy + h // 2), (w // 3, w // 9), 0, 0, 180, (70, 60, 160), -1)
+    ok, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, 90])
+    return "data:image/jpeg;base64," + base64.b64encode(buf.tobytes()).decode()
+
+
+def synthetic_rows(students, template_format, seed=0):
+    """``students`` rows as psycopg2 returns them, with three templates each."""
+    rng = np.random.default_rng(seed)
+    return [student_row(i, rng.standard_normal((3, 512), dtype=np.float32), template_format)
+            for i in range(students)]
+
+
+def student_row(i, embs, template_format):
+    row = {'roll': f"R{i:07d}", 'name': f"Student {i}", 'course': f"C{i % 20}",
+           'face_embeddings': None}
+    for pose, emb in zip(("left", "center", "right"), embs):
+        if template_format == "bytea":
+            row[f"tpl_{pose}"] = memoryview(emb.astype(template_storage.TEMPLATE_DTYPE).tobytes())
+            row[f"emb_{pose}"] = None
+        else:
+            row[f"tpl_{pose}"] = None
+            row[f"emb_{pose}"] = emb.astype(np.float64).tolist()
+    return row
+
+
+class RowsCursor:
+    # Stands in for a RealDictCursor whose query already ran
+    def __init__(self, rows):
+        self.rows = rows
+
+    def execute(self, query, params=None):
+        pass
+
+    def fetchall(self):
+        return self.rows
+
+
+def max_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 2**20 if sys.platform == "darwin" else rss / 2**10
+
+
+def traced_peak_mb(fn):
+    # Python and numpy allocations of one call; torch's own allocator is not traced
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1] / 2**20
+    finally:
+        tracemalloc.stop()
+
+
+def summarize(name, size, samples, traced_mb, **extra):
+    ms = np.asarray(samples) * 1000
+    return {
+        "stage": name,
+        "size": size,
+        "n": len(ms),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p90_ms": float(np.percentile(ms, 90)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "mean_ms": float(ms.mean()),
+        "per_s": float(1000 / ms.mean()),
+        "traced_peak_mb": traced_mb,
+        "max_rss_mb": max_rss_mb(),
+        **extra,
+    }
+
+
+def timed(fn, inputs):
+    samples = []
+    for x in inputs:
+        start = time.perf_counter()
+        fn(x)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def bench_stages(args, rng):
+    photos = [synthetic_photo(rng) for _ in range(args.images)]
+    frames = [logic.decode_image(p) for p in photos]
+    logic.models.warmup()
+
+    results = []
+    samples = timed(logic.decode_image, photos)
+    results.append(summarize("decode_image", 1, samples, traced_peak_mb(lambda: logic.decode_image(photos[0]))))
+
+    crops = []
+    samples = timed(lambda f: crops.append(logic.detect_face(f)), frames)
+    found = sum(c is not None for c in crops)
+    results.append(summarize("detect_face", 1, samples, traced_peak_mb(lambda: logic.detect_face(frames[0])),
+                             faces_found=found))
+
+    # Detected crops where MTCNN accepted the drawing, centre crops elsewhere
+    side = frames[0].shape[0]
+    crops = [c if c is not None else f[side // 4:3 * side // 4, side // 4:3 * side // 4] for c, f in zip(crops, frames)]
+    samples = timed(logic.get_embedding, crops)
+    results.append(summarize("get_embedding", 1, samples, traced_peak_mb(lambda: logic.get_embedding(crops[0]))))
+
+    samples = timed(logic.process_web_image, photos)
+    results.append(summarize("process_web_image", 1, samples,
+                             traced_peak_mb(lambda: logic.process_web_image(photos[0])), faces_found=found))
+
+    for template_format in ("array", "bytea"):
+        cur = RowsCursor(synthetic_rows(args.load_students, template_format, args.seed))
+        samples = timed(lambda _: logic.load_students(cur), range(args.repeats))
+        results.append(summarize(f"load_students[{template_format}]", args.load_students, samples,
+                                 traced_peak_mb(lambda: logic.load_students(cur))))
+    return results
+
+
+def loop_match(cur, emb):
+    """The identify path before the gallery: ``load_students`` on every
+    probe, then ``cosine_sim`` against each template in Python."""
+    best_score, best_student = -1, None
+    for s, embs in logic.load_students(cur):
+        for db_emb in embs:
+            score = logic.cosine_sim(emb, db_emb)
+            if score > best_score:
+                best_score, best_student = score, s
+    return best_score, best_student
+
+
+def bench_loop(size, matrix, queries, args):
+    cur = RowsCursor([student_row(i, matrix[3 * i:3 * i + 3], "array") for i in range(len(matrix) // 3)])
+    queries = queries[:args.loop_queries]
+    samples = timed(lambda q: loop_match(cur, q), queries)
+    return summarize("best_match[loop]", size, samples, traced_peak_mb(lambda: loop_match(cur, queries[0])))
+
+
+def bench_matching(args):
+    results = []
+    for size in args.gallery_sizes:
+        students = max(1, size // 3)
+        identities, matrix = synthetic_gallery(students, seed=args.seed)
+        queries = probes_for(identities, args.queries, seed=args.seed + 1)
+        if args.loop_queries and size <= args.loop_max_size:
+            results.append(bench_loop(len(matrix), matrix, queries, args))
+        # Consecutive rows are one student's three pose templates
+        rows = [({'roll': f"R{i}", 'name': None, 'course': None}, matrix[3 * i:3 * i + 3]) for i in range(students)]
+        del matrix
+
+        gallery = Gallery(index=logic._gallery_index(), precision=args.precision, prefilter_k=args.prefilter_k)
+        start = time.perf_counter()
+        gallery.build(rows)
+        build_s = time.perf_counter() - start
+        del rows
+
+        samples = timed(gallery.best_match, queries)
+        results.append(summarize("best_match", gallery.size, samples,
+                                 traced_peak_mb(lambda: gallery.best_match(queries[0])),
+                                 build_s=build_s,
+                                 gallery_mb=gallery.matrix.nbytes / 2**20))
+        del gallery, identities
+    return results
+
+
+def bench_throughput(args, model, rng):
+    results = []
+    batches = {n: rng.random((n, *INPUT_SHAPE), dtype=np.float32) for n in args.batch_sizes}
+    with tempfile.TemporaryDirectory() as tmp:
+        for threads in args.threads:
+            backend = make_backend(args.backend, model, artifact_dir=tmp, intra_op_threads=threads)
+            for n, batch in batches.items():
+                backend(batch)  # warm-up
+                start = time.perf_counter()
+                for _ in range(args.repeats):
+                    backend(batch)
+                elapsed = (time.perf_counter() - start) / args.repeats
+                results.append({
+                    "backend": args.backend,
+                    "threads": threads,
+                    "batch": n,
+                    "ms_per_batch": elapsed * 1000,
+                    "faces_per_s": n / elapsed,
+                    "max_rss_mb": max_rss_mb(),
+                })
+    return results
+
+
+def run(args):
+    rng = np.random.default_rng(args.seed)
+    torch.manual_seed(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        logic.models = ModelRegistry("cpu", warmup=False, backend=args.backend, artifact_dir=tmp,
+                                     intra_op_threads=args.stage_threads, pretrained=None,
+                                     mtcnn_kwargs=logic.detection_profile.mtcnn_kwargs())
+        stages = bench_stages(args, rng)
+    matching = bench_matching(args)
+    throughput = bench_throughput(args, InceptionResnetV1(pretrained=None).eval(), rng)
+    return {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "args": vars(args),
+        },
+        "stages": stages + matching,
+        "throughput": throughput,
+    }
+
+
+def compare(results, baseline):
+    """p50/p99 and throughput of this run relative to ``baseline`` (ratio > 1 is slower)."""
+    before = {(r["stage"], r["size"]): r for r in baseline["stages"]}
+    rows = []
+    for r in results["stages"]:
+        b = before.get((r["stage"], r["size"]))
+        if b:
+            rows.append({"stage": r["stage"], "size": r["size"],
+                         "p50_ms": r["p50_ms"], "p50_ratio": r["p50_ms"] / b["p50_ms"],
+                         "p99_ms": r["p99_ms"], "p99_ratio": r["p99_ms"] / b["p99_ms"]})
+    before = {(r["backend"], r["threads"], r["batch"]): r for r in baseline["throughput"]}
+    for r in results["throughput"]:
+        b = before.get((r["backend"], r["threads"], r["batch"]))
+        if b:
+            rows.append({"stage": f"facenet[{r['backend']}, {r['threads']} threads]", "size": r["batch"],
+                         "p50_ms": r["ms_per_batch"], "p50_ratio": r["ms_per_batch"] / b["ms_per_batch"]})
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--images", type=int, default=50, help="synthetic photos per image stage")
+    parser.add_argument("--load-students", type=int, default=5000, help="rows parsed by load_students")
+    parser.add_argument("--gallery-sizes", nargs="+", type=int, default=[1000, 10000, 100000],
+                        help="templates per synthetic gallery (1000000 needs about 6 GB)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--loop-queries", type=int, default=5,
+                        help="probes for the load_students + cosine_sim loop (0 skips it)")
+    parser.add_argument("--loop-max-size", type=int, default=10000,
+                        help="largest gallery the loop is timed on (its rows are Python lists)")
+    parser.add_argument("--precision", default=logic.GALLERY_PRECISION)
+    parser.add_argument("--prefilter-k", type=int, default=logic.MATCH_PREFILTER_K)
+    parser.add_argument("--backend", default="eager", choices=BACKENDS)
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 4, 16, 32])
+    parser.add_argument("--threads", nargs="+", type=int, default=[1, 2, 4], help="intra-op threads to sweep")
+    parser.add_argument("--stage-threads", type=int, default=None, help="intra-op threads for the stage timings")
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    parser.add_argument("--output", help="also write the JSON results to this file")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare against")
+    args = parser.parse_args()
+
+    results = run(args)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(tabulate(results["stages"], headers="keys", floatfmt=".3f"))
+        print()
+        print(tabulate(results["throughput"], headers="keys", floatfmt=".3f"))
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print()
+        print(tabulate(compare(results, baseline), headers="keys", floatfmt=".3f"))
+
+
+if __name__ == "__main__":
+    main()
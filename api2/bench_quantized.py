@@ -0,0 +1,167 @@
+"""Latency, memory and embedding agreement of int8 facenet against fp32.
+
+Detects faces in a directory of photos, calibrates the int8 model on part of
+them and compares the rest (held out) against fp32 eager embeddings:
+
+    python bench_quantized.py photos/ --calibration-size 200 --save-calibration artifacts/calibration.npy
+
+Each variant runs in a fresh process: ``startup_rss_mb`` is its peak RSS
+before the model is loaded (interpreter, libraries and the held-out crops),
+``loaded_rss_mb`` after the model or session is ready and ``peak_rss_mb``
+after embedding every crop and the latency runs. ``artifact_mb`` is the size
+of the serialized model (parameter bytes for eager).
+
+``--save-calibration`` writes the calibration crops where the api picks them
+up (``FACENET_CALIBRATION``) when ``FACENET_BACKEND=onnx-int8`` builds its
+quantized model.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+import cv2
+import numpy as np
+from tabulate import tabulate
+from facenet_pytorch import MTCNN, InceptionResnetV1
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from inference_backends import EagerBackend, OnnxRuntimeBackend, export_onnx, load_calibration, quantize_onnx
+from logic import crop_face, preprocess_face
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+
+def load_crops(photos):
+    mtcnn = MTCNN(keep_all=False, device="cpu")
+    crops = []
+    for name in sorted(os.listdir(photos)):
+        if not name.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        frame = cv2.imread(os.path.join(photos, name))
+        if frame is None:
+            continue
+        box, _ = mtcnn.detect(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+        face = crop_face(frame, box)
+        if face is not None:
+            crops.append(preprocess_face(face))
+    return np.stack(crops)
+
+
+def normalized(embs):
+    return embs / np.linalg.norm(embs, axis=1, keepdims=True)
+
+
+def embed(backend, crops, batch_size):
+    return np.concatenate([backend(crops[i:i + batch_size]) for i in range(0, len(crops), batch_size)])
+
+
+def latency_ms(backend, crops, batch_size, repeats):
+    batch = crops[:batch_size]
+    backend(batch)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        backend(batch)
+    return (time.perf_counter() - start) * 1000 / repeats / len(batch)
+
+
+def peak_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 2**20 if sys.platform == "darwin" else rss / 2**10
+
+
+def measure(label, path, crops_path, batch_size, repeats, threads):
+    """Runs in a fresh process per variant, so its peak RSS is the variant's own."""
+    crops = np.load(crops_path)
+    startup = peak_rss_mb()
+    if path is None:
+        backend = EagerBackend(InceptionResnetV1(pretrained="vggface2").eval(), intra_op_threads=threads)
+    else:
+        backend = OnnxRuntimeBackend(None, path, threads)
+    loaded = peak_rss_mb()
+    embs = embed(backend, crops, batch_size)
+    ms = latency_ms(backend, crops, batch_size, repeats)
+    return embs, {"ms_per_face": ms, "startup_rss_mb": startup, "loaded_rss_mb": loaded, "peak_rss_mb": peak_rss_mb()}
+
+
+def run(args):
+    crops = load_crops(args.photos)
+    rng = np.random.default_rng(args.seed)
+    crops = crops[rng.permutation(len(crops))]
+    calibration, held_out = crops[:args.calibration_size], crops[args.calibration_size:]
+    if len(held_out) < 2:
+        raise SystemExit(f"Only {len(crops)} faces found; need more than --calibration-size {args.calibration_size}")
+    if args.save_calibration:
+        np.save(args.save_calibration, calibration)
+
+    model = InceptionResnetV1(pretrained="vggface2").eval()
+    fp32_params = sum(p.numel() * p.element_size() for p in model.parameters())
+    ctx = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as tmp:
+        fp32_path = os.path.join(tmp, "facenet.onnx")
+        crops_path = os.path.join(tmp, "held_out.npy")
+        calibration_path = os.path.join(tmp, "calibration.npy")
+        np.save(crops_path, held_out)
+        np.save(calibration_path, calibration)
+        export_onnx(model, fp32_path)
+
+        # (label, artifact the variant runs, artifact size)
+        variants = [("eager fp32", None, fp32_params), ("onnx fp32", fp32_path, os.path.getsize(fp32_path))]
+        for label, calib in (("onnx int8 static", load_calibration(calibration_path)), ("onnx int8 dynamic", None)):
+            path = os.path.join(tmp, label.replace(" ", "_") + ".onnx")
+            quantize_onnx(fp32_path, path, calib)
+            variants.append((label, path, os.path.getsize(path)))
+        del model
+
+        reference = None
+        results = []
+        for label, path, size in variants:
+            with ctx.Pool(1) as pool:
+                embs, stats = pool.apply(measure, (label, path, crops_path, args.batch_size, args.repeats, args.threads))
+            embs = normalized(embs)
+            scores = embs @ embs.T
+            if reference is None:
+                reference = (embs, scores)
+            ref_embs, ref_scores = reference
+            agreement = np.sum(embs * ref_embs, axis=1)
+            pairs = np.triu_indices(len(embs), k=1)
+            drift = np.abs(scores - ref_scores)[pairs]
+            results.append({
+                "model": label,
+                **stats,
+                "artifact_mb": size / 2**20,
+                "mean_cosine": float(agreement.mean()),
+                "min_cosine": float(agreement.min()),
+                "max_score_drift": float(drift.max()),
+                "decision_flips": int(np.sum((scores[pairs] > args.threshold) != (ref_scores[pairs] > args.threshold))),
+            })
+    return {"calibration_faces": len(calibration), "held_out_faces": len(held_out), "results": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("photos", help="directory of photos with one face each")
+    parser.add_argument("--calibration-size", type=int, default=100)
+    parser.add_argument("--save-calibration", help="write the calibration crops to this .npy file")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--threads", type=int, default=None, help="intra-op threads")
+    parser.add_argument("--threshold", type=float, default=0.65, help="logic.MATCH_THRESHOLD")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    report = run(args)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{report['calibration_faces']} calibration faces, {report['held_out_faces']} held out")
+        print(tabulate(report["results"], headers="keys", floatfmt=".5f"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Memory, throughput and score drift of compact gallery templates.
+
+Compares int16 and int8 template storage against float32 on a synthetic
+gallery, including how many match decisions flip at the match threshold.
+``vs_float32`` is each precision's probe throughput relative to float32;
+``--min-relative-speed`` exits non-zero when a compact precision falls below
+it, for a CI or pre-release check:
+
+    python bench_templates.py --students 50000 --threshold 0.65 --min-relative-speed 0.5
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+from tabulate import tabulate
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from ann import ExactIndex
+from bench_ann import synthetic_gallery, probes_for
+from template_matrix import TemplateMatrix, PRECISIONS
+
+
+def disk_bytes(matrix):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "gallery.npz")
+        matrix.save(path)
+        return os.path.getsize(path)
+
+
+def run(args):
+    identities, base = synthetic_gallery(args.students, seed=args.seed)
+    queries = probes_for(identities, args.queries, seed=args.seed + 1)
+    index = ExactIndex()
+
+    reference = None
+    reference_rate = None
+    results = []
+    for precision in PRECISIONS:
+        matrix = TemplateMatrix.encode(base, precision)
+
+        start = time.perf_counter()
+        top_scores = np.empty(len(queries), dtype=np.float32)
+        top_rows = np.empty(len(queries), dtype=np.int64)
+        for i, q in enumerate(queries):
+            s, r = index.search(matrix, q, 1)
+            top_scores[i], top_rows[i] = s[0, 0], r[0, 0]
+        elapsed = time.perf_counter() - start
+
+        rate = len(queries) / elapsed
+        all_scores = matrix.scores(queries)
+        if reference is None:
+            reference = (all_scores, top_scores, top_rows)
+            reference_rate = rate
+        ref_all, ref_top, ref_rows = reference
+        drift = np.abs(all_scores - ref_all)
+        results.append({
+            "precision": precision,
+            "templates": len(matrix),
+            "memory_mb": matrix.nbytes / 2**20,
+            "disk_mb": disk_bytes(matrix) / 2**20,
+            "probes_per_s": rate,
+            "vs_float32": rate / reference_rate,
+            "max_drift": float(drift.max()),
+            "mean_drift": float(drift.mean()),
+            "top1_agreement": float(np.mean(top_rows == ref_rows)),
+            "decision_flips": int(np.sum((top_scores > args.threshold) != (ref_top > args.threshold))),
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--students", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--threshold", type=float, default=0.65, help="logic.MATCH_THRESHOLD")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    parser.add_argument("--min-relative-speed", type=float, default=None,
+                        help="fail if a compact precision scores slower than this fraction of float32")
+    args = parser.parse_args()
+
+    results = run(args)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(tabulate(results, headers="keys", floatfmt=".5f"))
+    if args.min_relative_speed is not None:
+        slow = [r["precision"] for r in results if r["vs_float32"] < args.min_relative_speed]
+        if slow:
+            print(f"Slower than {args.min_relative_speed:.2f}x float32: {', '.join(slow)}", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
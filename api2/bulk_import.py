@@ -0,0 +1,492 @@
+"""Bulk student enrollment from a directory or archive of face photos.
+
+    python bulk_import.py photos.zip --manifest students.csv --workers 4
+
+The manifest is a CSV file with a header row, or JSONL, with one record per
+student: ``roll``, ``name``, ``course``, ``center`` and optionally ``left``
+and ``right``, image paths relative to the source (a missing pose reuses the
+center photo, as in web registration). Without ``--manifest`` a
+``manifest.csv`` / ``manifest.jsonl`` at the root of the source is used.
+
+Detection and embedding are fanned out over a process pool. Results are
+loaded with COPY into a staging table and upserted into ``students`` with
+one statement per load batch. Every committed or failed roll is appended to
+a progress journal; re-running with the same ``--state`` file skips rolls
+that were already imported.
+"""
+import argparse
+import csv
+import fcntl
+import io
+import json
+import os
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+import multiprocessing
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import logging
+
+logger = logging.getLogger(__name__)
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+try:
+    from .template_storage import TEMPLATE_FORMAT, TEMPLATE_DTYPE
+except ImportError:
+    from template_storage import TEMPLATE_FORMAT, TEMPLATE_DTYPE
+
+BULK_IMPORT_DIR = os.getenv("BULK_IMPORT_DIR", os.path.join(tempfile.gettempdir(), "face_imports"))
+
+POSES = ('left', 'center', 'right')
+MANIFEST_NAMES = ('manifest.csv', 'manifest.jsonl')
+
+MATCH_ENGINE = os.getenv("MATCH_ENGINE", "memory")
+
+ARRAY_COLUMNS = ('emb_left', 'emb_center', 'emb_right')
+BYTEA_COLUMNS = ('tpl_left', 'tpl_center', 'tpl_right')
+
+# Template columns written for the configured TEMPLATE_FORMAT; the other
+# representation is cleared, as in logic.save_templates, so row_embeddings
+# never prefers a stale copy. The pgvector sync trigger reads the FLOAT8[]
+# columns, so bytea imports keep them filled for that engine.
+if TEMPLATE_FORMAT == 'bytea':
+    TEMPLATE_COLUMNS = BYTEA_COLUMNS + (ARRAY_COLUMNS if MATCH_ENGINE == 'pgvector' else ())
+else:
+    TEMPLATE_COLUMNS = ARRAY_COLUMNS
+CLEARED_COLUMNS = tuple(c for c in ARRAY_COLUMNS + BYTEA_COLUMNS if c not in TEMPLATE_COLUMNS)
+
+
+def _column_type(column):
+    return 'BYTEA' if column.startswith('tpl_') else 'FLOAT8[]'
+
+
+STAGING_SQL = f"""
+    CREATE TEMP TABLE IF NOT EXISTS students_import (
+        roll TEXT,
+        name TEXT,
+        course TEXT,
+        {', '.join(f'{c} {_column_type(c)}' for c in TEMPLATE_COLUMNS)}
+    );
+    TRUNCATE students_import;
+"""
+
+UPSERT_SQL = f"""
+    INSERT INTO students (roll, name, course, {', '.join(TEMPLATE_COLUMNS)})
+    SELECT DISTINCT ON (roll) roll, name, course, {', '.join(TEMPLATE_COLUMNS)}
+    FROM students_import
+    ON CONFLICT (roll) DO UPDATE SET
+    name = EXCLUDED.name,
+    course = EXCLUDED.course,
+    {', '.join([f'{c} = EXCLUDED.{c}' for c in TEMPLATE_COLUMNS] + [f'{c} = NULL' for c in CLEARED_COLUMNS])}
+"""
+
+# ===================== SOURCES =====================
+
+class ImageSource:
+    """Read-only view of a directory, zip or tar archive by relative path.
+
+    Archive members are also reachable without a single top-level folder,
+    so ``photos/001.jpg`` inside ``batch/photos/001.jpg`` resolves either way.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._zip = self._tar = None
+        self._names = {}
+        self._dir = os.path.isdir(path)
+        if self._dir:
+            return
+        if zipfile.is_zipfile(path):
+            self._zip = zipfile.ZipFile(path)
+            names = [n for n in self._zip.namelist() if not n.endswith('/')]
+        elif tarfile.is_tarfile(path):
+            self._tar = tarfile.open(path)
+            members = [m for m in self._tar.getmembers() if m.isfile()]
+            names = [m.name for m in members]
+            self._members = {m.name: m for m in members}
+        else:
+            raise ValueError(f"Unsupported source (expected directory, zip or tar): {path}")
+        for name in names:
+            self._names[name] = name
+            parts = name.split('/', 1)
+            if len(parts) == 2:
+                self._names.setdefault(parts[1], name)
+
+    def exists(self, rel):
+        if self._dir:
+            return os.path.isfile(os.path.join(self.path, rel))
+        return _norm(rel) in self._names
+
+    def read(self, rel):
+        if self._dir:
+            with open(os.path.join(self.path, rel), 'rb') as f:
+                return f.read()
+        name = self._names.get(_norm(rel))
+        if name is None:
+            raise FileNotFoundError(rel)
+        if self._zip is not None:
+            return self._zip.read(name)
+        return self._tar.extractfile(self._members[name]).read()
+
+    def close(self):
+        if self._zip is not None:
+            self._zip.close()
+        if self._tar is not None:
+            self._tar.close()
+
+
+def _norm(rel):
+    rel = rel.replace('\\', '/')
+    while rel.startswith('./'):
+        rel = rel[2:]
+    return rel.lstrip('/')
+
+
+def read_manifest(source, manifest_path=None):
+    if manifest_path:
+        with open(manifest_path, 'rb') as f:
+            data, name = f.read(), manifest_path
+    else:
+        name = next((n for n in MANIFEST_NAMES if source.exists(n)), None)
+        if name is None:
+            raise ValueError("No manifest given and none found in source")
+        data = source.read(name)
+
+    text = data.decode('utf-8-sig')
+    if name.endswith('.jsonl'):
+        records = [json.loads(line) for line in text.splitlines() if line.strip()]
+    else:
+        records = list(csv.DictReader(io.StringIO(text)))
+    return [{k.strip(): (v.strip() if isinstance(v, str) else v) for k, v in r.items() if k} for r in records]
+
+# ===================== WORKERS =====================
+
+_logic = None
+
+def _init_worker(threads):
+    global _logic
+    import torch
+    torch.set_num_threads(threads)
+    try:
+        from . import logic
+    except ImportError:
+        import logic
+    _logic = logic
+
+
+def embed_chunk(records):
+    """Runs in a pool process: ``[(record, {pose: bytes})]`` -> results.
+
+    All unique photos of the chunk are detected and embedded together, so
+    one facenet forward pass covers the whole chunk.
+    """
+    logic = _logic
+    frames, slots = [], []
+    for record, images in records:
+        seen = {}
+        for pose in POSES:
+            data = images.get(pose)
+            if data is None:
+                slots.append(None)
+                continue
+            if data not in seen:
+                try:
+                    frame = logic.decode_image_bytes(data)
+                except Exception:
+                    frame = None
+                seen[data] = len(frames)
+                frames.append(frame)
+            slots.append(seen[data])
+
+    crops = logic.detect_faces(frames)
+    found = [i for i, c in enumerate(crops) if c is not None]
+    embs = dict(zip(found, logic.get_embeddings([crops[i] for i in found])))
+
+    results = []
+    for n, (record, _) in enumerate(records):
+        poses = dict(zip(POSES, slots[3 * n:3 * n + 3]))
+        result = {'roll': record['roll'], 'name': record['name'], 'course': record['course']}
+        missing = [p for p in POSES if poses[p] is None or poses[p] not in embs]
+        if missing:
+            result['error'] = f"Face not detected in {', '.join(p.capitalize() for p in missing)} photo"
+        else:
+            for pose in POSES:
+                result[f'emb_{pose}'] = embs[poses[pose]].tolist()
+        results.append(result)
+    return results
+
+# ===================== LOADING =====================
+
+def _template_literal(values, column):
+    # COPY text for a FLOAT8[] or (hex-escaped) packed float32 bytea value
+    if _column_type(column) == 'BYTEA':
+        return '\\x' + np.asarray(values, dtype=TEMPLATE_DTYPE).tobytes().hex()
+    return '{' + ','.join(repr(float(v)) for v in values) + '}'
+
+
+def load_rows(conn, cur, rows):
+    """COPY ``rows`` into the staging table and upsert them in one transaction."""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for r in rows:
+        writer.writerow([r['roll'], r['name'], r['course']] +
+                        [_template_literal(r[f"emb_{c.split('_', 1)[1]}"], c) for c in TEMPLATE_COLUMNS])
+    buf.seek(0)
+    try:
+        cur.execute(STAGING_SQL)
+        cur.copy_expert(
+            f"COPY students_import (roll, name, course, {', '.join(TEMPLATE_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+            buf)
+        cur.execute(UPSERT_SQL)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+class ProgressJournal:
+    """Append-only JSONL record of rolls that were imported or failed."""
+
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        if path and os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # torn last line after a crash
+                    if entry.get('status') == 'ok':
+                        self.done.add(entry['roll'])
+
+    def record(self, entries):
+        if not self.path or not entries:
+            return
+        with open(self.path, 'a') as f:
+            for entry in entries:
+                f.write(json.dumps(entry) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+# ===================== IMPORT =====================
+
+def validate_record(record, source):
+    for field in ('roll', 'name', 'course', 'center'):
+        if not record.get(field):
+            return f"Missing field '{field}'"
+    for pose in POSES:
+        if record.get(pose) and not source.exists(record[pose]):
+            return f"Image not found: {record[pose]}"
+    return None
+
+
+def _read_images(record, source):
+    images, cache = {}, {}
+    for pose in POSES:
+        path = record.get(pose) or record['center']
+        if path not in cache:
+            cache[path] = source.read(path)
+        images[pose] = cache[path]
+    return images
+
+
+def run_import(source_path, manifest_path=None, workers=None, chunk_size=16,
+               load_size=500, state_path=None, connect=None, on_progress=None):
+    """Import every manifest record; returns a report with per-record failures."""
+    if connect is None:
+        try:
+            from .logic import connect_db as connect
+        except ImportError:
+            from logic import connect_db as connect
+
+    started = time.time()
+    source = ImageSource(source_path)
+    journal = ProgressJournal(state_path)
+    report = {'total': 0, 'imported': 0, 'skipped': 0, 'failed': []}
+
+    try:
+        records = read_manifest(source, manifest_path)
+        report['total'] = len(records)
+
+        todo, failed = [], []
+        for record in records:
+            if record.get('roll') in journal.done:
+                report['skipped'] += 1
+                continue
+            error = validate_record(record, source)
+            if error:
+                failed.append({'roll': record.get('roll'), 'status': 'failed', 'error': error})
+            else:
+                todo.append(record)
+        journal.record(failed)
+        report['failed'].extend(failed)
+
+        workers = workers or max(1, (os.cpu_count() or 2) - 1)
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        conn, cur = connect()
+        conn.autocommit = False
+        pending = []
+
+        def flush():
+            if not pending:
+                return
+            load_rows(conn, cur, pending)
+            journal.record([{'roll': r['roll'], 'status': 'ok'} for r in pending])
+            report['imported'] += len(pending)
+            pending.clear()
+            if on_progress:
+                on_progress(report)
+
+        ctx = multiprocessing.get_context('spawn')
+        chunks = [todo[i:i + chunk_size] for i in range(0, len(todo), chunk_size)]
+        try:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=ctx,
+                                     initializer=_init_worker, initargs=(threads,)) as pool:
+                in_flight = set()
+                for chunk in chunks + [None]:
+                    # Bound the number of chunks (and image bytes) held in memory
+                    while in_flight and (chunk is None or len(in_flight) >= 2 * workers):
+                        finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                        for future in finished:
+                            errors = []
+                            for result in future.result():
+                                if 'error' in result:
+                                    errors.append({'roll': result['roll'], 'status': 'failed', 'error': result['error']})
+                                else:
+                                    pending.append(result)
+                            journal.record(errors)
+                            report['failed'].extend(errors)
+                        if len(pending) >= load_size:
+                            flush()
+                    if chunk is not None:
+                        payload = [(r, _read_images(r, source)) for r in chunk]
+                        in_flight.add(pool.submit(embed_chunk, payload))
+            flush()
+        finally:
+            conn.close()
+    finally:
+        source.close()
+
+    report['seconds'] = round(time.time() - started, 2)
+    logger.info(f"Bulk import finished: {report['imported']} imported, "
+                f"{report['skipped']} skipped, {len(report['failed'])} failed")
+    return report
+
+
+# ===================== BACKGROUND IMPORTS =====================
+
+# Uploads handled by the admin endpoint live in BULK_IMPORT_DIR/<import_id>/
+# (source, optional manifest, progress journal and status.json), so any
+# worker can report status and an interrupted import can be resumed. A
+# running import holds an flock on import.lock, so a second start from this
+# or any other worker process is refused until it finishes or its process dies.
+
+def new_import_dir():
+    import_id = uuid.uuid4().hex
+    path = os.path.join(BULK_IMPORT_DIR, import_id)
+    os.makedirs(path)
+    return import_id, path
+
+
+def _import_path(import_id, *parts):
+    if not import_id.isalnum():
+        raise ValueError("Invalid import id")
+    return os.path.join(BULK_IMPORT_DIR, import_id, *parts)
+
+
+def _write_status(import_id, status):
+    tmp = _import_path(import_id, 'status.json.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(status, f)
+    os.replace(tmp, _import_path(import_id, 'status.json'))
+
+
+def import_status(import_id):
+    try:
+        with open(_import_path(import_id, 'status.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _lock_import(import_id):
+    """The held import.lock file, or None if another import of it is running."""
+    f = open(_import_path(import_id, 'import.lock'), 'a')
+    try:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close()
+        return None
+    return f
+
+
+def start_import(import_id, source_name, manifest_name=None, workers=None):
+    """Run (or resume) an uploaded import on a background thread.
+
+    Returns False when the import is already running in any worker process.
+    """
+    lock = _lock_import(import_id)
+    if lock is None:
+        return False
+
+    def target():
+        try:
+            report = run_import(
+                _import_path(import_id, source_name),
+                _import_path(import_id, manifest_name) if manifest_name else None,
+                workers=workers,
+                state_path=_import_path(import_id, 'progress.jsonl'),
+                on_progress=lambda r: _write_status(import_id, {
+                    'import_id': import_id, 'status': 'running', 'report': r}))
+            _write_status(import_id, {'import_id': import_id, 'status': 'completed', 'report': report})
+        except Exception as e:
+            logger.error(f"Bulk import {import_id} failed: {e}", exc_info=True)
+            _write_status(import_id, {'import_id': import_id, 'status': 'failed', 'error': str(e)})
+        finally:
+            lock.close()
+
+    try:
+        _write_status(import_id, {'import_id': import_id, 'status': 'running'})
+        threading.Thread(target=target, name=f"bulk-import-{import_id}", daemon=True).start()
+    except Exception:
+        lock.close()
+        raise
+    return True
+
+
+def uploaded_files(import_id):
+    """``(source_name, manifest_name)`` of a previous upload, for resuming."""
+    names = os.listdir(_import_path(import_id))
+    source = next((n for n in names if n.startswith('source')), None)
+    manifest = next((n for n in names if n.startswith('manifest')), None)
+    return source, manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk student enrollment from face photos")
+    parser.add_argument("source", help="directory, .zip or .tar(.gz) of photos")
+    parser.add_argument("--manifest", help="CSV or JSONL manifest (default: manifest.csv/.jsonl in source)")
+    parser.add_argument("--workers", type=int, default=None, help="inference processes (default: CPUs - 1)")
+    parser.add_argument("--chunk-size", type=int, default=16, help="students per forward pass")
+    parser.add_argument("--load-size", type=int, default=500, help="students per COPY + upsert")
+    parser.add_argument("--state", help="progress journal (default: <source>.progress.jsonl)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(levelname)s: %(message)s')
+    state = args.state or args.source.rstrip('/\\') + '.progress.jsonl'
+    report = run_import(args.source, args.manifest, args.workers, args.chunk_size,
+                        args.load_size, state,
+                        on_progress=lambda r: print(f"Imported {r['imported']}/{r['total']}", flush=True))
+    print(json.dumps(report, indent=2))
+    return 0 if not report['failed'] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
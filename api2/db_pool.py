@@ -0,0 +1,207 @@
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    """Bounded pool of database connections for request handlers.
+
+    ``connect()`` opens a new connection. Checkout hands out the most
+    recently returned connection, replaces it once it is older than
+    ``max_lifetime`` seconds and runs ``SELECT 1`` on it when it has been
+    idle for more than ``check_after`` seconds. At most ``max_size``
+    connections are open; further checkouts wait up to ``timeout`` seconds.
+    Idle connections beyond ``min_size`` are closed after ``max_idle``
+    seconds. Use ``connection()`` so a connection goes back to the pool even
+    when the handler raises; connections that broke are discarded.
+
+    The pool is per process: after a fork, inherited connections are
+    dropped without being closed, since the parent still uses the sockets.
+    """
+
+    def __init__(self, connect, min_size=1, max_size=10, max_lifetime=1800.0, max_idle=300.0,
+                 check_after=30.0, timeout=10.0):
+        self.connect = connect
+        self.min_size = min_size
+        self.max_size = max(max_size, 1)
+        self.max_lifetime = max_lifetime
+        self.max_idle = max_idle
+        self.check_after = check_after
+        self.timeout = timeout
+        self._cond = threading.Condition()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._idle = deque()  # (conn, created, returned)
+        self._created = {}  # id(conn) -> created
+        self._size = 0
+        self._in_use = 0
+        self._waiting = 0
+        self._checkout_ms = deque(maxlen=1024)
+        self.checkouts = 0
+        self.timeouts = 0
+        self.opened = 0
+        self.closed = 0
+        self.health_check_failures = 0
+
+    def _open(self):
+        conn = self.connect()
+        with self._cond:
+            self._created[id(conn)] = time.monotonic()
+            self.opened += 1
+        return conn
+
+    def _close(self, conn, release=True):
+        # release=False keeps the slot reserved for a replacement connection
+        with self._cond:
+            self._created.pop(id(conn), None)
+            self.closed += 1
+            if release:
+                self._size -= 1
+                self._cond.notify()
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _healthy(self, conn, created, returned, now):
+        if conn.closed or now - created > self.max_lifetime:
+            return False
+        if now - returned <= self.check_after:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            return True
+        except Exception as e:
+            with self._cond:
+                self.health_check_failures += 1
+            logger.warning(f"Discarding unhealthy database connection: {e}")
+            return False
+
+    def getconn(self):
+        start = time.monotonic()
+        deadline = start + self.timeout
+        with self._cond:
+            if self._pid != os.getpid():
+                self._reset()
+            self._waiting += 1
+            try:
+                while True:
+                    if self._idle:
+                        entry = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        entry = None
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or not self._cond.wait(remaining):
+                        if not self._idle and self._size >= self.max_size:
+                            self.timeouts += 1
+                            raise PoolTimeout(f"No database connection free within {self.timeout}s")
+            finally:
+                self._waiting -= 1
+            self._in_use += 1
+
+        try:
+            if entry is not None and not self._healthy(*entry, time.monotonic()):
+                self._close(entry[0], release=False)
+                entry = None
+            conn = entry[0] if entry is not None else self._open()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+        with self._cond:
+            self.checkouts += 1
+            self._checkout_ms.append(1000 * (time.monotonic() - start))
+        return conn
+
+    def putconn(self, conn, broken=False):
+        with self._cond:
+            if self._pid != os.getpid():
+                return
+            self._in_use -= 1
+            created = self._created.get(id(conn))
+        now = time.monotonic()
+        if broken or conn.closed or created is None or now - created > self.max_lifetime:
+            self._close(conn)
+            return
+        try:
+            if conn.get_transaction_status() != 0:  # not idle: undo whatever was left open
+                conn.rollback()
+        except Exception:
+            self._close(conn)
+            return
+        with self._cond:
+            self._idle.append((conn, created, now))
+            stale = []
+            while len(self._idle) > self.min_size and now - self._idle[0][2] > self.max_idle:
+                stale.append(self._idle.popleft()[0])
+            self._cond.notify()
+        for c in stale:
+            self._close(c)
+
+    def warm(self):
+        """Open connections up to ``min_size`` ahead of the first requests."""
+        with self._cond:
+            if self._pid != os.getpid():
+                self._reset()
+            missing = max(0, self.min_size - self._size)
+            self._size += missing
+        now = time.monotonic()
+        for i in range(missing):
+            try:
+                conn = self._open()
+            except Exception:
+                with self._cond:
+                    self._size -= missing - i
+                raise
+            with self._cond:
+                self._idle.append((conn, now, now))
+                self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        conn = self.getconn()
+        broken = False
+        try:
+            yield conn
+        except Exception:
+            broken = bool(conn.closed)
+            raise
+        finally:
+            self.putconn(conn, broken)
+
+    def metrics(self):
+        with self._cond:
+            samples = sorted(self._checkout_ms)
+            return {
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._in_use,
+                'waiting': self._waiting,
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'opened': self.opened,
+                'closed': self.closed,
+                'health_check_failures': self.health_check_failures,
+                'checkout_ms_p50': samples[len(samples) // 2] if samples else 0.0,
+                'checkout_ms_p99': samples[int(len(samples) * 0.99)] if samples else 0.0,
+            }
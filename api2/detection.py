@@ -0,0 +1,48 @@
+import cv2
+
+# MTCNN presets: min_face_size is in pixels of the downscaled frame,
+# factor is the image pyramid step and thresholds are the P/R/O-Net cut-offs.
+PROFILES = {
+    "fast": {"max_side": 480, "min_face_size": 40, "factor": 0.6, "thresholds": (0.6, 0.7, 0.7)},
+    "balanced": {"max_side": 800, "min_face_size": 20, "factor": 0.709, "thresholds": (0.6, 0.7, 0.7)},
+    "accurate": {"max_side": 1280, "min_face_size": 20, "factor": 0.8, "thresholds": (0.5, 0.6, 0.6)},
+}
+
+
+class DetectionProfile:
+    """MTCNN settings plus the longest side frames are shrunk to before detection.
+
+    Detection runs on the downscaled copy and boxes are mapped back with
+    ``scale_boxes``, so crops still come from the full-resolution frame and
+    detection cost stops growing with camera resolution. ``max_side=0``
+    detects on the original frame.
+    """
+
+    def __init__(self, name="balanced", max_side=None):
+        if name not in PROFILES:
+            raise ValueError(f"Unknown detection profile '{name}', expected one of: {', '.join(PROFILES)}")
+        preset = PROFILES[name]
+        self.name = name
+        self.max_side = preset["max_side"] if max_side is None else max_side
+        self.min_face_size = preset["min_face_size"]
+        self.factor = preset["factor"]
+        self.thresholds = list(preset["thresholds"])
+
+    def mtcnn_kwargs(self):
+        return {"min_face_size": self.min_face_size, "factor": self.factor, "thresholds": self.thresholds}
+
+    def downscale(self, frame):
+        """Frame to run MTCNN on and the scale it was resized by (<= 1)."""
+        h, w = frame.shape[:2]
+        longest = max(h, w)
+        if not self.max_side or longest <= self.max_side:
+            return frame, 1.0
+        scale = self.max_side / longest
+        size = (max(1, round(w * scale)), max(1, round(h * scale)))
+        return cv2.resize(frame, size, interpolation=cv2.INTER_AREA), scale
+
+    @staticmethod
+    def scale_boxes(boxes, scale):
+        if boxes is None or scale == 1.0:
+            return boxes
+        return boxes / scale
@@ -1,14 +1,32 @@
-from flask import request, jsonify
+from flask import request, jsonify, Response, stream_with_context, url_for
+import json
+import time
+import hmac
+import functools
 from flask_smorest import Blueprint
+import os
 import logging
+from werkzeug.utils import secure_filename
 try:
-    from .logic import register_student_web, connect_db, delete_last_attendance, setup_db
+    from . import bulk_import
+    from . import video
+    from . import jobs
+    from .uploads import UploadError, read_octet_stream, multipart_files
 except ImportError:
-    from logic import register_student_web, connect_db, delete_last_attendance, setup_db
+    import bulk_import
+    import video
+    import jobs
+    from uploads import UploadError, read_octet_stream, multipart_files
+try:
+    from .logic import register_student_web, image_bytes, db_cursor, db_pool, delete_last_attendance, identify_batch_web, identify_student_web, identify_group_web, start_class_web, SCOPES, scheduler, models, embedding_cache, attendance_writer, ATTENDANCE_WRITE_BEHIND, ADMIN_TOKEN
+except ImportError:
+    from logic import register_student_web, image_bytes, db_cursor, db_pool, delete_last_attendance, identify_batch_web, identify_student_web, identify_group_web, start_class_web, SCOPES, scheduler, models, embedding_cache, attendance_writer, ATTENDANCE_WRITE_BEHIND, ADMIN_TOKEN
 
 blp = Blueprint('face_ops', __name__, description='Face Recognition Operations')
 logger = logging.getLogger(__name__)
 
+MAX_BATCH_IMAGES = 16
+
 @blp.route('/register_student', methods=['POST'])
 def register_student():
     return register_student_impl()
@@ -17,29 +35,38 @@ def register_student():
 def api_register_student():
     return register_student_impl()
 
+def registration_request():
+    # JSON with base64 images, multipart with center/left/right file parts,
+    # or an octet-stream center photo with roll/name/course in the query string
+    if request.mimetype == 'multipart/form-data':
+        return request.form, multipart_files(('center', 'left', 'right'))
+    if request.mimetype == 'application/octet-stream':
+        return request.args, {'center': read_octet_stream()}
+    data = request.json
+    return data, data.get('images') # Expects {center: '...', left: '...', right: '...'}
+
 def register_student_impl():
     try:
-        data = request.json
+        data, images = registration_request()
         roll = data.get('roll')
         name = data.get('name')
         course = data.get('course')
-        images = data.get('images') # Expects {center: '...', left: '...', right: '...'}
-        
+
         if not all([roll, name, course, images]):
             return jsonify({'error': 'Missing required fields'}), 400
             
-        conn, cur = connect_db()
-        # Ensure table structure exists (optional, could be done at startup)
-        # from logic import setup_db; setup_db(cur) 
-        
-        result = register_student_web(cur, roll, name, course, images)
-        conn.close()
+        with db_cursor() as cur:
+            # Ensure table structure exists (optional, could be done at startup)
+            # from logic import setup_db; setup_db(cur)
+            result = register_student_web(cur, roll, name, course, images)
         
         if result['status'] == 'success':
             return jsonify(result)
         else:
             return jsonify(result), 400
-        
+
+    except UploadError as e:
+        return jsonify({'error': e.message}), e.status
     except Exception as e:
         logger.error(f"Registration failed: {e}", exc_info=True)
         return jsonify({'error': str(e)}), 500
@@ -50,9 +77,8 @@ def delete_last_attendance_route():
 
 def delete_last_attendance_impl():
     try:
-        conn, cur = connect_db()
-        deleted = delete_last_attendance(cur)
-        conn.close()
+        with db_cursor() as cur:
+            deleted = delete_last_attendance(cur)
         
         if deleted:
             return jsonify({
@@ -68,3 +94,303 @@ def delete_last_attendance_impl():
     except Exception as e:
         logger.error(f"Delete attendance failed: {e}", exc_info=True)
         return jsonify({'error': str(e)}), 500
+
+
+@blp.route('/api/identify', methods=['POST'])
+def identify():
+    return identify_impl()
+
+def identify_impl():
+    try:
+        # Raw bytes (octet-stream body or multipart 'image' part) or JSON base64;
+        # ?mode=job (or "mode": "job" in JSON) queues it for the job workers,
+        # ?scope=session / ?course=X search a class roster first
+        mode = request.args.get('mode')
+        scope, course = request.args.get('scope'), request.args.get('course')
+        if request.mimetype == 'multipart/form-data':
+            image = multipart_files(('image',)).get('image')
+        elif request.mimetype == 'application/octet-stream':
+            image = read_octet_stream()
+        else:
+            data = request.json or {}
+            image, mode = data.get('image'), data.get('mode', mode)
+            scope, course = data.get('scope', scope), data.get('course', course)
+
+        if not image:
+            return jsonify({'error': 'Missing required field: image'}), 400
+        if course and not scope:
+            scope = 'session'
+        if scope is not None and scope not in SCOPES:
+            return jsonify({'error': f"Unknown scope '{scope}', expected one of: {', '.join(SCOPES)}"}), 400
+
+        if mode == 'job':
+            if job_workers_alive():
+                return submit_job('identify', image_bytes(image), {'scope': scope, 'course': course})
+            # Nothing would ever claim the job: answer it here instead
+            logger.warning("No job worker heartbeat, identifying synchronously")
+
+        with db_cursor() as cur:
+            result = identify_student_web(cur, image, scope, course)
+
+        if result['status'] == 'success':
+            return jsonify(result)
+        else:
+            return jsonify(result), 400
+
+    except UploadError as e:
+        return jsonify({'error': e.message}), e.status
+    except Exception as e:
+        logger.error(f"Identification failed: {e}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+def job_workers_alive():
+    conn = jobs.connect()
+    try:
+        return jobs.workers_alive(conn) > 0
+    finally:
+        conn.close()
+
+def submit_job(kind, payload, options=None):
+    conn = jobs.connect()
+    try:
+        job_id = jobs.submit(conn, kind, payload, options)
+    except jobs.QueueFull as e:
+        return jsonify({'error': f'Job queue is full: {e}'}), 503
+    finally:
+        conn.close()
+    return jsonify({
+        'job_id': job_id,
+        'status': 'queued',
+        'status_url': url_for('face_ops.job_status', job_id=job_id),
+        'events_url': url_for('face_ops.job_events', job_id=job_id),
+    }), 202
+
+@blp.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    conn = jobs.connect()
+    try:
+        job = jobs.get(conn, job_id)
+    finally:
+        conn.close()
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
+
+@blp.route('/api/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    # Server-sent events: one 'status' event per change, the last one carries the result.
+    # Streams end after JOB_EVENTS_TIMEOUT so they never hold a sync worker
+    # past gunicorn's timeout; EventSource reconnects with Last-Event-ID (the
+    # last status sent), and unchanged statuses are not repeated.
+    try:
+        timeout = min(float(request.args.get('timeout', jobs.JOB_EVENTS_TIMEOUT)), jobs.JOB_EVENTS_TIMEOUT)
+    except ValueError:
+        return jsonify({'error': 'timeout must be a number of seconds'}), 400
+    last_seen = request.headers.get('Last-Event-ID')
+
+    def events():
+        conn = jobs.connect()
+        try:
+            deadline = time.monotonic() + timeout
+            last = last_seen
+            while time.monotonic() < deadline:
+                job = jobs.get(conn, job_id)
+                if job is None:
+                    yield f"event: error\ndata: {json.dumps({'error': 'Job not found'})}\n\n"
+                    return
+                if job['status'] != last:
+                    last = job['status']
+                    yield f"id: {last}\nevent: status\ndata: {json.dumps(job)}\n\n"
+                if last in jobs.FINISHED:
+                    return
+                time.sleep(0.1)
+            yield f"event: timeout\ndata: {json.dumps({'job_id': job_id, 'status': last})}\n\n"
+        finally:
+            conn.close()
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@blp.route('/api/classes', methods=['POST'])
+def start_class():
+    try:
+        data = request.json or {}
+        if not data.get('course'):
+            return jsonify({'error': 'Missing required field: course'}), 400
+        with db_cursor() as cur:
+            return jsonify(start_class_web(cur, data['course'], data.get('notes'))), 201
+    except Exception as e:
+        logger.error(f"Starting class failed: {e}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+@blp.route('/api/identify_group', methods=['POST'])
+def identify_group():
+    return identify_group_impl()
+
+def identify_group_impl():
+    try:
+        # One photo with many faces, in the same forms as /api/identify
+        if request.mimetype == 'multipart/form-data':
+            image = multipart_files(('image',)).get('image')
+            mark = request.form.get('mark', 'true').lower() in ('1', 'true', 'yes')
+        elif request.mimetype == 'application/octet-stream':
+            image = read_octet_stream()
+            mark = request.args.get('mark', 'true').lower() in ('1', 'true', 'yes')
+        else:
+            data = request.json or {}
+            image, mark = data.get('image'), bool(data.get('mark', True))
+
+        if not image:
+            return jsonify({'error': 'Missing required field: image'}), 400
+
+        with db_cursor() as cur:
+            result = identify_group_web(cur, image, mark=mark)
+
+        if result['status'] == 'success':
+            return jsonify(result)
+        else:
+            return jsonify(result), 400
+
+    except UploadError as e:
+        return jsonify({'error': e.message}), e.status
+    except Exception as e:
+        logger.error(f"Group identification failed: {e}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+@blp.route('/api/identify_batch', methods=['POST'])
+def identify_batch():
+    return identify_batch_impl()
+
+def identify_batch_impl():
+    try:
+        data = request.json
+        images = data.get('images') # Expects a list of base64 images of one person
+        fuse = data.get('fuse', True)
+
+        if not images or not isinstance(images, list):
+            return jsonify({'error': 'Missing required field: images'}), 400
+        if len(images) > MAX_BATCH_IMAGES:
+            return jsonify({'error': f'At most {MAX_BATCH_IMAGES} images per batch'}), 400
+
+        with db_cursor() as cur:
+            result = identify_batch_web(cur, images, fuse=bool(fuse))
+
+        if result['status'] == 'success':
+            return jsonify(result)
+        else:
+            return jsonify(result), 400
+
+    except Exception as e:
+        logger.error(f"Batch identification failed: {e}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+@blp.route('/api/identify_video', methods=['POST'])
+def identify_video():
+    return identify_video_impl()
+
+def identify_video_impl():
+    try:
+        # Raw video body (e.g. video/webm, possibly chunked) or a multipart 'video' part
+        if request.mimetype == 'multipart/form-data':
+            upload = request.files.get('video')
+            if upload is None:
+                return jsonify({'error': 'Missing required file: video'}), 400
+            stream = upload.stream
+        else:
+            if request.content_length is not None and request.content_length > video.VIDEO_MAX_BYTES:
+                return jsonify({'error': f'Video exceeds {video.VIDEO_MAX_BYTES} bytes'}), 413
+            stream = request.stream
+
+        with db_cursor() as cur:
+            result = video.identify_video_stream(cur, stream)
+
+        if result['status'] == 'success':
+            return jsonify(result)
+        else:
+            return jsonify(result), 400
+
+    except video.VideoTooLarge as e:
+        return jsonify({'error': str(e)}), 413
+    except Exception as e:
+        logger.error(f"Video identification failed: {e}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+@blp.route('/metrics/db', methods=['GET'])
+def db_metrics():
+    return jsonify(db_pool.metrics())
+
+@blp.route('/metrics/jobs', methods=['GET'])
+def job_metrics():
+    conn = jobs.connect()
+    try:
+        return jsonify(jobs.stats(conn))
+    finally:
+        conn.close()
+
+@blp.route('/metrics/inference', methods=['GET'])
+def inference_metrics():
+    return jsonify({**scheduler.metrics(), 'models': models.status(), 'embedding_cache': embedding_cache.metrics(),
+                    'attendance_writer': attendance_writer().metrics() if ATTENDANCE_WRITE_BEHIND else None})
+
+def admin_required(view):
+    # Admin routes accept archives and start process pools: off unless
+    # ADMIN_TOKEN is set, and then only for "Authorization: Bearer <token>"
+    @functools.wraps(view)
+    def wrapped(*args, **kwargs):
+        if not ADMIN_TOKEN:
+            return jsonify({'error': 'Admin endpoints are disabled (set ADMIN_TOKEN)'}), 404
+        supplied = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(supplied.encode(), f"Bearer {ADMIN_TOKEN}".encode()):
+            return jsonify({'error': 'Invalid or missing admin token'}), 401
+        return view(*args, **kwargs)
+    return wrapped
+
+@blp.route('/api/admin/bulk_import', methods=['POST'])
+@admin_required
+def bulk_import_route():
+    return bulk_import_impl()
+
+def bulk_import_impl():
+    try:
+        archive = request.files.get('archive') # zip/tar of photos, optionally with manifest.csv/.jsonl
+        manifest = request.files.get('manifest')
+        if archive is None:
+            return jsonify({'error': 'Missing required file: archive'}), 400
+
+        import_id, path = bulk_import.new_import_dir()
+        source_name = 'source_' + (secure_filename(archive.filename or '') or 'upload')
+        archive.save(os.path.join(path, source_name))
+        manifest_name = None
+        if manifest is not None:
+            manifest_name = 'manifest_' + (secure_filename(manifest.filename or '') or 'upload.csv')
+            manifest.save(os.path.join(path, manifest_name))
+
+        if not bulk_import.start_import(import_id, source_name, manifest_name):
+            return jsonify({'error': 'Import is already running'}), 409
+        return jsonify({'import_id': import_id, 'status': 'running'}), 202
+
+    except Exception as e:
+        logger.error(f"Bulk import upload failed: {e}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+@blp.route('/api/admin/bulk_import/<import_id>', methods=['GET'])
+@admin_required
+def bulk_import_status(import_id):
+    status = bulk_import.import_status(import_id) if import_id.isalnum() else None
+    if status is None:
+        return jsonify({'error': 'Import not found'}), 404
+    return jsonify(status)
+
+@blp.route('/api/admin/bulk_import/<import_id>/resume', methods=['POST'])
+@admin_required
+def bulk_import_resume(import_id):
+    try:
+        if not import_id.isalnum() or bulk_import.import_status(import_id) is None:
+            return jsonify({'error': 'Import not found'}), 404
+        source_name, manifest_name = bulk_import.uploaded_files(import_id)
+        if not bulk_import.start_import(import_id, source_name, manifest_name):
+            return jsonify({'error': 'Import is already running'}), 409
+        return jsonify({'import_id': import_id, 'status': 'running'}), 202
+    except Exception as e:
+        logger.error(f"Bulk import resume failed: {e}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
@@ -0,0 +1,65 @@
+"""psycopg2 stand-ins shared by the unit tests."""
+
+
+class FakeCursor:
+    """Records ``(sql, params)`` for every statement and returns canned ``rows``.
+
+    Statements containing ``fail_on`` raise; so does every statement on a
+    cursor of a ``FakeConn`` whose ``fail`` is set.
+    """
+
+    def __init__(self, rows=(), fail_on=None, conn=None):
+        self.rows = list(rows)
+        self.executed = []
+        self.copied = None
+        self.fail_on = fail_on
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        if self.conn is not None:
+            self.conn.queries += 1
+            if self.conn.fail:
+                raise RuntimeError("server closed the connection")
+        if self.fail_on is not None and self.fail_on in sql:
+            raise RuntimeError(f"statement failed: {self.fail_on}")
+        self.executed.append((sql, params))
+
+    def copy_expert(self, sql, f):
+        self.executed.append((sql, None))
+        self.copied = f.read()
+
+    def fetchall(self):
+        return self.rows
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+
+class FakeConn:
+    def __init__(self):
+        self.closed = False
+        self.autocommit = True
+        self.commits = self.rollbacks = 0
+        self.queries = 0
+        self.fail = False
+
+    def cursor(self, *args, **kwargs):
+        return FakeCursor(conn=self)
+
+    def get_transaction_status(self):
+        return 0  # psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = True
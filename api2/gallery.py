@@ -0,0 +1,293 @@
+import threading
+import numpy as np
+import logging
+try:
+    from .ann import ExactIndex
+    from .template_matrix import TemplateMatrix, PRECISION_ALIASES, resolve_precision
+except ImportError:
+    from ann import ExactIndex
+    from template_matrix import TemplateMatrix, PRECISION_ALIASES, resolve_precision
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_DIM = 512
+FUSIONS = ("max", "mean", "weighted")
+# Course partitions kept per gallery before the cache is reset
+MAX_PARTITIONS = 64
+
+
+def normalize_rows(m):
+    m = np.asarray(m, dtype=np.float32)
+    if m.ndim == 1:
+        m = m.reshape(1, -1)
+    norms = np.linalg.norm(m, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return m / norms
+
+
+class Gallery:
+    """Process-resident face gallery.
+
+    All templates live in one contiguous matrix of L2-normalized rows (float32,
+    or scaled int16/int8 with ``precision``, see ``template_matrix.py``), with
+    ``owners[row]`` pointing into ``students`` (roll, name, course). A probe
+    is scored through ``index`` (see ``ann.py``): exact search is a single
+    matrix-vector product instead of a Python loop over ``cosine_sim``.
+
+    With ``prefilter_k`` set, matching runs in two stages: the probe is first
+    scored against one centroid per student (the normalized mean of their
+    templates, searched through its own index), and only the ``prefilter_k``
+    best students are re-ranked against their individual pose templates.
+    ``fusion`` turns a student's template scores into one: ``max``, ``mean``
+    or ``weighted`` (``fusion_weight * max + (1 - fusion_weight) * mean``).
+
+    ``partition(courses)`` returns a smaller gallery holding only the
+    students of those courses, built from this one on first use and dropped
+    whenever one of its students changes.
+    """
+
+    def __init__(self, dim=EMBEDDING_DIM, index=None, precision="float32",
+                 prefilter_k=0, fusion="max", fusion_weight=0.5):
+        if fusion not in FUSIONS:
+            raise ValueError(f"Unknown template fusion '{fusion}', expected one of: {', '.join(FUSIONS)}")
+        self.dim = dim
+        self.index = index if index is not None else ExactIndex()
+        if precision in PRECISION_ALIASES:
+            logger.warning(f"Gallery precision '{precision}' is deprecated, use '{PRECISION_ALIASES[precision]}'")
+        self.precision = resolve_precision(precision)
+        self.prefilter_k = prefilter_k
+        self.fusion = fusion
+        self.fusion_weight = fusion_weight
+        self._lock = threading.RLock()
+        self.matrix = TemplateMatrix.encode(np.empty((0, dim), dtype=np.float32), precision)
+        self.owners = np.empty(0, dtype=np.int64)
+        self.centroids = TemplateMatrix.encode(np.empty((0, dim), dtype=np.float32), precision)
+        self.centroid_owners = np.empty(0, dtype=np.int64)
+        self.centroid_index = self.index.fresh()
+        self._spans = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+        self.students = []
+        self._slots = {}
+        self._partitions = {}
+        self.loaded = False
+
+    def __len__(self):
+        return len(self._slots)
+
+    @property
+    def size(self):
+        return self.matrix.shape[0]
+
+    def build(self, students):
+        """Build from ``load_students`` output: a list of ``(row, [emb, ...])``."""
+        records, owners, vectors, centroids = [], [], [], []
+        for row, embs in students:
+            embs = [e for e in embs if e is not None and np.size(e) == self.dim]
+            if not embs:
+                continue
+            slot = len(records)
+            records.append(_student_record(row))
+            templates = normalize_rows(np.stack([np.asarray(e, dtype=np.float32).reshape(-1) for e in embs]))
+            owners.extend([slot] * len(templates))
+            vectors.append(templates)
+            centroids.append(_centroid(templates))
+
+        empty = np.empty((0, self.dim), np.float32)
+        matrix = TemplateMatrix.encode(np.vstack(vectors) if vectors else empty, self.precision)
+        index = self.index.fresh().build(matrix)
+        centroids = TemplateMatrix.encode(np.vstack(centroids) if centroids else empty, self.precision)
+        centroid_index = self.index.fresh().build(centroids) if self.prefilter_k else self.index.fresh()
+        owners = np.asarray(owners, dtype=np.int64)
+        with self._lock:
+            self.matrix = matrix
+            self.index = index
+            self.owners = owners
+            self.centroids = centroids
+            self.centroid_owners = np.arange(len(records), dtype=np.int64)
+            self.centroid_index = centroid_index
+            self._spans = _spans(owners, len(records))
+            self.students = records
+            self._slots = {r['roll']: i for i, r in enumerate(records)}
+            self._partitions = {}
+            self.loaded = True
+        logger.info(f"Gallery built: {len(records)} students, {matrix.shape[0]} templates")
+
+    def ensure_loaded(self, loader):
+        """Build the gallery once, using ``loader()`` to fetch students."""
+        if self.loaded:
+            return self
+        with self._lock:
+            if not self.loaded:
+                self.build(loader())
+        return self
+
+    def invalidate(self):
+        with self._lock:
+            self.loaded = False
+
+    def upsert(self, row, embs):
+        """Replace (or add) one student's templates without a full rebuild."""
+        roll = row['roll']
+        vectors = [np.asarray(e, dtype=np.float32).reshape(-1) for e in embs
+                   if e is not None and np.size(e) == self.dim]
+        templates = normalize_rows(np.stack(vectors)) if vectors else None
+        with self._lock:
+            if not self.loaded:
+                return
+            slot = self._slots.get(roll)
+            existing = slot is not None
+            if not existing:
+                if not vectors:
+                    return
+                slot = len(self.students)
+                self.students.append(_student_record(row))
+                self._slots[roll] = slot
+            else:
+                self._drop_partitions(self.students[slot]['course'])
+                self.students[slot] = _student_record(row)
+            self._drop_partitions(row.get('course'))
+            self._replace(slot, templates, existing)
+
+    def remove(self, roll):
+        with self._lock:
+            slot = self._slots.pop(roll, None)
+            if slot is None:
+                return
+            self._drop_partitions(self.students[slot]['course'])
+            self._replace(slot, None)
+
+    def _replace(self, slot, templates, existing=True):
+        # Drop the slot's template and centroid rows, then append the new
+        # ones at the end, so each student's templates stay contiguous
+        n_added = 0 if templates is None else len(templates)
+        keep = centroid_keep = None
+        if existing:
+            keep = self.owners != slot
+            self.matrix = self.matrix.select(keep)
+            self.owners = self.owners[keep]
+            centroid_keep = self.centroid_owners != slot
+            self.centroids = self.centroids.select(centroid_keep)
+            self.centroid_owners = self.centroid_owners[centroid_keep]
+        if n_added:
+            self.matrix = self.matrix.append(templates)
+            self.owners = np.concatenate([self.owners, np.full(n_added, slot, dtype=np.int64)])
+            self.centroids = self.centroids.append(_centroid(templates))
+            self.centroid_owners = np.concatenate([self.centroid_owners, [slot]])
+        self.index = self.index.updated(self.matrix, keep, n_added)
+        if self.prefilter_k:
+            self.centroid_index = self.centroid_index.updated(self.centroids, centroid_keep, 1 if n_added else 0)
+        self._spans = _spans(self.owners, len(self.students))
+
+    def partition(self, courses):
+        """Gallery of the students enrolled in ``courses`` (cached per course set)."""
+        key = tuple(sorted(set(courses)))
+        with self._lock:
+            part = self._partitions.get(key)
+            if part is not None:
+                return part
+            starts, counts = self._spans
+            students = [(self.students[s], self.matrix[starts[s]:starts[s] + counts[s]])
+                        for s in self._slots.values() if counts[s] and self.students[s]['course'] in key]
+            part = Gallery(self.dim, self.index.fresh(), self.precision,
+                           self.prefilter_k, self.fusion, self.fusion_weight)
+            part.build(students)
+            if len(self._partitions) >= MAX_PARTITIONS:
+                self._partitions = {}
+            self._partitions[key] = part
+        return part
+
+    def _drop_partitions(self, course):
+        self._partitions = {k: p for k, p in self._partitions.items() if course not in k}
+
+    def best_match(self, emb):
+        """Return ``(score, student)`` for the closest template, or ``(-1, None)``."""
+        return self.best_matches(np.asarray(emb).reshape(1, -1))[0]
+
+    def best_matches(self, embs):
+        """``best_match`` for each row of ``embs``, scored in one matrix product."""
+        if self.prefilter_k:
+            return [m[0] if m else (-1.0, None) for m in self.top_matches(embs, 1)]
+        with self._lock:
+            matrix, owners, students, index = self.matrix, self.owners, self.students, self.index
+        queries = normalize_rows(embs)
+        if matrix.shape[0] == 0 or queries.shape[1] != matrix.shape[1]:
+            return [(-1.0, None)] * len(queries)
+        scores, rows = index.search(matrix, queries, 1)
+        if rows.shape[1] == 0:
+            return [(-1.0, None)] * len(queries)
+        return [(-1.0, None) if row < 0 else (float(score), students[owners[row]])
+                for score, row in zip(scores[:, 0], rows[:, 0])]
+
+    def top_matches(self, embs, k=5):
+        """Up to ``k`` ``(score, student)`` per row of ``embs``, one per student, best first."""
+        if self.prefilter_k:
+            return self._reranked_matches(embs, max(k, self.prefilter_k), k)
+        with self._lock:
+            matrix, owners, students, index = self.matrix, self.owners, self.students, self.index
+        queries = normalize_rows(embs)
+        if matrix.shape[0] == 0 or queries.shape[1] != matrix.shape[1]:
+            return [[] for _ in range(len(queries))]
+        # Students have up to three templates, so 3k rows cover k students
+        scores, rows = index.search(matrix, queries, 3 * k)
+        results = []
+        for q_scores, q_rows in zip(scores, rows):
+            seen, matches = set(), []
+            for score, row in zip(q_scores, q_rows):
+                if row < 0 or owners[row] in seen:
+                    continue
+                seen.add(owners[row])
+                matches.append((float(score), students[owners[row]]))
+                if len(matches) == k:
+                    break
+            results.append(matches)
+        return results
+
+    def _reranked_matches(self, embs, candidates, k):
+        with self._lock:
+            matrix, students, spans = self.matrix, self.students, self._spans
+            centroids, centroid_owners, centroid_index = self.centroids, self.centroid_owners, self.centroid_index
+        queries = normalize_rows(embs)
+        if centroids.shape[0] == 0 or queries.shape[1] != centroids.shape[1]:
+            return [[] for _ in range(len(queries))]
+        # Stage one: one centroid per student instead of every template
+        _, rows = centroid_index.search(centroids, queries, candidates)
+        starts, counts = spans
+        results = []
+        for query, q_rows in zip(queries, rows):
+            slots = centroid_owners[q_rows[q_rows >= 0]]
+            if len(slots) == 0:
+                results.append([])
+                continue
+            # Stage two: the candidates' pose templates, fused per student
+            template_rows = np.concatenate([np.arange(starts[s], starts[s] + counts[s]) for s in slots])
+            scores = matrix[template_rows] @ query
+            bounds = np.cumsum(counts[slots])[:-1]
+            fused = [self._fuse(s) for s in np.split(scores, bounds)]
+            order = np.argsort(fused)[::-1][:k]
+            results.append([(float(fused[i]), students[slots[i]]) for i in order])
+        return results
+
+    def _fuse(self, scores):
+        if self.fusion == "max":
+            return scores.max()
+        if self.fusion == "mean":
+            return scores.mean()
+        return self.fusion_weight * scores.max() + (1 - self.fusion_weight) * scores.mean()
+
+
+def _centroid(templates):
+    return normalize_rows(templates.mean(axis=0))
+
+
+def _spans(owners, n_slots):
+    """First row and row count of each slot's (contiguous) templates."""
+    starts = np.zeros(n_slots, dtype=np.int64)
+    counts = np.zeros(n_slots, dtype=np.int64)
+    if len(owners):
+        slots, first, count = np.unique(owners, return_index=True, return_counts=True)
+        starts[slots] = first
+        counts[slots] = count
+    return starts, counts
+
+
+def _student_record(row):
+    return {'roll': row['roll'], 'name': row.get('name'), 'course': row.get('course')}
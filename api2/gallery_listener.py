@@ -0,0 +1,103 @@
+import json
+import select
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "students_changed"
+
+# Emits one NOTIFY per changed row with {"op": ..., "roll": ...}. A roll that
+# is renamed by an UPDATE is announced as a DELETE of the old key as well.
+STUDENTS_NOTIFY_SQL = """
+    CREATE OR REPLACE FUNCTION notify_students_changed() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            PERFORM pg_notify('students_changed',
+                json_build_object('op', TG_OP, 'roll', OLD.roll)::text);
+            RETURN OLD;
+        END IF;
+        IF TG_OP = 'UPDATE' AND OLD.roll IS DISTINCT FROM NEW.roll THEN
+            PERFORM pg_notify('students_changed',
+                json_build_object('op', 'DELETE', 'roll', OLD.roll)::text);
+        END IF;
+        PERFORM pg_notify('students_changed',
+            json_build_object('op', TG_OP, 'roll', NEW.roll)::text);
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    DROP TRIGGER IF EXISTS students_changed ON students;
+    CREATE TRIGGER students_changed
+        AFTER INSERT OR UPDATE OR DELETE ON students
+        FOR EACH ROW EXECUTE PROCEDURE notify_students_changed();
+"""
+
+
+class GalleryListener(threading.Thread):
+    """Applies ``students`` row changes announced via NOTIFY to a Gallery.
+
+    ``connect`` returns a new ``(conn, cur)`` pair, ``fetch_student(cur, roll)``
+    returns ``(row, embs)`` or ``None`` if the student no longer exists. After
+    every (re)connect the gallery is invalidated, since notifications sent
+    while we were not listening are lost.
+    """
+
+    def __init__(self, gallery, connect, fetch_student, poll_timeout=5.0, retry_delay=5.0):
+        super().__init__(name="gallery-listener", daemon=True)
+        self.gallery = gallery
+        self.connect = connect
+        self.fetch_student = fetch_student
+        self.poll_timeout = poll_timeout
+        self.retry_delay = retry_delay
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            conn = None
+            try:
+                conn, cur = self.connect()
+                cur.execute(f"LISTEN {CHANNEL}")
+                self.gallery.invalidate()
+                logger.info(f"Listening for gallery changes on '{CHANNEL}'")
+                self._listen(conn, cur)
+            except Exception as e:
+                logger.error(f"Gallery listener error: {e}", exc_info=True)
+                self._stop_event.wait(self.retry_delay)
+            finally:
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+
+    def _listen(self, conn, cur):
+        while not self._stop_event.is_set():
+            if select.select([conn], [], [], self.poll_timeout) == ([], [], []):
+                continue
+            conn.poll()
+            rolls = {}
+            while conn.notifies:
+                note = conn.notifies.pop(0)
+                try:
+                    payload = json.loads(note.payload)
+                    rolls[payload['roll']] = payload['op']
+                except (ValueError, KeyError):
+                    logger.warning(f"Ignoring malformed gallery notification: {note.payload}")
+            for roll, op in rolls.items():
+                self.apply(cur, roll, op)
+
+    def apply(self, cur, roll, op):
+        if op == 'DELETE':
+            self.gallery.remove(roll)
+            return
+        student = self.fetch_student(cur, roll)
+        if student is None:
+            self.gallery.remove(roll)
+        else:
+            row, embs = student
+            self.gallery.upsert(row, embs)
+        logger.debug(f"Gallery {op.lower()} applied for {roll}")
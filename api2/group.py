@@ -0,0 +1,37 @@
+"""One-to-one assignment of detected faces to gallery students.
+
+Each face brings its top candidate students (``Gallery.top_matches``); the
+faces x candidates score matrix is solved as a maximum-weight assignment,
+so two faces in the same photo never resolve to the same student.
+"""
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+
+def assign_identities(candidates, threshold):
+    """``(score, student)`` per face; student is None where no assignment beats ``threshold``.
+
+    Unassigned faces report their best candidate score, so callers can show
+    how close the face came.
+    """
+    rolls = {}
+    for matches in candidates:
+        for _, student in matches:
+            rolls.setdefault(student['roll'], student)
+    results = [(max((s for s, _ in m), default=-1.0), None) for m in candidates]
+    if not rolls:
+        return results
+
+    columns = list(rolls)
+    column = {roll: j for j, roll in enumerate(columns)}
+    # Pairs at or below the threshold are worth nothing, so they never win
+    gain = np.zeros((len(candidates), len(columns)), dtype=np.float64)
+    for i, matches in enumerate(candidates):
+        for score, student in matches:
+            if score > threshold:
+                gain[i, column[student['roll']]] = score
+
+    for i, j in zip(*linear_sum_assignment(gain, maximize=True)):
+        if gain[i, j] > 0:
+            results[i] = (float(gain[i, j]), rolls[columns[j]])
+    return results
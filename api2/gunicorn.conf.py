@@ -0,0 +1,61 @@
+import gc
+import os
+
+# Picked up automatically by `gunicorn main:app` from this directory.
+#
+# FACE_MODELS_PRELOAD=true imports the app in the master and loads the face
+# models there before forking, so all workers share the weight pages
+# copy-on-write. Each worker then runs its own warm-up pass after the fork;
+# running the first forward pass in the master would start torch's thread
+# pool before fork, which is not fork-safe.
+FACE_MODELS_PRELOAD = os.getenv("FACE_MODELS_PRELOAD", "false").lower() in ("1", "true", "yes")
+
+preload_app = FACE_MODELS_PRELOAD
+
+
+def _models():
+    try:
+        from logic import models
+    except ImportError:
+        from api2.logic import models
+    return models
+
+
+def when_ready(server):
+    if FACE_MODELS_PRELOAD:
+        _models().preload()
+        # Keep the collector from touching (and so copying) preloaded objects
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    threads = os.getenv("TORCH_NUM_THREADS")
+    if threads:
+        import torch
+        torch.set_num_threads(int(threads))
+    if FACE_MODELS_PRELOAD:
+        models = _models()
+        if models.warmup_on_load:
+            models.warmup()
+        _warm_db_pool(server)
+
+
+def _warm_db_pool(server):
+    # Open DB_POOL_MIN connections now rather than on the first requests
+    try:
+        from logic import db_pool
+    except ImportError:
+        from api2.logic import db_pool
+    try:
+        db_pool.warm()
+    except Exception as e:
+        server.log.warning(f"Could not pre-open database connections: {e}")
+
+
+def worker_exit(server, worker):
+    # Write buffered attendance marks before the worker goes away
+    try:
+        from logic import flush_attendance
+    except ImportError:
+        from api2.logic import flush_attendance
+    flush_attendance()
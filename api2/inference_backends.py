@@ -0,0 +1,230 @@
+import fcntl
+import hashlib
+import os
+import tempfile
+import numpy as np
+import torch
+import logging
+
+logger = logging.getLogger(__name__)
+
+INPUT_SHAPE = (3, 160, 160)
+ONNX_OPSET = 17
+
+
+def configure_torch_threads(intra_op_threads=None, inter_op_threads=None):
+    if intra_op_threads:
+        torch.set_num_threads(intra_op_threads)
+    if inter_op_threads:
+        try:
+            torch.set_num_interop_threads(inter_op_threads)
+        except RuntimeError as e:
+            # Only allowed once, before any inter-op parallel work has started
+            logger.warning(f"Could not set torch inter-op threads: {e}")
+
+
+class EagerBackend:
+    """Plain PyTorch module call; the reference for the other backends.
+
+    Every backend is a callable mapping a float32 ``(N, 3, 160, 160)`` array
+    to ``(N, 512)`` un-normalized embeddings.
+    """
+
+    name = "eager"
+
+    def __init__(self, model, device="cpu", intra_op_threads=None, inter_op_threads=None):
+        configure_torch_threads(intra_op_threads, inter_op_threads)
+        self.model = model
+        self.device = device
+
+    def __call__(self, batch):
+        t = torch.from_numpy(np.ascontiguousarray(batch, dtype=np.float32)).to(self.device)
+        with torch.no_grad():
+            return self.model(t).cpu().numpy()
+
+
+class TorchScriptBackend(EagerBackend):
+    """Traced and frozen TorchScript graph (constant-folded, fused conv+bn)."""
+
+    name = "torchscript"
+
+    def __init__(self, model, device="cpu", intra_op_threads=None, inter_op_threads=None):
+        super().__init__(model, device, intra_op_threads, inter_op_threads)
+        example = torch.zeros(1, *INPUT_SHAPE, device=device)
+        with torch.no_grad():
+            traced = torch.jit.trace(model.eval(), example)
+            self.model = torch.jit.optimize_for_inference(torch.jit.freeze(traced))
+
+
+class OnnxRuntimeBackend:
+    """ONNX Runtime CPU session over a model exported once to ``path``."""
+
+    name = "onnx"
+
+    def __init__(self, model, path, intra_op_threads=None, inter_op_threads=None):
+        import onnxruntime as ort
+
+        export_onnx(model, path)
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op_threads:
+            options.intra_op_num_threads = intra_op_threads
+        if inter_op_threads:
+            options.inter_op_num_threads = inter_op_threads
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, batch):
+        return self.session.run(None, {self.input_name: np.ascontiguousarray(batch, dtype=np.float32)})[0]
+
+
+class QuantizedOnnxBackend(OnnxRuntimeBackend):
+    """int8 ONNX Runtime session, quantized once from the fp32 export.
+
+    With calibration crops the activations are quantized statically from
+    their observed ranges; without them only weights are quantized ahead of
+    time and activations are quantized on the fly. The quantized model is
+    cached at ``path``, whose name ``make_backend`` derives from the weights,
+    the runtime versions and the calibration file, so a change to any of
+    them builds a new artifact instead of serving the old one.
+    """
+
+    name = "onnx-int8"
+
+    def __init__(self, model, path, fp32_path, calibration_path=None, intra_op_threads=None, inter_op_threads=None):
+        if not os.path.exists(path):
+            export_onnx(model, fp32_path)
+            quantize_onnx(fp32_path, path, load_calibration(calibration_path))
+        super().__init__(model, path, intra_op_threads, inter_op_threads)
+
+
+def load_calibration(path, batch_size=8):
+    """Batches of preprocessed ``(N, 3, 160, 160)`` crops saved with ``np.save``, or None."""
+    if not path or not os.path.exists(path):
+        return None
+    crops = np.load(path).astype(np.float32)
+    return [crops[i:i + batch_size] for i in range(0, len(crops), batch_size)]
+
+
+def quantize_onnx(fp32_path, path, calibration=None):
+    from onnxruntime.quantization import (CalibrationDataReader, QuantFormat, QuantType,
+                                          quantize_dynamic, quantize_static)
+
+    class Reader(CalibrationDataReader):
+        def __init__(self, batches):
+            self._batches = iter(batches)
+
+        def get_next(self):
+            batch = next(self._batches, None)
+            return None if batch is None else {"faces": batch}
+
+    def build(tmp):
+        # Static calibration runs the model over every crop: the lock in
+        # build_artifact keeps other workers from starting their own
+        if calibration:
+            quantize_static(fp32_path, tmp, Reader(calibration), quant_format=QuantFormat.QDQ,
+                            activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8, per_channel=True)
+            logger.info(f"Quantized facenet to int8 with {sum(len(b) for b in calibration)} calibration crops: {path}")
+        else:
+            logger.warning("No facenet calibration crops, using dynamic int8 quantization")
+            quantize_dynamic(fp32_path, tmp, weight_type=QuantType.QUInt8)
+            logger.info(f"Quantized facenet weights to int8: {path}")
+
+    build_artifact(path, build)
+
+
+def build_artifact(path, build):
+    """Create ``path`` once, however many workers ask for it at the same time.
+
+    Builders are serialized by an ``flock`` on ``path + ".lock"``; whoever
+    gets the lock first runs ``build(tmp)`` into a private temporary file in
+    the same directory and renames it into place, and the others find the
+    finished artifact once the lock is theirs. Returns True if it was built.
+    """
+    if os.path.exists(path):
+        return False
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    with open(path + ".lock", "a") as lock:
+        fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+        if os.path.exists(path):
+            return False
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + ".", suffix=".tmp")
+        os.close(fd)
+        try:
+            build(tmp)
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+    return True
+
+
+def export_onnx(model, path):
+    example = torch.zeros(1, *INPUT_SHAPE)
+    kwargs = dict(input_names=["faces"], output_names=["embeddings"],
+                  dynamic_axes={"faces": {0: "batch"}, "embeddings": {0: "batch"}},
+                  opset_version=ONNX_OPSET)
+
+    def build(tmp):
+        # Only the builder touches the model: with the artifact in place,
+        # callers may pass None
+        eval_model = model.eval().cpu()
+        try:
+            torch.onnx.export(eval_model, example, tmp, dynamo=False, **kwargs)
+        except TypeError:
+            # torch < 2.5 has no dynamo switch and always uses the TorchScript exporter
+            torch.onnx.export(eval_model, example, tmp, **kwargs)
+
+    if build_artifact(path, build):
+        logger.info(f"Exported facenet to ONNX: {path}")
+
+
+def _digest(h, size=12):
+    return h.hexdigest()[:size]
+
+
+def model_key(model):
+    """Short hash of the weights and of the toolchain that exports and runs them."""
+    import onnxruntime
+
+    h = hashlib.sha256()
+    for name, tensor in model.state_dict().items():
+        h.update(name.encode())
+        h.update(tensor.detach().cpu().contiguous().numpy().tobytes())
+    h.update(f"torch={torch.__version__} onnxruntime={onnxruntime.__version__} opset={ONNX_OPSET}".encode())
+    return _digest(h)
+
+
+def calibration_key(path):
+    """Short hash of the calibration crops, or "dynamic" without them."""
+    if not path or not os.path.exists(path):
+        return "dynamic"
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return _digest(h, 8)
+
+
+BACKENDS = ("eager", "torchscript", "onnx", "onnx-int8")
+
+
+def make_backend(name, model, device="cpu", artifact_dir=".", intra_op_threads=None, inter_op_threads=None,
+                 calibration_path=None):
+    if name == "eager":
+        return EagerBackend(model, device, intra_op_threads, inter_op_threads)
+    if name == "torchscript":
+        return TorchScriptBackend(model, device, intra_op_threads, inter_op_threads)
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown facenet backend '{name}', expected one of: {', '.join(BACKENDS)}")
+    if device != "cpu":
+        logger.warning("ONNX backends run on CPU only")
+    # Artifacts are keyed by what they were built from: new weights, a
+    # torch/onnxruntime upgrade or new calibration crops get a fresh file
+    key = model_key(model)
+    fp32_path = os.path.join(artifact_dir, f"facenet_vggface2.{key}.onnx")
+    if name == "onnx":
+        return OnnxRuntimeBackend(model, fp32_path, intra_op_threads, inter_op_threads)
+    int8_path = os.path.join(artifact_dir, f"facenet_vggface2.{key}.{calibration_key(calibration_path)}.int8.onnx")
+    return QuantizedOnnxBackend(model, int8_path, fp32_path, calibration_path, intra_op_threads, inter_op_threads)
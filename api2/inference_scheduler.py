@@ -0,0 +1,100 @@
+import threading
+import time
+import queue
+from collections import Counter
+from concurrent.futures import Future
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceScheduler:
+    """Coalesces face crops from concurrent requests into shared forward passes.
+
+    ``run_batch`` maps a stacked ``(N, ...)`` array to ``(N, ...)`` outputs.
+    A batch is flushed when it reaches ``max_batch_size`` items or when the
+    oldest queued item has waited ``max_wait_ms``. The worker thread is
+    started lazily, so a scheduler created before a fork works in the child.
+    """
+
+    def __init__(self, run_batch, max_batch_size=16, max_wait_ms=5.0):
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._items = 0
+        self._batch_sizes = Counter()
+        self._wait_total = 0.0
+        self._run_total = 0.0
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name="inference-scheduler", daemon=True)
+                self._thread.start()
+
+    def submit(self, items):
+        """Queue each item and block until all of their outputs are ready."""
+        self._ensure_started()
+        now = time.perf_counter()
+        futures = []
+        for item in items:
+            future = Future()
+            self._queue.put((item, future, now))
+            futures.append(future)
+        return [f.result() for f in futures]
+
+    def _loop(self):
+        while True:
+            first = self._queue.get()
+            pending = [first]
+            deadline = first[2] + self.max_wait
+            while len(pending) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                try:
+                    pending.append(self._queue.get(timeout=remaining) if remaining > 0
+                                   else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._run(pending)
+
+    def _run(self, pending):
+        start = time.perf_counter()
+        try:
+            outputs = self.run_batch(np.stack([p[0] for p in pending]))
+        except Exception as e:
+            logger.error(f"Batched inference failed: {e}", exc_info=True)
+            for _, future, _ in pending:
+                future.set_exception(e)
+            return
+        finished = time.perf_counter()
+        for (_, future, _), out in zip(pending, outputs):
+            future.set_result(out)
+        with self._stats_lock:
+            self._batches += 1
+            self._items += len(pending)
+            self._batch_sizes[len(pending)] += 1
+            self._wait_total += sum(start - p[2] for p in pending)
+            self._run_total += finished - start
+
+    def metrics(self):
+        with self._stats_lock:
+            batches, items = self._batches, self._items
+            return {
+                'queue_depth': self._queue.qsize(),
+                'batches': batches,
+                'items': items,
+                'mean_batch_size': items / batches if batches else 0.0,
+                'batch_size_histogram': {str(k): v for k, v in sorted(self._batch_sizes.items())},
+                'mean_queue_wait_ms': 1000 * self._wait_total / items if items else 0.0,
+                'mean_batch_run_ms': 1000 * self._run_total / batches if batches else 0.0,
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': 1000 * self.max_wait,
+            }
@@ -0,0 +1,225 @@
+"""Asynchronous identification jobs.
+
+Web workers enqueue jobs in a local SQLite database and return at once;
+a separate pool of inference processes claims them, runs identification
+and stores the result for the poll / server-sent-events endpoints:
+
+    python jobs.py --workers 2
+
+Jobs whose worker died are requeued after ``JOB_TIMEOUT`` seconds and
+finished jobs are deleted after ``JOB_RETENTION`` seconds. Workers record a
+heartbeat while they poll, so the web side can tell whether anyone is
+there to run a job.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+
+JOBS_DB = os.getenv("JOBS_DB", os.path.join(tempfile.gettempdir(), "face_jobs.sqlite3"))
+JOB_TIMEOUT = float(os.getenv("JOB_TIMEOUT", "300"))
+JOB_RETENTION = float(os.getenv("JOB_RETENTION", "3600"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "0.05"))
+JOB_QUEUE_LIMIT = int(os.getenv("JOB_QUEUE_LIMIT", "1000"))
+# Longest a /events stream holds a web worker; kept under gunicorn's --timeout
+JOB_EVENTS_TIMEOUT = float(os.getenv("JOB_EVENTS_TIMEOUT", "25"))
+# A worker that has not polled for this long (and is not running a job) is gone
+JOB_HEARTBEAT_TIMEOUT = float(os.getenv("JOB_HEARTBEAT_TIMEOUT", "30"))
+
+FINISHED = ('done', 'failed')
+
+SCHEMA_SQL = """
+    CREATE TABLE IF NOT EXISTS jobs (
+        id TEXT PRIMARY KEY,
+        kind TEXT NOT NULL,
+        status TEXT NOT NULL,
+        payload BLOB,
+        options TEXT,
+        result TEXT,
+        error TEXT,
+        worker TEXT,
+        created REAL NOT NULL,
+        started REAL,
+        finished REAL
+    );
+    CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, created);
+    CREATE TABLE IF NOT EXISTS workers (
+        name TEXT PRIMARY KEY,
+        pid INTEGER,
+        seen REAL NOT NULL
+    );
+"""
+
+
+class QueueFull(Exception):
+    pass
+
+
+_schema_ready = set()
+
+def connect(path=None):
+    path = path or JOBS_DB
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    if path not in _schema_ready:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA_SQL)
+        columns = {row['name'] for row in conn.execute("PRAGMA table_info(jobs)")}
+        if 'options' not in columns:
+            conn.execute("ALTER TABLE jobs ADD COLUMN options TEXT")
+        _schema_ready.add(path)
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def submit(conn, kind, payload, options=None):
+    """Queue a job and return its id; ``options`` (JSON) are passed on to ``run_job``."""
+    queued = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+    if queued >= JOB_QUEUE_LIMIT:
+        raise QueueFull(f"{queued} jobs already queued")
+    job_id = uuid.uuid4().hex
+    conn.execute("INSERT INTO jobs (id, kind, status, payload, options, created) VALUES (?, ?, 'queued', ?, ?, ?)",
+                 (job_id, kind, sqlite3.Binary(bytes(payload)), json.dumps(options or {}), time.time()))
+    return job_id
+
+
+def get(conn, job_id):
+    """Public view of a job (no payload), or None."""
+    row = conn.execute("SELECT id, kind, status, result, error, created, started, finished FROM jobs WHERE id = ?",
+                       (job_id,)).fetchone()
+    if row is None:
+        return None
+    job = {'job_id': row['id'], 'kind': row['kind'], 'status': row['status'], 'created': row['created'],
+           'started': row['started'], 'finished': row['finished']}
+    if row['status'] == 'queued':
+        job['position'] = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND created < ?",
+                                       (row['created'],)).fetchone()[0]
+    if row['result'] is not None:
+        job['result'] = json.loads(row['result'])
+    if row['error'] is not None:
+        job['error'] = row['error']
+    return job
+
+
+def claim(conn, worker):
+    """Atomically take the oldest queued job; returns ``(id, kind, payload, options)`` or None."""
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Requeue jobs of workers that died mid-job
+        conn.execute("UPDATE jobs SET status = 'queued', worker = NULL, started = NULL "
+                     "WHERE status = 'running' AND started < ?", (now - JOB_TIMEOUT,))
+        row = conn.execute("SELECT id, kind, payload, options FROM jobs WHERE status = 'queued' "
+                           "ORDER BY created LIMIT 1").fetchone()
+        if row is not None:
+            conn.execute("UPDATE jobs SET status = 'running', worker = ?, started = ? WHERE id = ?",
+                         (worker, now, row['id']))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    if row is None:
+        return None
+    return row['id'], row['kind'], row['payload'], json.loads(row['options'] or '{}')
+
+
+def finish(conn, job_id, result=None, error=None):
+    conn.execute("UPDATE jobs SET status = ?, result = ?, error = ?, finished = ?, payload = NULL WHERE id = ?",
+                 ('failed' if error else 'done', None if result is None else json.dumps(result), error,
+                  time.time(), job_id))
+
+
+def purge(conn):
+    conn.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished < ?",
+                 (time.time() - JOB_RETENTION,))
+
+
+def heartbeat(conn, worker):
+    conn.execute("INSERT INTO workers (name, pid, seen) VALUES (?, ?, ?) "
+                 "ON CONFLICT (name) DO UPDATE SET pid = excluded.pid, seen = excluded.seen",
+                 (worker, os.getpid(), time.time()))
+
+
+def workers_alive(conn):
+    """Workers that polled recently or are busy with a job that has not timed out."""
+    now = time.time()
+    return conn.execute("SELECT COUNT(*) FROM workers WHERE seen > ? OR name IN "
+                        "(SELECT worker FROM jobs WHERE status = 'running' AND started > ?)",
+                        (now - JOB_HEARTBEAT_TIMEOUT, now - JOB_TIMEOUT)).fetchone()[0]
+
+
+def stats(conn):
+    counts = dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+    return {status: counts.get(status, 0) for status in ('queued', 'running', 'done', 'failed')}
+
+
+# ===================== WORKERS =====================
+
+def run_job(kind, payload, options=None):
+    try:
+        from . import logic
+    except ImportError:
+        import logic
+    if kind == 'identify':
+        with logic.db_cursor() as cur:
+            options = options or {}
+            return logic.identify_student_web(cur, payload, options.get('scope'), options.get('course'))
+    raise ValueError(f"Unknown job kind '{kind}'")
+
+
+def worker_loop(name, threads=None, stop=None):
+    if threads:
+        import torch
+        torch.set_num_threads(threads)
+    conn = connect()
+    last_purge = last_beat = 0.0
+    logger.info(f"Job worker {name} started (pid {os.getpid()})")
+    while stop is None or not stop.is_set():
+        if time.time() - last_beat > JOB_HEARTBEAT_TIMEOUT / 3:
+            heartbeat(conn, name)
+            last_beat = time.time()
+        if time.time() - last_purge > 60:
+            purge(conn)
+            last_purge = time.time()
+        job = claim(conn, name)
+        if job is None:
+            time.sleep(JOB_POLL_INTERVAL)
+            continue
+        job_id, kind, payload, options = job
+        try:
+            finish(conn, job_id, result=run_job(kind, payload, options))
+        except Exception as e:
+            logger.error(f"Job {job_id} failed: {e}", exc_info=True)
+            finish(conn, job_id, error=str(e))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inference worker pool for asynchronous identification jobs")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes")
+    parser.add_argument("--threads", type=int, default=None, help="torch threads per worker")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(levelname)s: %(message)s')
+    connect().close()  # create the schema once before the workers race for it
+    # spawn: every worker loads its own models and torch thread pool
+    ctx = multiprocessing.get_context("spawn")
+    procs = [ctx.Process(target=worker_loop, args=(f"worker-{i}", args.threads), name=f"job-worker-{i}")
+             for i in range(args.workers)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+    sys.exit(main())
@@ -5,10 +5,12 @@ import time
 import threading
 import sys
 import base64
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
 import psycopg2
 import psycopg2.extras
-from facenet_pytorch import MTCNN, InceptionResnetV1
 # import dlib
 # from imutils import face_utils
 from tabulate import tabulate
@@ -16,6 +18,32 @@ import argparse
 import os
 import json
 import logging
+try:
+    from .ann import make_index
+    from .gallery import Gallery
+    from .gallery_listener import GalleryListener, STUDENTS_NOTIFY_SQL
+    from . import pgvector_store
+    from .inference_scheduler import InferenceScheduler
+    from . import template_storage
+    from .model_registry import ModelRegistry
+    from .detection import DetectionProfile
+    from .embedding_cache import EmbeddingCache, MISS
+    from .group import assign_identities
+    from .attendance_writer import AttendanceWriter, MARK_ID_SQL
+    from .db_pool import ConnectionPool
+except ImportError:
+    from ann import make_index
+    from gallery import Gallery
+    from gallery_listener import GalleryListener, STUDENTS_NOTIFY_SQL
+    import pgvector_store
+    from inference_scheduler import InferenceScheduler
+    import template_storage
+    from model_registry import ModelRegistry
+    from detection import DetectionProfile
+    from embedding_cache import EmbeddingCache, MISS
+    from group import assign_identities
+    from attendance_writer import AttendanceWriter, MARK_ID_SQL
+    from db_pool import ConnectionPool
 
 logger = logging.getLogger(__name__)
 
@@ -29,27 +57,111 @@ DB_CONFIG = {
     "port": os.getenv("DB_PORT", "5432"),
 }
 
+# Connection pool for request handlers (per worker process)
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+DB_POOL_MAX_LIFETIME = float(os.getenv("DB_POOL_MAX_LIFETIME", "1800"))
+DB_POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", "300"))
+DB_POOL_CHECK_AFTER = float(os.getenv("DB_POOL_CHECK_AFTER", "30"))  # idle seconds before SELECT 1 on checkout
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+
 MATCH_THRESHOLD = 0.65
 BLINK_THRESHOLD = 0.20
 REQUIRED_BLINKS = 2
 HEAD_FRAMES = 8
+IDENTIFY_THRESHOLD = 0.6
+# "session": search the roster of the running class first, see scoped_best_match()
+IDENTIFY_SCOPE = os.getenv("IDENTIFY_SCOPE", "global")
+SCOPES = ("global", "session")
+CLASS_SESSION_MINUTES = int(os.getenv("CLASS_SESSION_MINUTES", "90"))
+SCOPE_FALLBACK = os.getenv("SCOPE_FALLBACK", "true").lower() in ("1", "true", "yes")
 DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+# "memory": resident gallery in each worker; "pgvector": nearest-neighbour
+# query in Postgres, falling back to "memory" if the extension is missing.
+MATCH_ENGINE = os.getenv("MATCH_ENGINE", "memory")
+GALLERY_INDEX = os.getenv("GALLERY_INDEX", "exact")
+GALLERY_IVF_NLIST = int(os.getenv("GALLERY_IVF_NLIST", "0"))  # 0 = sqrt(templates)
+GALLERY_IVF_NPROBE = int(os.getenv("GALLERY_IVF_NPROBE", "8"))
+# Two-stage matching: students kept by the centroid pass (0 = score every template)
+MATCH_PREFILTER_K = int(os.getenv("MATCH_PREFILTER_K", "0"))
+MATCH_FUSION = os.getenv("MATCH_FUSION", "max")  # max, mean or weighted
+MATCH_FUSION_WEIGHT = float(os.getenv("MATCH_FUSION_WEIGHT", "0.5"))
+# Micro-batch facenet calls from concurrent request threads (gunicorn --threads)
+INFERENCE_BATCHING = os.getenv("INFERENCE_BATCHING", "false").lower() in ("1", "true", "yes")
+INFERENCE_MAX_BATCH = int(os.getenv("INFERENCE_MAX_BATCH", "16"))
+INFERENCE_MAX_WAIT_MS = float(os.getenv("INFERENCE_MAX_WAIT_MS", "5"))
+# float32, int16 or int8 gallery storage (16/8 bits per value, per-template scale);
+# "float16" is a deprecated alias of int16
+GALLERY_PRECISION = os.getenv("GALLERY_PRECISION", "float32")
+GALLERY_LISTEN = os.getenv("GALLERY_LISTEN", "true").lower() in ("1", "true", "yes")
+# facenet execution: eager, torchscript, onnx or onnx-int8 (see inference_backends.py)
+FACENET_BACKEND = os.getenv("FACENET_BACKEND", "eager")
+FACENET_ARTIFACT_DIR = os.getenv("FACENET_ARTIFACT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "artifacts"))
+FACENET_INTRA_OP_THREADS = int(os.getenv("FACENET_INTRA_OP_THREADS", "0"))  # 0 = runtime default
+FACENET_INTER_OP_THREADS = int(os.getenv("FACENET_INTER_OP_THREADS", "0"))
+# Preprocessed crops for int8 calibration, written by bench_quantized.py
+FACENET_CALIBRATION = os.getenv("FACENET_CALIBRATION", os.path.join(FACENET_ARTIFACT_DIR, "calibration.npy"))
+# MTCNN preset (fast, balanced or accurate, see detection.py); frames are
+# downscaled to DETECTION_MAX_SIDE before detection (0 = full resolution)
+DETECTION_PROFILE = os.getenv("DETECTION_PROFILE", "balanced")
+DETECTION_MAX_SIDE = os.getenv("DETECTION_MAX_SIDE")
+# Group photos: faces are small, so detect at a higher resolution (0 = full)
+GROUP_DETECTION_MAX_SIDE = int(os.getenv("GROUP_DETECTION_MAX_SIDE", "2048"))
+GROUP_MAX_FACES = int(os.getenv("GROUP_MAX_FACES", "100"))
+GROUP_CANDIDATES = int(os.getenv("GROUP_CANDIDATES", "5"))  # students considered per face
+
+# Buffer attendance marks and insert them in batches (see attendance_writer.py)
+ATTENDANCE_WRITE_BEHIND = os.getenv("ATTENDANCE_WRITE_BEHIND", "false").lower() in ("1", "true", "yes")
+ATTENDANCE_FLUSH_ROWS = int(os.getenv("ATTENDANCE_FLUSH_ROWS", "200"))
+ATTENDANCE_FLUSH_MS = int(os.getenv("ATTENDANCE_FLUSH_MS", "500"))
+ATTENDANCE_SPOOL_DIR = os.getenv("ATTENDANCE_SPOOL_DIR")  # unset = no crash spool
+ATTENDANCE_SPOOL_FSYNC = os.getenv("ATTENDANCE_SPOOL_FSYNC", "false").lower() in ("1", "true", "yes")
+# Marks the database rejects this many times are moved to the dead-letter file
+ATTENDANCE_MAX_ATTEMPTS = int(os.getenv("ATTENDANCE_MAX_ATTEMPTS", "5"))
+ATTENDANCE_DEAD_LETTER = os.getenv("ATTENDANCE_DEAD_LETTER", os.path.join(ATTENDANCE_SPOOL_DIR, "attendance.dead-letter.jsonl")
+                                   if ATTENDANCE_SPOOL_DIR else None)  # unset without a spool dir = log only
+
+# Bearer token for /api/admin/* (bulk import); unset disables those routes
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+# Results for resubmitted images (kiosk retries); 0 entries disables the cache
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "1024"))
+EMBEDDING_CACHE_TTL = float(os.getenv("EMBEDDING_CACHE_TTL", "300"))
 
 exit_attendance = False
 
 # ===================== MODELS =====================
 
-mtcnn = MTCNN(keep_all=False, device=DEVICE)
-facenet = InceptionResnetV1(pretrained="vggface2").eval().to(DEVICE)
+# Loaded on the first face request (or before fork, see gunicorn.conf.py)
+FACE_MODELS_WARMUP = os.getenv("FACE_MODELS_WARMUP", "true").lower() in ("1", "true", "yes")
+detection_profile = DetectionProfile(DETECTION_PROFILE, int(DETECTION_MAX_SIDE) if DETECTION_MAX_SIDE else None)
+group_detection_profile = DetectionProfile(DETECTION_PROFILE, GROUP_DETECTION_MAX_SIDE)
+models = ModelRegistry(DEVICE, warmup=FACE_MODELS_WARMUP, backend=FACENET_BACKEND,
+                       artifact_dir=FACENET_ARTIFACT_DIR,
+                       intra_op_threads=FACENET_INTRA_OP_THREADS or None,
+                       inter_op_threads=FACENET_INTER_OP_THREADS or None,
+                       calibration_path=FACENET_CALIBRATION,
+                       mtcnn_kwargs=detection_profile.mtcnn_kwargs())
 # predictor = dlib.shape_predictor(os.path.join(os.path.dirname(__file__), "shape_predictor_68_face_landmarks.dat"))
 
 # ===================== DATABASE =====================
 
 def connect_db():
+    # Dedicated connection (listener, attendance writer, scripts); requests use db_cursor()
     conn = psycopg2.connect(**DB_CONFIG)
     conn.autocommit = True
     return conn, conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
 
+db_pool = ConnectionPool(lambda: connect_db()[0], DB_POOL_MIN, DB_POOL_MAX, DB_POOL_MAX_LIFETIME,
+                         DB_POOL_MAX_IDLE, DB_POOL_CHECK_AFTER, DB_POOL_TIMEOUT)
+
+@contextmanager
+def db_cursor():
+    """Cursor on a pooled connection that is returned even if the block raises."""
+    with db_pool.connection() as conn:
+        with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+            yield cur
+
 def setup_db(cur):
     # Create tables only if they don't exist
     cur.execute("""
@@ -60,7 +172,10 @@ def setup_db(cur):
             emb_left FLOAT8[],
             emb_center FLOAT8[],
             emb_right FLOAT8[],
-            face_embeddings JSONB -- Kept for backward compatibility but deprecated
+            face_embeddings JSONB, -- Kept for backward compatibility but deprecated
+            tpl_left BYTEA, -- Packed little-endian float32 (TEMPLATE_FORMAT=bytea)
+            tpl_center BYTEA,
+            tpl_right BYTEA
         );
         
         CREATE TABLE IF NOT EXISTS attendance (
@@ -79,6 +194,9 @@ def setup_db(cur):
             notes TEXT
         );
         
+        CREATE INDEX IF NOT EXISTS classes_start_time_idx ON classes (start_time);
+        CREATE INDEX IF NOT EXISTS students_course_idx ON students (course);
+        
         -- Add comments to document the schema (only if they don't exist)
         DO $$
         BEGIN
@@ -104,6 +222,11 @@ def setup_db(cur):
             END IF;
         END $$;
     """)
+    cur.execute(template_storage.BYTEA_COLUMNS_SQL)
+    cur.execute(MARK_ID_SQL)
+    cur.execute(STUDENTS_NOTIFY_SQL)
+    if MATCH_ENGINE == "pgvector":
+        pgvector_store.setup_pgvector(cur)
 
 # ===================== UTILS =====================
 
@@ -118,78 +241,345 @@ def cosine_sim(a, b):
         return -1.0
     return float(np.dot(a, b))
 
-def get_embedding(face):
+def preprocess_face(face):
     face = cv2.resize(face, (160,160))
     face = cv2.cvtColor(face, cv2.COLOR_BGR2RGB)
-    t = torch.tensor(face).permute(2,0,1).float().unsqueeze(0)/255.0
-    t = t.to(DEVICE)
-    with torch.no_grad():
-        emb = facenet(t).cpu().numpy()[0]
-    return normalize(emb)
+    return np.ascontiguousarray(face.transpose(2,0,1), dtype=np.float32)/255.0
+
+def forward_faces(batch):
+    # (N,3,160,160) float32 -> (N,512) normalized embeddings
+    embs = models.facenet()(batch)
+    return np.stack([normalize(e) for e in embs])
+
+embedding_cache = EmbeddingCache(EMBEDDING_CACHE_SIZE, EMBEDDING_CACHE_TTL)
+
+scheduler = InferenceScheduler(forward_faces, INFERENCE_MAX_BATCH, INFERENCE_MAX_WAIT_MS)
+
+def get_embeddings(faces):
+    # One forward pass for all crops (shared with other requests when batching)
+    if len(faces) == 0:
+        return np.empty((0, 512), dtype=np.float32)
+    batch = [preprocess_face(f) for f in faces]
+    if INFERENCE_BATCHING:
+        return np.stack(scheduler.submit(batch))
+    return forward_faces(np.stack(batch))
+
+def get_embedding(face):
+    return get_embeddings([face])[0]
+
+def row_embeddings(r):
+    embs = []
+
+    # Prefer packed templates, then the FLOAT8[] columns
+    if r.get('tpl_center'):
+        for col in ('tpl_left', 'tpl_center', 'tpl_right'):
+            if r[col]: embs.append(template_storage.unpack(r[col]))
+
+    elif r['emb_center']:
+        if r['emb_left']: embs.append(np.array(r['emb_left']))
+        if r['emb_center']: embs.append(np.array(r['emb_center']))
+        if r['emb_right']: embs.append(np.array(r['emb_right']))
+
+    # Fallback to JSONB if new columns are empty
+    elif r['face_embeddings']:
+        embeddings_json = r['face_embeddings']
+        if isinstance(embeddings_json, list):
+            embs = [np.array(e) for e in embeddings_json]
+        elif isinstance(embeddings_json, dict):
+            for key in ['center', 'left', 'right']:
+                if key in embeddings_json and embeddings_json[key]:
+                    embs.append(np.array(embeddings_json[key]))
+    return embs
 
 def load_students(cur):
     # Updated to read from new columns
-    cur.execute("SELECT roll, name, course, emb_left, emb_center, emb_right, face_embeddings FROM students")
+    cur.execute(f"SELECT {template_storage.student_columns()} FROM students")
     rows = cur.fetchall()
-    students = []
-    for r in rows:
-        embs = []
-        
-        # Prefer new columns
-        if r['emb_center']:
-            if r['emb_left']: embs.append(np.array(r['emb_left']))
-            if r['emb_center']: embs.append(np.array(r['emb_center']))
-            if r['emb_right']: embs.append(np.array(r['emb_right']))
-        
-        # Fallback to JSONB if new columns are empty
-        elif r['face_embeddings']:
-            embeddings_json = r['face_embeddings']
-            if isinstance(embeddings_json, list):
-                embs = [np.array(e) for e in embeddings_json]
-            elif isinstance(embeddings_json, dict):
-                for key in ['center', 'left', 'right']:
-                    if key in embeddings_json and embeddings_json[key]:
-                        embs.append(np.array(embeddings_json[key]))
-                        
-        students.append((r, embs))
-    return students
+    return [(r, row_embeddings(r)) for r in rows]
+
+def fetch_student(cur, roll):
+    cur.execute(f"SELECT {template_storage.student_columns()} FROM students WHERE roll = %s", (roll,))
+    r = cur.fetchone()
+    return None if r is None else (r, row_embeddings(r))
+
+# ===================== GALLERY =====================
+
+# Built once per process on the first identify; registrations made through
+# this process are written through with gallery.upsert(), changes made by
+# other workers and services arrive through the students_changed NOTIFY.
+def _gallery_index():
+    if GALLERY_INDEX == "ivf":
+        return make_index("ivf", nlist=GALLERY_IVF_NLIST, nprobe=GALLERY_IVF_NPROBE)
+    return make_index(GALLERY_INDEX)
+
+gallery = Gallery(index=_gallery_index(), precision=GALLERY_PRECISION, prefilter_k=MATCH_PREFILTER_K,
+                  fusion=MATCH_FUSION, fusion_weight=MATCH_FUSION_WEIGHT)
+_listener = None
+_listener_lock = threading.Lock()
+
+def start_gallery_listener():
+    global _listener
+    with _listener_lock:
+        if _listener is None or not _listener.is_alive():
+            _listener = GalleryListener(gallery, connect_db, fetch_student)
+            _listener.start()
+    return _listener
+
+def get_gallery(cur):
+    if GALLERY_LISTEN and _listener is None:
+        start_gallery_listener()
+    return gallery.ensure_loaded(lambda: load_students(cur))
+
+_pgvector_ready = None
+
+def use_pgvector(cur):
+    global _pgvector_ready
+    if MATCH_ENGINE != "pgvector":
+        return False
+    if _pgvector_ready is None:
+        _pgvector_ready = pgvector_store.pgvector_available(cur)
+        if not _pgvector_ready:
+            logger.warning("MATCH_ENGINE=pgvector but student_templates is missing; using in-memory gallery")
+    return _pgvector_ready
+
+def best_match(cur, emb):
+    if use_pgvector(cur):
+        return pgvector_store.best_match(cur, emb)
+    return get_gallery(cur).best_match(emb)
+
+def best_matches(cur, embs):
+    if use_pgvector(cur):
+        return [pgvector_store.best_match(cur, e) for e in embs]
+    return get_gallery(cur).best_matches(embs)
+
+def top_matches(cur, embs, k=5):
+    if use_pgvector(cur):
+        return [pgvector_store.top_matches(cur, e, k) for e in embs]
+    return get_gallery(cur).top_matches(embs, k)
+
+# ===================== CLASS SESSIONS =====================
+
+def start_class_web(cur, course, notes=None):
+    cur.execute("""
+        INSERT INTO classes (course, notes) VALUES (%s, %s)
+        RETURNING id, course, start_time
+    """, (course, notes))
+    row = cur.fetchone()
+    return {'status': 'success', 'data': {'id': row['id'], 'course': row['course'],
+                                          'start_time': row['start_time'].isoformat()}}
+
+def active_courses(cur):
+    """Courses with a class started within the last CLASS_SESSION_MINUTES."""
+    cur.execute("""
+        SELECT DISTINCT course FROM classes
+        WHERE course IS NOT NULL
+          AND start_time <= NOW()
+          AND start_time > NOW() - %s * INTERVAL '1 minute'
+    """, (CLASS_SESSION_MINUTES,))
+    return sorted(r['course'] for r in cur.fetchall())
+
+def roster_match(cur, emb, courses):
+    if use_pgvector(cur):
+        return pgvector_store.best_match(cur, emb, courses)
+    return get_gallery(cur).partition(courses).best_match(emb)
+
+def scoped_best_match(cur, emb, scope="global", course=None):
+    """``best_match`` for a scope; returns ``(score, student, scope_used)``.
+
+    With ``scope="session"`` only the students of ``course`` (or, without
+    one, of every course with an active class) are searched. When no class
+    is running or nobody on the roster clears IDENTIFY_THRESHOLD, the whole
+    gallery is searched instead, unless SCOPE_FALLBACK is off.
+    """
+    if scope == "session":
+        courses = [course] if course else active_courses(cur)
+        if courses:
+            score, student = roster_match(cur, emb, courses)
+            if score > IDENTIFY_THRESHOLD or not SCOPE_FALLBACK:
+                return score, student, "session"
+        elif not SCOPE_FALLBACK:
+            return -1.0, None, "session"
+    score, student = best_match(cur, emb)
+    return score, student, "global"
 
 # ===================== REGISTRATION =====================
 
-def process_web_image(base64_str):
+def decode_image_bytes(img_data):
+    nparr = np.frombuffer(img_data, np.uint8)
+    return cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+
+def decode_image(base64_str):
+    # Raw uploads (bytes/bytearray) are decoded as they are
+    if isinstance(base64_str, (bytes, bytearray, memoryview)):
+        return decode_image_bytes(base64_str)
+    # Decode base64
+    if ',' in base64_str:
+        base64_str = base64_str.split(',')[1]
+    return decode_image_bytes(base64.b64decode(base64_str))
+
+def crop_face(frame, box):
+    if box is None:
+        return None
+
+    # Get largest face if multiple
+    x1,y1,x2,y2 = map(int, box[0])
+    h, w = frame.shape[:2]
+    x1, y1 = max(0, x1), max(0, y1)
+    x2, y2 = min(w, x2), min(h, y2)
+
+    face = frame[y1:y2, x1:x2]
+    if face.size == 0:
+        return None
+    return face
+
+def detection_input(frame, profile=None):
+    # Downscaled RGB copy for MTCNN and the scale to map its boxes back
+    small, scale = (profile or detection_profile).downscale(frame)
+    return cv2.cvtColor(small, cv2.COLOR_BGR2RGB), scale
+
+def detect_face(frame):
+    rgb, scale = detection_input(frame)
+    box, _ = models.mtcnn().detect(rgb)
+    return crop_face(frame, DetectionProfile.scale_boxes(box, scale))
+
+def detect_boxes(frame, profile=None):
+    """All face boxes in ``frame`` in original coordinates, largest first."""
+    rgb, scale = detection_input(frame, profile)
+    boxes, _ = models.mtcnn().detect(rgb)
+    boxes = DetectionProfile.scale_boxes(boxes, scale)
+    return [] if boxes is None else list(boxes)
+
+def detect_faces(frames):
+    """Largest face crop per frame (None where decoding or detection failed).
+
+    Frames of identical size go through MTCNN as one batch; MTCNN cannot
+    stack differently sized images, so mixed sizes are detected one by one.
+    """
+    valid = [i for i, f in enumerate(frames) if f is not None]
+    crops = [None] * len(frames)
+    if not valid:
+        return crops
+    if len(valid) > 1 and len({frames[i].shape for i in valid}) == 1:
+        inputs = [detection_input(frames[i]) for i in valid]
+        boxes, _ = models.mtcnn().detect([rgb for rgb, _ in inputs])
+        for i, box, (_, scale) in zip(valid, boxes, inputs):
+            crops[i] = crop_face(frames[i], DetectionProfile.scale_boxes(box, scale))
+    else:
+        for i in valid:
+            crops[i] = detect_face(frames[i])
+    return crops
+
+def image_bytes(image):
+    # Encoded image bytes of a raw upload or a base64 string (data-URL prefix ignored)
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return image
+    if ',' in image:
+        image = image.split(',')[1]
+    return base64.b64decode(image)
+
+def image_key(data):
+    # Content hash of the encoded image, the same for base64 and raw uploads
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+_decode_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="decode")
+
+def _safe_bytes(image):
     try:
-        # Decode base64
-        if ',' in base64_str:
-            base64_str = base64_str.split(',')[1]
-        img_data = base64.b64decode(base64_str)
-        nparr = np.frombuffer(img_data, np.uint8)
-        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        if frame is None:
-            return None
+        return image_bytes(image)
+    except Exception as e:
+        logger.warning(f"Could not decode base64 image: {e}")
+        return None
 
-        # Detect face
-        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        box, _ = mtcnn.detect(rgb)
-        
-        if box is None:
-            return None
-            
-        # Get largest face if multiple
-        x1,y1,x2,y2 = map(int, box[0])
-        h, w = frame.shape[:2]
-        x1, y1 = max(0, x1), max(0, y1)
-        x2, y2 = min(w, x2), min(h, y2)
-        
-        face = frame[y1:y2, x1:x2]
-        if face.size == 0:
-            return None
-            
-        return get_embedding(face)
+def _safe_decode(image):
+    try:
+        return decode_image(image)
+    except Exception as e:
+        logger.warning(f"Could not decode image: {e}")
+        return None
+
+def embed_images(images):
+    """Embeddings for a list of base64 or raw encoded images (None where no face was found).
+
+    Identical payloads are processed once, and results (including "no
+    face") are reused from ``embedding_cache`` when the same image is
+    submitted again. The remaining images are decoded concurrently,
+    detected in one MTCNN batch when they share a size and embedded in a
+    single facenet forward pass.
+    """
+    payloads = [_safe_bytes(i) if i else None for i in images]
+    keys = [image_key(p) if p else None for p in payloads]
+    results, pending = {}, {}
+    for key, data in zip(keys, payloads):
+        if key is None or key in results or key in pending:
+            continue
+        cached = embedding_cache.get(key)
+        if cached is MISS:
+            pending[key] = data
+        else:
+            results[key] = cached
+
+    if pending:
+        frames = list(_decode_pool.map(_safe_decode, pending.values()))
+        crops = detect_faces(frames)
+        found = [(key, crop) for key, crop in zip(pending, crops) if crop is not None]
+        embs = get_embeddings([crop for _, crop in found])
+        by_key = {key: emb for (key, _), emb in zip(found, embs)}
+        for key, frame in zip(pending, frames):
+            results[key] = by_key.get(key)
+            # Undecodable payloads are not cached, only real detection outcomes
+            if frame is not None:
+                embedding_cache.put(key, results[key])
+    return [results.get(key) for key in keys]
+
+def process_web_image(base64_str):
+    try:
+        return embed_images([base64_str])[0]
     except Exception as e:
         logger.error(f"Error processing web image: {e}", exc_info=True)
         return None
 
+def save_templates(cur, roll, name, course, emb_left, emb_center, emb_right):
+    if template_storage.TEMPLATE_FORMAT == "bytea":
+        # The pgvector sync trigger reads the FLOAT8[] columns, so keep them
+        # populated for that engine; otherwise clear them to avoid stale copies.
+        arrays = MATCH_ENGINE == "pgvector"
+        cur.execute("""
+            INSERT INTO students (roll, name, course, tpl_left, tpl_center, tpl_right,
+                                  emb_left, emb_center, emb_right)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+            ON CONFLICT (roll) DO UPDATE SET
+            name = EXCLUDED.name,
+            course = EXCLUDED.course,
+            tpl_left = EXCLUDED.tpl_left,
+            tpl_center = EXCLUDED.tpl_center,
+            tpl_right = EXCLUDED.tpl_right,
+            emb_left = EXCLUDED.emb_left,
+            emb_center = EXCLUDED.emb_center,
+            emb_right = EXCLUDED.emb_right
+        """, (roll, name, course,
+              template_storage.pack(emb_left), template_storage.pack(emb_center),
+              template_storage.pack(emb_right),
+              emb_left.tolist() if arrays else None, emb_center.tolist() if arrays else None,
+              emb_right.tolist() if arrays else None))
+        return
+
+    # Insert into new columns; clear packed copies (e.g. from migrate.py) so a
+    # later switch to TEMPLATE_FORMAT=bytea does not read stale templates
+    cur.execute("""
+        INSERT INTO students (roll, name, course, emb_left, emb_center, emb_right) 
+        VALUES (%s, %s, %s, %s, %s, %s)
+        ON CONFLICT (roll) DO UPDATE SET
+        name = EXCLUDED.name,
+        course = EXCLUDED.course,
+        emb_left = EXCLUDED.emb_left,
+        emb_center = EXCLUDED.emb_center,
+        emb_right = EXCLUDED.emb_right,
+        tpl_left = NULL,
+        tpl_center = NULL,
+        tpl_right = NULL
+    """,(roll, name, course,
+         emb_left.tolist(), emb_center.tolist(), emb_right.tolist()))
+
 def register_student_web(cur, roll, name, course, images):
     # images is dict with keys: center, left, right
     
@@ -199,32 +589,25 @@ def register_student_web(cur, roll, name, course, images):
     if 'center' in images and ('right' not in images or not images['right']):
         images['right'] = images['center']
 
-    emb_center = process_web_image(images['center'])
+    try:
+        emb_center, emb_left, emb_right = embed_images(
+            [images.get('center'), images.get('left'), images.get('right')])
+    except Exception as e:
+        logger.error(f"Error processing registration images: {e}", exc_info=True)
+        return {'status': 'error', 'message': str(e)}
+
     if emb_center is None:
         return {'status': 'error', 'message': 'Face not detected in Center photo'}
-        
-    emb_left = process_web_image(images['left'])
     if emb_left is None:
         return {'status': 'error', 'message': 'Face not detected in Left photo'}
-        
-    emb_right = process_web_image(images['right'])
     if emb_right is None:
         return {'status': 'error', 'message': 'Face not detected in Right photo'}
-        
+
     try:
-        # Insert into new columns
-        cur.execute("""
-            INSERT INTO students (roll, name, course, emb_left, emb_center, emb_right) 
-            VALUES (%s, %s, %s, %s, %s, %s)
-            ON CONFLICT (roll) DO UPDATE SET
-            name = EXCLUDED.name,
-            course = EXCLUDED.course,
-            emb_left = EXCLUDED.emb_left,
-            emb_center = EXCLUDED.emb_center,
-            emb_right = EXCLUDED.emb_right
-        """,(roll, name, course,
-             emb_left.tolist(), emb_center.tolist(), emb_right.tolist()))
-             
+        save_templates(cur, roll, name, course, emb_left, emb_center, emb_right)
+
+        gallery.upsert({'roll': roll, 'name': name, 'course': course},
+                       [emb_left, emb_center, emb_right])
         logger.info(f"Student {name} registered successfully via web")
         return {'status': 'success', 'message': f'Student {name} registered successfully'}
     except Exception as e:
@@ -233,6 +616,7 @@ def register_student_web(cur, roll, name, course, images):
 
 def delete_last_attendance(cur):
     try:
+        flush_attendance()
         cur.execute("""
             DELETE FROM attendance 
             WHERE id = (SELECT id FROM attendance ORDER BY time DESC LIMIT 1)
@@ -246,46 +630,164 @@ def delete_last_attendance(cur):
         logger.error(f"Error deleting last attendance: {e}", exc_info=True)
         raise
 
-def identify_student_web(cur, image_data):
+def identify_student_web(cur, image_data, scope=None, course=None):
     try:
         emb = process_web_image(image_data)
         if emb is None:
             return {'status': 'error', 'message': 'No face detected'}
             
-        students = load_students(cur)
-        best_score, best_student = -1, None
-
-        for s, embs in students:
-            for db_emb in embs:
-                score = cosine_sim(emb, db_emb)
-                if score > best_score:
-                    best_score, best_student = score, s
-
-        if best_score > 0.6:
-            timestamp = datetime.now()
-            # Mark attendance if identified
-            cur.execute("""
-                INSERT INTO attendance (roll, name, course, time, confidence)
-                VALUES (%s, %s, %s, %s, %s)
-                RETURNING id, time
-            """, (best_student["roll"], best_student["name"], 
-                  best_student["course"], timestamp, float(best_score)))
-            
-            attendance_record = cur.fetchone()
-            
-            return {
-                'status': 'success',
-                'message': f"Welcome {best_student['name']}",
-                'data': {
-                    'name': best_student['name'],
-                    'roll': best_student['roll'],
-                    'confidence': float(best_score),
-                    'time': attendance_record['time'].isoformat()
-                }
+        best_score, best_student, scope = scoped_best_match(cur, emb, scope or IDENTIFY_SCOPE, course)
+        result = identification_result(cur, best_score, best_student)
+        result['scope'] = scope
+        return result
+
+    except Exception as e:
+        logger.error(f"Error identifying student: {e}", exc_info=True)
+        return {'status': 'error', 'message': str(e)}
+
+# Started on the first mark in each worker (threads do not survive fork)
+_attendance_writer = None
+_attendance_writer_lock = threading.Lock()
+
+def attendance_writer():
+    global _attendance_writer
+    with _attendance_writer_lock:
+        if _attendance_writer is None or not _attendance_writer.is_alive():
+            _attendance_writer = AttendanceWriter(connect_db, ATTENDANCE_FLUSH_ROWS, ATTENDANCE_FLUSH_MS,
+                                                  ATTENDANCE_SPOOL_DIR, ATTENDANCE_SPOOL_FSYNC,
+                                                  max_attempts=ATTENDANCE_MAX_ATTEMPTS,
+                                                  dead_letter_path=ATTENDANCE_DEAD_LETTER)
+            _attendance_writer.start()
+    return _attendance_writer
+
+def flush_attendance():
+    # Make buffered marks visible before reading or deleting attendance rows
+    if _attendance_writer is not None:
+        _attendance_writer.flush()
+
+def mark_attendance(cur, student, score):
+    """Record a mark; returns ``{'id', 'time'}``.
+
+    With ATTENDANCE_WRITE_BEHIND the mark is buffered and ``id`` is None.
+    """
+    if ATTENDANCE_WRITE_BEHIND:
+        return attendance_writer().submit(student, score)
+    timestamp = datetime.now()
+    cur.execute("""
+        INSERT INTO attendance (roll, name, course, time, confidence)
+        VALUES (%s, %s, %s, %s, %s)
+        RETURNING id, time
+    """, (student["roll"], student["name"],
+          student["course"], timestamp, float(score)))
+    return cur.fetchone()
+
+def identification_result(cur, best_score, best_student):
+    if best_score > IDENTIFY_THRESHOLD:
+        # Mark attendance if identified
+        attendance_record = mark_attendance(cur, best_student, best_score)
+
+        return {
+            'status': 'success',
+            'message': f"Welcome {best_student['name']}",
+            'data': {
+                'name': best_student['name'],
+                'roll': best_student['roll'],
+                'confidence': float(best_score),
+                'time': attendance_record['time'].isoformat()
             }
+        }
+    else:
+        return {'status': 'error', 'message': 'Student not recognized', 'confidence': float(best_score)}
+
+def identify_batch_web(cur, images, fuse=True):
+    """Identify one person from several frames.
+
+    All frames go through ``embed_images`` (one MTCNN batch, one facenet
+    forward pass) and are matched in a single gallery product. ``results``
+    has one entry per image; attendance is marked once, for the fused
+    decision (mean of the embeddings) or, with ``fuse=False``, for the most
+    confident frame.
+    """
+    try:
+        all_embs = embed_images(images)
+        found = [i for i, e in enumerate(all_embs) if e is not None]
+        if not found:
+            return {'status': 'error', 'message': 'No face detected', 'results': [
+                {'index': i, 'status': 'error', 'message': 'No face detected'} for i in range(len(images))]}
+
+        embs = np.stack([all_embs[i] for i in found])
+        matches = dict(zip(found, best_matches(cur, embs)))
+
+        results = []
+        for i in range(len(images)):
+            if i not in matches:
+                results.append({'index': i, 'status': 'error', 'message': 'No face detected'})
+                continue
+            score, student = matches[i]
+            entry = {'index': i, 'confidence': float(score)}
+            if score > IDENTIFY_THRESHOLD:
+                entry.update(status='success', name=student['name'], roll=student['roll'])
+            else:
+                entry.update(status='error', message='Student not recognized')
+            results.append(entry)
+
+        if fuse:
+            best_score, best_student = best_match(cur, normalize(embs.mean(axis=0)))
         else:
-            return {'status': 'error', 'message': 'Student not recognized', 'confidence': float(best_score)}
-            
+            best_score, best_student = max(matches.values(), key=lambda m: m[0])
+
+        result = identification_result(cur, best_score, best_student)
+        result['fused'] = bool(fuse)
+        result['results'] = results
+        return result
+
     except Exception as e:
-        logger.error(f"Error identifying student: {e}", exc_info=True)
+        logger.error(f"Error identifying student batch: {e}", exc_info=True)
+        return {'status': 'error', 'message': str(e)}
+
+def identify_group_web(cur, image_data, mark=True):
+    """Identify every face in one photo (e.g. a classroom).
+
+    All faces are detected at ``GROUP_DETECTION_MAX_SIDE``, embedded in one
+    facenet forward pass and assigned to students one-to-one, so no student
+    is matched to two faces. Attendance is marked for each identified
+    student unless ``mark`` is false. ``results`` has one entry per face,
+    with its box in original image coordinates.
+    """
+    try:
+        frame = decode_image(image_data)
+        if frame is None:
+            return {'status': 'error', 'message': 'Could not decode image'}
+
+        boxes = detect_boxes(frame, group_detection_profile)[:GROUP_MAX_FACES]
+        faces = [(box, crop_face(frame, [box])) for box in boxes]
+        faces = [(box, crop) for box, crop in faces if crop is not None]
+        if not faces:
+            return {'status': 'error', 'message': 'No face detected', 'results': []}
+
+        embs = get_embeddings([crop for _, crop in faces])
+        assigned = assign_identities(top_matches(cur, embs, GROUP_CANDIDATES), IDENTIFY_THRESHOLD)
+
+        results = []
+        for i, ((box, _), (score, student)) in enumerate(zip(faces, assigned)):
+            entry = {'index': i, 'box': [round(float(v), 1) for v in box], 'confidence': float(score)}
+            if student is None:
+                entry.update(status='error', message='Student not recognized')
+            else:
+                entry.update(status='success', name=student['name'], roll=student['roll'])
+                if mark:
+                    entry['time'] = mark_attendance(cur, student, score)['time'].isoformat()
+            results.append(entry)
+
+        identified = sum(r['status'] == 'success' for r in results)
+        return {
+            'status': 'success' if identified else 'error',
+            'message': f"Identified {identified} of {len(results)} faces",
+            'faces': len(results),
+            'identified': identified,
+            'results': results,
+        }
+
+    except Exception as e:
+        logger.error(f"Error identifying group photo: {e}", exc_info=True)
         return {'status': 'error', 'message': str(e)}
@@ -3,6 +3,16 @@ import psycopg2.extras
 import os
 import json
 import numpy as np
+try:
+    from .gallery_listener import STUDENTS_NOTIFY_SQL
+    from . import pgvector_store
+    from . import template_storage
+    from .attendance_writer import MARK_ID_SQL
+except ImportError:
+    from gallery_listener import STUDENTS_NOTIFY_SQL
+    import pgvector_store
+    import template_storage
+    from attendance_writer import MARK_ID_SQL
 
 # Configuration
 DB_CONFIG = {
@@ -91,6 +101,9 @@ def migrate():
                 values.append(emb_right)
                 
             if updates:
+                if 'tpl_center' in columns:
+                    # Packed copies of the old templates would shadow these
+                    updates.append("tpl_left = NULL, tpl_center = NULL, tpl_right = NULL")
                 values.append(roll)
                 query = f"UPDATE students SET {', '.join(updates)} WHERE roll = %s"
                 cur.execute(query, tuple(values))
@@ -110,6 +123,32 @@ def migrate():
         cur.execute("ALTER TABLE attendance ADD COLUMN confidence FLOAT8")
     else:
         print("Column 'confidence' already exists in attendance table.")
+    
+    print("Adding 'mark_id' column for write-behind attendance...")
+    cur.execute(MARK_ID_SQL)
+
+    # 3. Change notifications for the in-memory face gallery
+    print("Installing 'students_changed' notification trigger...")
+    cur.execute(STUDENTS_NOTIFY_SQL)
+
+    # 4. Packed float32 templates (TEMPLATE_FORMAT=bytea)
+    print("Adding packed template columns 'tpl_left', 'tpl_center', 'tpl_right'...")
+    cur.execute(template_storage.BYTEA_COLUMNS_SQL)
+    # Array-mode writers clear tpl_*, so only fill them when they are read
+    if template_storage.TEMPLATE_FORMAT == "bytea":
+        print("Converting FLOAT8[] templates to packed float32...")
+        count = template_storage.convert_to_bytea(cur)
+        print(f"Converted templates for {count} students.")
+    else:
+        print("TEMPLATE_FORMAT=array; not converting templates to packed float32.")
+
+    # 5. pgvector templates (optional matching engine)
+    print("Setting up pgvector 'student_templates' table...")
+    if pgvector_store.setup_pgvector(cur):
+        count = pgvector_store.backfill_templates(cur)
+        print(f"Copied {count} templates into student_templates.")
+    else:
+        print("pgvector extension not available; keeping FLOAT8[] columns only.")
 
     print("Migration completed successfully.")
     cur.close()
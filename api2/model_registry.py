@@ -0,0 +1,115 @@
+import threading
+import time
+import numpy as np
+from facenet_pytorch import MTCNN, InceptionResnetV1
+import logging
+
+try:
+    from .inference_backends import make_backend, INPUT_SHAPE
+except ImportError:
+    from inference_backends import make_backend, INPUT_SHAPE
+
+logger = logging.getLogger(__name__)
+
+
+class ModelRegistry:
+    """Loads MTCNN and facenet on first use instead of at import time.
+
+    Workers that never serve a face request never pay for the models. Under
+    gunicorn with ``preload_app`` the master calls ``preload()`` before
+    forking, so workers share the weight pages copy-on-write, and each
+    worker runs ``warmup()`` after the fork (see ``gunicorn.conf.py``).
+
+    ``facenet()`` returns the configured inference backend (see
+    ``inference_backends.py``), built after the fork since tracing and
+    exporting run the model. ``pretrained=None`` keeps facenet randomly
+    initialized, for benchmarks that must not download weights.
+    """
+
+    def __init__(self, device="cpu", warmup=True, backend="eager", artifact_dir=".",
+                 intra_op_threads=None, inter_op_threads=None, calibration_path=None, mtcnn_kwargs=None, pretrained="vggface2"):
+        self.device = device
+        self.warmup_on_load = warmup
+        self.backend_name = backend
+        self.artifact_dir = artifact_dir
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+        self.calibration_path = calibration_path
+        self.mtcnn_kwargs = mtcnn_kwargs or {}
+        self.pretrained = pretrained
+        self._lock = threading.RLock()
+        self._mtcnn = None
+        self._facenet = None
+        self._backend = None
+        self._warm = False
+        self.load_seconds = None
+        self.backend_seconds = None
+        self.warmup_seconds = None
+
+    @property
+    def loaded(self):
+        return self._facenet is not None
+
+    def preload(self):
+        """Load weights without running them (safe before fork)."""
+        if self.loaded:
+            return
+        with self._lock:
+            if self.loaded:
+                return
+            start = time.perf_counter()
+            self._mtcnn = MTCNN(keep_all=False, device=self.device, **self.mtcnn_kwargs)
+            self._facenet = InceptionResnetV1(pretrained=self.pretrained).eval().to(self.device)
+            self.load_seconds = time.perf_counter() - start
+            logger.info(f"Face models loaded in {self.load_seconds:.2f}s")
+
+    def _build_backend(self):
+        self.preload()
+        with self._lock:
+            if self._backend is not None:
+                return self._backend
+            start = time.perf_counter()
+            self._backend = make_backend(self.backend_name, self._facenet, self.device, self.artifact_dir,
+                                         self.intra_op_threads, self.inter_op_threads, self.calibration_path)
+            self.backend_seconds = time.perf_counter() - start
+            logger.info(f"facenet backend '{self.backend_name}' ready in {self.backend_seconds:.2f}s")
+            return self._backend
+
+    def warmup(self):
+        """One detection and one forward pass so the first request is not the slow one."""
+        backend = self._build_backend()
+        with self._lock:
+            if self._warm:
+                return
+            start = time.perf_counter()
+            backend(np.zeros((1, *INPUT_SHAPE), dtype=np.float32))
+            self._mtcnn.detect(np.zeros((160, 160, 3), dtype=np.uint8))
+            self._warm = True
+            self.warmup_seconds = time.perf_counter() - start
+            logger.info(f"Face models warmed up in {self.warmup_seconds:.2f}s")
+
+    def _ready(self):
+        if not self._warm:
+            if self.warmup_on_load:
+                self.warmup()
+            else:
+                self._build_backend()
+
+    def mtcnn(self):
+        self._ready()
+        return self._mtcnn
+
+    def facenet(self):
+        """Callable mapping a float32 (N, 3, 160, 160) array to (N, 512) embeddings."""
+        self._ready()
+        return self._backend
+
+    def status(self):
+        return {
+            'loaded': self.loaded,
+            'warm': self._warm,
+            'backend': self.backend_name,
+            'load_seconds': self.load_seconds,
+            'backend_seconds': self.backend_seconds,
+            'warmup_seconds': self.warmup_seconds,
+        }
@@ -0,0 +1,159 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_DIM = 512
+
+# One row per pose template. Kept in sync with the FLOAT8[] columns of
+# students by a trigger, so every writer (api2, admin service, migrate.py)
+# is covered without having to know about this table. Students without
+# emb_center fall back to the legacy face_embeddings JSONB, as
+# logic.row_embeddings does: {"center": [...], "left": ...} or a bare list of
+# embeddings (stored as poses face1, face2, ...).
+TEMPLATES_SETUP_SQL = f"""
+    ALTER TABLE students ADD COLUMN IF NOT EXISTS face_embeddings JSONB;
+
+    CREATE TABLE IF NOT EXISTS student_templates (
+        roll TEXT REFERENCES students(roll) ON DELETE CASCADE ON UPDATE CASCADE,
+        pose TEXT,
+        embedding vector({EMBEDDING_DIM}),
+        PRIMARY KEY (roll, pose)
+    );
+
+    CREATE INDEX IF NOT EXISTS student_templates_embedding_hnsw
+        ON student_templates USING hnsw (embedding vector_cosine_ops);
+
+    CREATE OR REPLACE FUNCTION student_template_rows(
+        emb_l FLOAT8[], emb_c FLOAT8[], emb_r FLOAT8[], legacy JSONB
+    ) RETURNS TABLE (pose TEXT, emb FLOAT8[]) AS $$
+        SELECT p.pose, p.emb
+        FROM (VALUES ('left', emb_l), ('center', emb_c), ('right', emb_r)) AS p(pose, emb)
+        WHERE emb_c IS NOT NULL
+        UNION ALL
+        SELECT j.key, ARRAY(SELECT x::float8 FROM jsonb_array_elements_text(j.value) WITH ORDINALITY AS v(x, n)
+                            ORDER BY n)
+        FROM jsonb_each(CASE WHEN jsonb_typeof(legacy) = 'object' THEN legacy END) AS j
+        WHERE emb_c IS NULL AND j.key IN ('left', 'center', 'right') AND jsonb_typeof(j.value) = 'array'
+        UNION ALL
+        SELECT 'face' || e.i, ARRAY(SELECT x::float8 FROM jsonb_array_elements_text(e.value) WITH ORDINALITY AS v(x, n)
+                                    ORDER BY n)
+        FROM jsonb_array_elements(CASE WHEN jsonb_typeof(legacy) = 'array' THEN legacy END)
+            WITH ORDINALITY AS e(value, i)
+        WHERE emb_c IS NULL AND jsonb_typeof(e.value) = 'array'
+    $$ LANGUAGE sql IMMUTABLE;
+
+    CREATE OR REPLACE FUNCTION sync_student_templates() RETURNS trigger AS $$
+    BEGIN
+        DELETE FROM student_templates WHERE roll = NEW.roll;
+        INSERT INTO student_templates (roll, pose, embedding)
+        SELECT NEW.roll, p.pose, p.emb::vector
+        FROM student_template_rows(NEW.emb_left, NEW.emb_center, NEW.emb_right, NEW.face_embeddings) AS p
+        WHERE array_length(p.emb, 1) = {EMBEDDING_DIM};
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    DROP TRIGGER IF EXISTS students_sync_templates ON students;
+    CREATE TRIGGER students_sync_templates
+        AFTER INSERT OR UPDATE OF emb_left, emb_center, emb_right, face_embeddings ON students
+        FOR EACH ROW EXECUTE PROCEDURE sync_student_templates();
+"""
+
+# Copies templates that predate the trigger, in one set-based statement.
+BACKFILL_SQL = f"""
+    INSERT INTO student_templates (roll, pose, embedding)
+    SELECT s.roll, p.pose, p.emb::vector
+    FROM students s
+    CROSS JOIN LATERAL student_template_rows(s.emb_left, s.emb_center, s.emb_right, s.face_embeddings) AS p
+    WHERE array_length(p.emb, 1) = {EMBEDDING_DIM}
+    ON CONFLICT (roll, pose) DO UPDATE SET embedding = EXCLUDED.embedding
+"""
+
+# The inner query is what the HNSW index serves; students is joined onto
+# the k survivors only.
+SEARCH_SQL = """
+    SELECT t.roll, s.name, s.course, 1 - t.distance AS score
+    FROM (
+        SELECT roll, embedding <=> %(probe)s::vector AS distance
+        FROM student_templates
+        ORDER BY embedding <=> %(probe)s::vector
+        LIMIT %(k)s
+    ) t
+    JOIN students s ON s.roll = t.roll
+    ORDER BY t.distance
+"""
+
+# Restricted to a course roster. The roster's templates are materialized
+# first and ordered afterwards, so the search is an exact scan of the roster:
+# filtering the output of the HNSW index instead would only see the first
+# ef_search neighbours of the whole school and could miss the whole roster.
+SCOPED_SEARCH_SQL = """
+    WITH roster AS MATERIALIZED (
+        SELECT t.roll, s.name, s.course, t.embedding
+        FROM student_templates t
+        JOIN students s ON s.roll = t.roll
+        WHERE s.course = ANY(%(courses)s)
+    )
+    SELECT roll, name, course, 1 - (embedding <=> %(probe)s::vector) AS score
+    FROM roster
+    ORDER BY embedding <=> %(probe)s::vector
+    LIMIT %(k)s
+"""
+
+
+def setup_pgvector(cur):
+    """Install the extension, templates table, index and sync trigger.
+
+    Returns False (leaving the FLOAT8[] columns as the only storage) when
+    the extension is not available on this server.
+    """
+    try:
+        cur.execute("CREATE EXTENSION IF NOT EXISTS vector")
+    except Exception as e:
+        logger.warning(f"pgvector extension unavailable, using FLOAT8[] matching: {e}")
+        return False
+    cur.execute(TEMPLATES_SETUP_SQL)
+    return True
+
+
+def pgvector_available(cur):
+    cur.execute("""
+        SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'vector')
+           AND to_regclass('student_templates') IS NOT NULL AS available
+    """)
+    row = cur.fetchone()
+    return bool(row and row['available'])
+
+
+def backfill_templates(cur):
+    cur.execute(BACKFILL_SQL)
+    return cur.rowcount
+
+
+def vector_literal(emb):
+    return "[" + ",".join(f"{float(x):.8g}" for x in emb) + "]"
+
+
+def search(cur, emb, k=1, courses=None):
+    """Return up to ``k`` ``(score, student)`` pairs, best first."""
+    if courses is not None:
+        cur.execute(SCOPED_SEARCH_SQL, {'probe': vector_literal(emb), 'k': k, 'courses': list(courses)})
+    else:
+        cur.execute(SEARCH_SQL, {'probe': vector_literal(emb), 'k': k})
+    return [(float(r['score']), {'roll': r['roll'], 'name': r['name'], 'course': r['course']})
+            for r in cur.fetchall()]
+
+
+def top_matches(cur, emb, k=5):
+    """Up to ``k`` ``(score, student)`` pairs, one per student, best first."""
+    seen, matches = set(), []
+    for score, student in search(cur, emb, 3 * k):
+        if student['roll'] not in seen:
+            seen.add(student['roll'])
+            matches.append((score, student))
+    return matches[:k]
+
+
+def best_match(cur, emb, courses=None):
+    matches = search(cur, emb, 1, courses)
+    return matches[0] if matches else (-1.0, None)
@@ -0,0 +1,112 @@
+import numpy as np
+
+PRECISIONS = ("float32", "int16", "int8")
+# Deprecated names, see resolve_precision()
+PRECISION_ALIASES = {"float16": "int16"}
+
+# Compact precisions store per-row scaled integers: row ~= q * scale / levels.
+# There is no IEEE float16 storage: numpy widens it to float32 one element
+# at a time, which made scoring about 10x slower than float32, while int16
+# widens with SIMD
+QUANTIZED = {"int16": (np.int16, 32767), "int8": (np.int8, 127)}
+
+# Rows widened to float32 per step; small enough for the buffer to stay in cache
+CHUNK_ROWS = 512
+
+
+def resolve_precision(precision):
+    """The storage precision ``precision`` names (``float16`` is now ``int16``)."""
+    precision = PRECISION_ALIASES.get(precision, precision)
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown template precision '{precision}', expected one of: {', '.join(PRECISIONS)}")
+    return precision
+
+
+class TemplateMatrix:
+    """Gallery templates stored as float32 or as per-row scaled 16/8-bit integers.
+
+    Indexing (``m[rows]``, ``m[a:b]``) returns float32 rows, and
+    ``scores(queries)`` computes ``queries @ m.T`` by widening CHUNK_ROWS
+    rows at a time, so compact storage never materializes a full float32
+    copy. Compact rows keep one float32 scale each (see ``QUANTIZED``).
+    """
+
+    def __init__(self, data, scales=None, precision="float32"):
+        self.data = data
+        self.scales = scales
+        self.precision = precision
+
+    @classmethod
+    def encode(cls, matrix, precision="float32"):
+        matrix = np.asarray(matrix, dtype=np.float32)
+        precision = resolve_precision(precision)
+        if precision == "float32":
+            return cls(np.ascontiguousarray(matrix), None, precision)
+        dtype, levels = QUANTIZED[precision]
+        scales = np.abs(matrix).max(axis=1) if len(matrix) else np.empty(0, np.float32)
+        scales = np.where(scales == 0, 1.0, scales).astype(np.float32)
+        data = np.rint(matrix / scales[:, None] * levels).astype(dtype)
+        return cls(data, scales, precision)
+
+    @property
+    def shape(self):
+        return self.data.shape
+
+    @property
+    def dtype(self):
+        return self.data.dtype
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def __len__(self):
+        return self.data.shape[0]
+
+    def _decode(self, data, scales):
+        if self.precision == "float32":
+            return data
+        out = data.astype(np.float32)
+        out *= (scales / QUANTIZED[self.precision][1])[:, None]
+        return out
+
+    def __getitem__(self, rows):
+        return self._decode(self.data[rows], None if self.scales is None else self.scales[rows])
+
+    def scores(self, queries):
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        if self.precision == "float32":
+            return queries @ self.data.T
+        out = np.empty((len(queries), len(self)), dtype=np.float32)
+        buf = np.empty((CHUNK_ROWS, self.data.shape[1]), dtype=np.float32)
+        for start in range(0, len(self), CHUNK_ROWS):
+            chunk = self.data[start:start + CHUNK_ROWS]
+            wide = buf[:len(chunk)]
+            np.copyto(wide, chunk, casting='unsafe')
+            out[:, start:start + len(chunk)] = queries @ wide.T
+        out *= self.scales / QUANTIZED[self.precision][1]
+        return out
+
+    def select(self, keep):
+        return TemplateMatrix(self.data[keep], None if self.scales is None else self.scales[keep], self.precision)
+
+    def append(self, matrix):
+        other = TemplateMatrix.encode(matrix, self.precision)
+        scales = None if self.scales is None else np.concatenate([self.scales, other.scales])
+        return TemplateMatrix(np.ascontiguousarray(np.vstack([self.data, other.data])), scales, self.precision)
+
+    def save(self, path):
+        """Write the compact representation (``.npz``) to disk."""
+        arrays = {'data': self.data, 'precision': np.array(self.precision)}
+        if self.scales is not None:
+            arrays['scales'] = self.scales
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as f:
+            data, precision = f['data'], resolve_precision(str(f['precision']))
+            if data.dtype == np.float16:
+                # Written when the 16-bit precision stored IEEE half floats
+                return cls.encode(data, precision)
+            return cls(data, f['scales'] if 'scales' in f else None, precision)
@@ -0,0 +1,73 @@
+import os
+import numpy as np
+import psycopg2
+import psycopg2.extras
+import logging
+
+logger = logging.getLogger(__name__)
+
+# "array": templates in the FLOAT8[] emb_* columns (text-parsed by psycopg2).
+# "bytea": packed little-endian float32 in tpl_*, read back with np.frombuffer.
+TEMPLATE_FORMAT = os.getenv("TEMPLATE_FORMAT", "array")
+
+TEMPLATE_DTYPE = np.dtype('<f4')
+
+BYTEA_COLUMNS_SQL = """
+    ALTER TABLE students
+        ADD COLUMN IF NOT EXISTS tpl_left BYTEA,
+        ADD COLUMN IF NOT EXISTS tpl_center BYTEA,
+        ADD COLUMN IF NOT EXISTS tpl_right BYTEA
+"""
+
+# In bytea mode the FLOAT8[] and JSONB columns are only shipped for rows
+# that have not been converted yet.
+STUDENT_COLUMNS = {
+    'array': "roll, name, course, emb_left, emb_center, emb_right, face_embeddings",
+    'bytea': """roll, name, course, tpl_left, tpl_center, tpl_right,
+        CASE WHEN tpl_center IS NULL THEN emb_left END AS emb_left,
+        CASE WHEN tpl_center IS NULL THEN emb_center END AS emb_center,
+        CASE WHEN tpl_center IS NULL THEN emb_right END AS emb_right,
+        CASE WHEN tpl_center IS NULL AND emb_center IS NULL THEN face_embeddings END AS face_embeddings""",
+}
+
+
+def student_columns():
+    return STUDENT_COLUMNS[TEMPLATE_FORMAT]
+
+
+def pack(emb):
+    return psycopg2.Binary(np.asarray(emb, dtype=TEMPLATE_DTYPE).tobytes())
+
+
+def unpack(buf):
+    # psycopg2 hands bytea over as a memoryview; this is a zero-copy view of it
+    return np.frombuffer(buf, dtype=TEMPLATE_DTYPE)
+
+
+def convert_to_bytea(cur, batch_size=1000):
+    """Fill tpl_* from emb_* for every row not converted yet.
+
+    Walks the table in roll order with keyset pagination and writes each
+    page with one ``UPDATE ... FROM (VALUES ...)``. Returns rows converted.
+    """
+    converted, last = 0, ''
+    while True:
+        cur.execute("""
+            SELECT roll, emb_left, emb_center, emb_right FROM students
+            WHERE roll > %s AND tpl_center IS NULL AND emb_center IS NOT NULL
+            ORDER BY roll LIMIT %s
+        """, (last, batch_size))
+        rows = cur.fetchall()
+        if not rows:
+            return converted
+        values = [(r['roll'],
+                   pack(r['emb_left']) if r['emb_left'] else None,
+                   pack(r['emb_center']),
+                   pack(r['emb_right']) if r['emb_right'] else None) for r in rows]
+        psycopg2.extras.execute_values(cur, """
+            UPDATE students s SET tpl_left = v.l, tpl_center = v.c, tpl_right = v.r
+            FROM (VALUES %s) AS v(roll, l, c, r) WHERE s.roll = v.roll
+        """, values, template="(%s, %s::bytea, %s::bytea, %s::bytea)", page_size=batch_size)
+        converted += len(rows)
+        last = rows[-1]['roll']
+        logger.info(f"Converted {converted} students to packed templates")
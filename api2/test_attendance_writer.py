@@ -0,0 +1,154 @@
+import unittest
+import json
+import os
+import sys
+import tempfile
+import threading
+from unittest.mock import patch
+import psycopg2
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import attendance_writer
+from attendance_writer import AttendanceWriter
+from fake_db import FakeConn
+
+STUDENT = {'roll': 'A1', 'name': 'Alice', 'course': 'CS101'}
+
+
+class FakeDB:
+    def __init__(self):
+        self.batches = []
+        self.fail = 0
+        self.reject = set()  # rolls the database refuses (say, deleted students)
+        self.lock = threading.Lock()
+
+    def connect(self):
+        return FakeConn(), None
+
+    def insert(self, cur, rows):
+        with self.lock:
+            if self.fail:
+                self.fail -= 1
+                raise RuntimeError("db down")
+            if any(r['roll'] in self.reject for r in rows):
+                raise psycopg2.IntegrityError("violates foreign key constraint")
+            self.batches.append(list(rows))
+
+    def rows(self):
+        return [r for b in self.batches for r in b]
+
+
+def _writer(db, **kwargs):
+    return AttendanceWriter(db.connect, insert=db.insert, retry_delay=0.01, **kwargs)
+
+
+class TestAttendanceWriter(unittest.TestCase):
+    def test_acknowledges_then_flushes_in_one_batch(self):
+        db = FakeDB()
+        writer = _writer(db, flush_rows=5, flush_ms=10000)
+        acks = [writer.submit(STUDENT, 0.9) for _ in range(5)]
+        self.assertIsNone(acks[0]['id'])
+        self.assertEqual(db.batches, [])
+
+        writer.start()
+        self.assertTrue(writer.flush(2))
+        self.assertEqual(len(db.batches), 1)
+        self.assertEqual([r['mark_id'] for r in db.batches[0]], [a['mark_id'] for a in acks])
+        writer.stop()
+
+    def test_failed_flush_retried(self):
+        db = FakeDB()
+        db.fail = 2
+        writer = _writer(db, flush_rows=1, flush_ms=10)
+        writer.start()
+        writer.submit(STUDENT, 0.8)
+        self.assertTrue(writer.flush(2))
+        self.assertEqual(len(db.rows()), 1)
+        self.assertEqual(writer.metrics()['failures'], 2)
+        writer.stop()
+
+    def test_rejected_row_dead_lettered(self):
+        db = FakeDB()
+        db.reject = {'GONE'}
+        with tempfile.TemporaryDirectory() as tmp:
+            dead_letter = os.path.join(tmp, "attendance.dead-letter.jsonl")
+            writer = _writer(db, flush_rows=3, flush_ms=10, spool_dir=tmp, max_attempts=3,
+                             dead_letter_path=dead_letter)
+            good = [writer.submit(STUDENT, 0.9)['mark_id'] for _ in range(2)]
+            bad = writer.submit({'roll': 'GONE', 'name': 'Bob', 'course': None}, 0.8)['mark_id']
+            writer.start()
+            self.assertTrue(writer.flush(2))
+
+            # The good rows are not held back by the bad one
+            self.assertEqual(sorted(r['mark_id'] for r in db.rows()), sorted(good))
+            with open(dead_letter) as f:
+                rows = [json.loads(line) for line in f]
+            self.assertEqual([(r['mark_id'], r['attempts']) for r in rows], [(bad, 3)])
+            self.assertIn('foreign key', rows[0]['error'])
+            metrics = writer.metrics()
+            self.assertEqual((metrics['pending'], metrics['dead_lettered']), (0, 1))
+            self.assertEqual(os.path.getsize(writer.spool_path), 0)
+            writer.stop()
+
+    def test_lost_connection_not_counted_as_attempt(self):
+        db = FakeDB()
+        db.fail = 5
+        writer = _writer(db, flush_rows=1, flush_ms=10, max_attempts=1)
+        writer.start()
+        writer.submit(STUDENT, 0.8)
+        self.assertTrue(writer.flush(2))
+        self.assertEqual(len(db.rows()), 1)
+        self.assertEqual(writer.metrics()['dead_lettered'], 0)
+        writer.stop()
+
+    def test_spool_adopted_after_crash(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            crashed = _writer(FakeDB(), spool_dir=tmp)
+            mark_id = crashed.submit(STUDENT, 0.7)['mark_id']
+            # Simulate the dead process: release its lock under another pid's name
+            crashed._spool.close()
+            os.rename(crashed.spool_path, os.path.join(tmp, "attendance-1.jsonl"))
+
+            db = FakeDB()
+            writer = _writer(db, spool_dir=tmp, flush_ms=10)
+            writer.start()
+            self.assertTrue(writer.flush(2))
+            self.assertEqual([r['mark_id'] for r in db.rows()], [mark_id])
+            self.assertEqual(os.listdir(tmp), [os.path.basename(writer.spool_path)])
+            self.assertEqual(os.path.getsize(writer.spool_path), 0)
+            writer.stop()
+
+    def test_spool_removed_by_another_worker_skipped(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            gone = os.path.join(tmp, "attendance-1.jsonl")
+            real_glob = attendance_writer.glob.glob
+            # The other worker removes the spool between our glob and open
+            with patch.object(attendance_writer.glob, 'glob', lambda pattern: real_glob(pattern) + [gone]):
+                writer = _writer(FakeDB(), spool_dir=tmp)
+            self.assertEqual(writer.metrics()['pending'], 0)
+            writer._spool.close()
+
+    def test_spool_unlinked_while_waiting_for_lock_skipped(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "attendance-1.jsonl")
+            with open(path, "w") as f:
+                f.write('{"mark_id": "m1", "roll": "A1", "name": "Alice", "course": "CS101", '
+                        '"time": "2024-01-01T09:00:00", "confidence": 0.9}\n')
+            real_open = open
+
+            def open_then_unlink(p, *args, **kwargs):
+                # The previous owner replays and removes it once we hold the fd
+                f = real_open(p, *args, **kwargs)
+                if p == path:
+                    os.remove(path)
+                return f
+
+            with patch('builtins.open', open_then_unlink):
+                writer = _writer(FakeDB(), spool_dir=tmp)
+            self.assertEqual(writer.metrics()['pending'], 0)
+            writer._spool.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
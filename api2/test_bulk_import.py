@@ -0,0 +1,255 @@
+import unittest
+import csv
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+import numpy as np
+from unittest.mock import MagicMock, patch
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import bulk_import
+from fake_db import FakeConn, FakeCursor
+
+
+class FakeLogic:
+    """Stands in for ``logic`` in a pool process: one crop per decodable photo."""
+
+    def __init__(self, undetected=()):
+        self.undetected = set(undetected)
+        self.embedded = []
+
+    def decode_image_bytes(self, data):
+        if data.startswith(b'bad'):
+            raise ValueError("not an image")
+        return data
+
+    def detect_faces(self, frames):
+        return [None if f is None or f in self.undetected else f for f in frames]
+
+    def get_embeddings(self, crops):
+        self.embedded.append(list(crops))
+        return [np.full(4, float(len(c))) for c in crops]
+
+
+class TestManifest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _write(self, name, text):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        return path
+
+    def test_csv_with_bom_and_padding(self):
+        self._write('manifest.csv', '\ufeffroll, name ,course,center\n A1 ,Alice,CS101, a.jpg\n')
+        source = bulk_import.ImageSource(self.tmp.name)
+        self.assertEqual(bulk_import.read_manifest(source),
+                         [{'roll': 'A1', 'name': 'Alice', 'course': 'CS101', 'center': 'a.jpg'}])
+
+    def test_jsonl_skips_blank_lines(self):
+        path = self._write('students.jsonl', '{"roll": "A1", "center": "a.jpg"}\n\n{"roll": "B2", "center": "b.jpg"}\n')
+        records = bulk_import.read_manifest(bulk_import.ImageSource(self.tmp.name), path)
+        self.assertEqual([r['roll'] for r in records], ['A1', 'B2'])
+
+    def test_manifest_inside_archive_folder(self):
+        archive = os.path.join(self.tmp.name, 'photos.zip')
+        with zipfile.ZipFile(archive, 'w') as z:
+            z.writestr('batch/manifest.jsonl', '{"roll": "A1", "center": "./photos/a.jpg"}\n')
+            z.writestr('batch/photos/a.jpg', b'jpeg')
+        source = bulk_import.ImageSource(archive)
+        try:
+            record = bulk_import.read_manifest(source)[0]
+            self.assertEqual(source.read(record['center']), b'jpeg')
+        finally:
+            source.close()
+
+    def test_missing_manifest(self):
+        with self.assertRaises(ValueError):
+            bulk_import.read_manifest(bulk_import.ImageSource(self.tmp.name))
+
+
+class TestEmbedChunk(unittest.TestCase):
+    def _records(self, *rows):
+        return [({'roll': roll, 'name': roll, 'course': 'CS101'}, images) for roll, images in rows]
+
+    def test_results_map_back_to_their_slots(self):
+        fake = FakeLogic(undetected={b'blurry'})
+        records = self._records(
+            ('A1', {'left': b'l', 'center': b'cc', 'right': b'rrr'}),
+            # Reused photos are detected once; one pose has no face
+            ('B2', {'left': b'blurry', 'center': b'cccc', 'right': b'cccc'}),
+            ('C3', {'left': b'bad', 'center': b'ccccc', 'right': b'ccccc'}),
+            ('D4', {'left': b'dd', 'center': b'dd', 'right': b'dd'}),
+        )
+        with patch.object(bulk_import, '_logic', fake):
+            results = bulk_import.embed_chunk(records)
+
+        self.assertEqual([r['roll'] for r in results], ['A1', 'B2', 'C3', 'D4'])
+        self.assertEqual([results[0][f'emb_{p}'][0] for p in bulk_import.POSES], [1.0, 2.0, 3.0])
+        self.assertEqual(results[1]['error'], "Face not detected in Left photo")
+        self.assertEqual(results[2]['error'], "Face not detected in Left photo")
+        self.assertEqual([results[3][f'emb_{p}'][0] for p in bulk_import.POSES], [2.0, 2.0, 2.0])
+        # One forward pass for the chunk, without undetected or repeated photos
+        self.assertEqual(fake.embedded, [[b'l', b'cc', b'rrr', b'cccc', b'ccccc', b'dd']])
+
+
+class TestProgressJournal(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'progress.jsonl')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_resume_after_torn_write(self):
+        journal = bulk_import.ProgressJournal(self.path)
+        journal.record([{'roll': 'A1', 'status': 'ok'}, {'roll': 'B2', 'status': 'failed', 'error': 'x'}])
+        with open(self.path, 'a') as f:
+            f.write('{"roll": "C3", "sta')
+
+        resumed = bulk_import.ProgressJournal(self.path)
+        self.assertEqual(resumed.done, {'A1'})
+
+    def test_run_import_skips_journaled_rolls(self):
+        with open(os.path.join(self.tmp.name, 'manifest.csv'), 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['roll', 'name', 'course', 'center'])
+            writer.writerow(['A1', 'Alice', 'CS101', 'a.jpg'])
+            writer.writerow(['B2', 'Bob', 'CS101', 'missing.jpg'])
+        with open(os.path.join(self.tmp.name, 'a.jpg'), 'wb') as f:
+            f.write(b'jpeg')
+        bulk_import.ProgressJournal(self.path).record([{'roll': 'A1', 'status': 'ok'}])
+        conn = FakeConn()
+
+        report = bulk_import.run_import(self.tmp.name, state_path=self.path, workers=1,
+                                        connect=lambda: (conn, FakeCursor()))
+
+        self.assertEqual((report['total'], report['skipped'], report['imported']), (2, 1, 0))
+        self.assertEqual(report['failed'], [{'roll': 'B2', 'status': 'failed', 'error': 'Image not found: missing.jpg'}])
+        self.assertTrue(conn.closed)
+        with open(self.path) as f:
+            self.assertEqual([json.loads(line)['roll'] for line in f], ['A1', 'B2'])
+
+
+class TestLoadRows(unittest.TestCase):
+    def setUp(self):
+        self.rows = [{'roll': 'A1', 'name': 'Alice, Jr.', 'course': 'CS101',
+                      'emb_left': [0.5, -1.0], 'emb_center': [0.25, 0.0], 'emb_right': [1.0, 2.0]}]
+
+    def test_copy_then_upsert_in_one_transaction(self):
+        conn, cur = FakeConn(), FakeCursor()
+        bulk_import.load_rows(conn, cur, self.rows)
+
+        staging, copy, upsert = [sql for sql, _ in cur.executed]
+        self.assertIs(staging, bulk_import.STAGING_SQL)
+        self.assertIn(f"COPY students_import (roll, name, course, {', '.join(bulk_import.TEMPLATE_COLUMNS)})", copy)
+        self.assertIs(upsert, bulk_import.UPSERT_SQL)
+        self.assertEqual((conn.commits, conn.rollbacks), (1, 0))
+
+        row = next(csv.reader(io.StringIO(cur.copied)))
+        self.assertEqual(row[:3], ['A1', 'Alice, Jr.', 'CS101'])
+        for column, value in zip(bulk_import.TEMPLATE_COLUMNS, row[3:]):
+            pose = column.split('_', 1)[1]
+            self.assertEqual(value, bulk_import._template_literal(self.rows[0][f'emb_{pose}'], column))
+
+    def test_template_literals(self):
+        self.assertEqual(bulk_import._template_literal([0.5, -1.0], 'emb_left'), '{0.5,-1.0}')
+        packed = np.asarray([0.5, -1.0], dtype=bulk_import.TEMPLATE_DTYPE).tobytes().hex()
+        self.assertEqual(bulk_import._template_literal([0.5, -1.0], 'tpl_left'), '\\x' + packed)
+
+    def test_upsert_clears_the_other_representation(self):
+        for column in bulk_import.CLEARED_COLUMNS:
+            self.assertIn(f'{column} = NULL', bulk_import.UPSERT_SQL)
+        for column in bulk_import.TEMPLATE_COLUMNS:
+            self.assertIn(f'{column} = EXCLUDED.{column}', bulk_import.UPSERT_SQL)
+        self.assertEqual(len(bulk_import.TEMPLATE_COLUMNS + bulk_import.CLEARED_COLUMNS), 6)
+
+    def test_failed_upsert_rolls_back(self):
+        conn, cur = FakeConn(), FakeCursor(fail_on='ON CONFLICT')
+        with self.assertRaises(RuntimeError):
+            bulk_import.load_rows(conn, cur, self.rows)
+        self.assertEqual((conn.commits, conn.rollbacks), (0, 1))
+
+
+class TestBackgroundImports(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir_patch = patch.object(bulk_import, 'BULK_IMPORT_DIR', self.tmp.name)
+        self.dir_patch.start()
+        self.import_id, _ = bulk_import.new_import_dir()
+
+    def tearDown(self):
+        self.dir_patch.stop()
+        self.tmp.cleanup()
+
+    def test_second_start_refused_while_running(self):
+        release, finished = threading.Event(), threading.Event()
+
+        def run_import(*args, **kwargs):
+            release.wait(5)
+            return {'imported': 0}
+
+        with patch.object(bulk_import, 'run_import', run_import), \
+                patch.object(bulk_import, '_write_status', lambda i, s: s['status'] == 'completed' and finished.set()):
+            self.assertTrue(bulk_import.start_import(self.import_id, 'source.zip'))
+            # The lock is an flock on its own open file, so another worker process
+            # (a separate open file description) is refused the same way
+            self.assertFalse(bulk_import.start_import(self.import_id, 'source.zip'))
+            release.set()
+            self.assertTrue(finished.wait(5))
+            for _ in range(50):
+                if bulk_import.start_import(self.import_id, 'source.zip'):
+                    break
+                time.sleep(0.01)  # the lock is released just after the final status
+            else:
+                self.fail("lock not released after the import finished")
+
+
+class TestAdminRoutes(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        from flask import Flask
+        # face_routes imports logic; keep torch and facenet out of the test
+        with patch.dict(sys.modules, {'torch': MagicMock(), 'facenet_pytorch': MagicMock()}):
+            import face_routes
+        cls.face_routes = face_routes
+        app = Flask(__name__)
+        app.register_blueprint(face_routes.blp)
+        cls.client = app.test_client()
+
+    def test_disabled_without_token(self):
+        with patch.object(self.face_routes, 'ADMIN_TOKEN', None):
+            response = self.client.post('/api/admin/bulk_import/abc/resume')
+        self.assertEqual(response.status_code, 404)
+
+    def test_token_required(self):
+        with patch.object(self.face_routes, 'ADMIN_TOKEN', 's3cret'), \
+                patch.object(self.face_routes.bulk_import, 'import_status', return_value=None):
+            self.assertEqual(self.client.get('/api/admin/bulk_import/abc').status_code, 401)
+            wrong = {'Authorization': 'Bearer nope'}
+            self.assertEqual(self.client.get('/api/admin/bulk_import/abc', headers=wrong).status_code, 401)
+            right = {'Authorization': 'Bearer s3cret'}
+            self.assertEqual(self.client.get('/api/admin/bulk_import/abc', headers=right).status_code, 404)
+
+    def test_resume_of_running_import_conflicts(self):
+        with patch.object(self.face_routes, 'ADMIN_TOKEN', 's3cret'), \
+                patch.object(self.face_routes.bulk_import, 'import_status', return_value={'status': 'running'}), \
+                patch.object(self.face_routes.bulk_import, 'uploaded_files', return_value=('source.zip', None)), \
+                patch.object(self.face_routes.bulk_import, 'start_import', return_value=False):
+            response = self.client.post('/api/admin/bulk_import/abc/resume',
+                                        headers={'Authorization': 'Bearer s3cret'})
+        self.assertEqual(response.status_code, 409)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+import os
+import sys
+import threading
+import time
+from unittest.mock import patch
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from db_pool import ConnectionPool, PoolTimeout
+from fake_db import FakeConn
+
+
+class TestConnectionPool(unittest.TestCase):
+    def setUp(self):
+        self.conns = []
+
+        def connect():
+            self.conns.append(FakeConn())
+            return self.conns[-1]
+        self.connect = connect
+
+    def test_reuses_and_returns_on_error(self):
+        pool = ConnectionPool(self.connect, max_size=2)
+        with self.assertRaises(ValueError):
+            with pool.connection():
+                raise ValueError("handler failed")
+        with pool.connection() as conn:
+            self.assertIs(conn, self.conns[0])
+            self.assertEqual(pool.metrics()['in_use'], 1)
+        metrics = pool.metrics()
+        self.assertEqual((metrics['in_use'], metrics['idle'], metrics['opened']), (0, 1, 1))
+
+    def test_waits_then_times_out(self):
+        pool = ConnectionPool(self.connect, max_size=1, timeout=0.05)
+        conn = pool.getconn()
+        with self.assertRaises(PoolTimeout):
+            pool.getconn()
+
+        threading.Timer(0.02, pool.putconn, args=(conn,)).start()
+        pool.timeout = 2
+        self.assertIs(pool.getconn(), conn)
+        self.assertEqual(pool.metrics()['timeouts'], 1)
+
+    def test_health_check_and_lifetime(self):
+        pool = ConnectionPool(self.connect, check_after=10, max_lifetime=100)
+        now = time.monotonic()
+        with patch('db_pool.time.monotonic', return_value=now):
+            conn = pool.getconn()
+            pool.putconn(conn)
+        conn.fail = True
+        with patch('db_pool.time.monotonic', return_value=now + 20):
+            replacement = pool.getconn()
+        self.assertIsNot(replacement, conn)
+        self.assertTrue(conn.closed)
+        self.assertEqual(pool.metrics()['health_check_failures'], 1)
+        self.assertEqual(pool.metrics()['size'], 1)
+
+        with patch('db_pool.time.monotonic', return_value=now + 200):
+            pool.putconn(replacement)
+        self.assertTrue(replacement.closed)
+        self.assertEqual(pool.metrics()['size'], 0)
+
+    def test_warm_opens_min_size(self):
+        pool = ConnectionPool(self.connect, min_size=3)
+        pool.warm()
+        self.assertEqual(pool.metrics()['idle'], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
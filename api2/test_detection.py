@@ -0,0 +1,38 @@
+import unittest
+import numpy as np
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from detection import DetectionProfile, PROFILES
+
+
+class TestDetectionProfile(unittest.TestCase):
+    def test_large_frames_capped_at_max_side(self):
+        profile = DetectionProfile("balanced", max_side=800)
+        small, scale = profile.downscale(np.zeros((3000, 4000, 3), dtype=np.uint8))
+        self.assertEqual(small.shape, (600, 800, 3))
+        self.assertAlmostEqual(scale, 0.2)
+
+    def test_boxes_mapped_back_to_original(self):
+        boxes = np.array([[80.0, 60.0, 160.0, 140.0]])
+        np.testing.assert_allclose(DetectionProfile.scale_boxes(boxes, 0.2), [[400, 300, 800, 700]])
+        self.assertIsNone(DetectionProfile.scale_boxes(None, 0.2))
+
+    def test_small_frames_and_disabled_cap_untouched(self):
+        frame = np.zeros((480, 640, 3), dtype=np.uint8)
+        self.assertIs(DetectionProfile("balanced").downscale(frame)[0], frame)
+        big = np.zeros((3000, 4000, 3), dtype=np.uint8)
+        self.assertEqual(DetectionProfile("fast", max_side=0).downscale(big), (big, 1.0))
+
+    def test_presets(self):
+        for name in PROFILES:
+            kwargs = DetectionProfile(name).mtcnn_kwargs()
+            self.assertEqual(set(kwargs), {"min_face_size", "factor", "thresholds"})
+        with self.assertRaises(ValueError):
+            DetectionProfile("turbo")
+
+
+if __name__ == '__main__':
+    unittest.main()
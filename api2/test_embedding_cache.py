@@ -0,0 +1,40 @@
+import unittest
+import sys
+import os
+from unittest.mock import patch
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from embedding_cache import EmbeddingCache, MISS
+
+
+class TestEmbeddingCache(unittest.TestCase):
+    def test_lru_eviction(self):
+        cache = EmbeddingCache(max_entries=2)
+        cache.put('a', 1)
+        cache.put('b', None)  # "no face" is a cached outcome too
+        self.assertEqual(cache.get('a'), 1)
+        cache.put('c', 3)
+
+        self.assertIs(cache.get('b'), MISS)
+        self.assertEqual(cache.get('a'), 1)
+        metrics = cache.metrics()
+        self.assertEqual((metrics['hits'], metrics['misses'], metrics['evictions']), (2, 1, 1))
+
+    def test_entries_expire(self):
+        cache = EmbeddingCache(ttl=10)
+        with patch('embedding_cache.time.monotonic', return_value=100.0):
+            cache.put('a', None)
+            self.assertIsNone(cache.get('a'))
+        with patch('embedding_cache.time.monotonic', return_value=111.0):
+            self.assertIs(cache.get('a'), MISS)
+        self.assertEqual(cache.metrics()['expirations'], 1)
+
+    def test_disabled(self):
+        cache = EmbeddingCache(max_entries=0)
+        cache.put('a', 1)
+        self.assertIs(cache.get('a'), MISS)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,212 @@
+import unittest
+import numpy as np
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from ann import ExactIndex, IVFFlatIndex
+from gallery import Gallery
+from template_matrix import TemplateMatrix
+from gallery_listener import GalleryListener
+
+
+def _unit(seed):
+    v = np.random.default_rng(seed).standard_normal(512)
+    return v / np.linalg.norm(v)
+
+
+class TestGallery(unittest.TestCase):
+    def setUp(self):
+        self.gallery = Gallery()
+        self.gallery.build([
+            ({'roll': 'A1', 'name': 'Alice', 'course': 'CS101'}, [_unit(1), _unit(2), _unit(3)]),
+            ({'roll': 'B2', 'name': 'Bob', 'course': 'CS102'}, [_unit(4), _unit(5), _unit(6)]),
+            ({'roll': 'C3', 'name': 'Empty', 'course': 'CS103'}, []),
+        ])
+
+    def test_build_skips_students_without_templates(self):
+        self.assertEqual(len(self.gallery), 2)
+        self.assertEqual(self.gallery.size, 6)
+        self.assertEqual(self.gallery.matrix.dtype, np.float32)
+
+    def test_best_match_matches_scalar_cosine(self):
+        probe = _unit(5) + 0.1 * _unit(99)
+        score, student = self.gallery.best_match(probe)
+        self.assertEqual(student['roll'], 'B2')
+        expected = float(np.dot(probe / np.linalg.norm(probe), _unit(5)))
+        self.assertAlmostEqual(score, expected, places=5)
+
+    def test_upsert_replaces_templates(self):
+        self.gallery.upsert({'roll': 'A1', 'name': 'Alice', 'course': 'CS101'}, [_unit(7)])
+        self.assertEqual(self.gallery.size, 4)
+        _, student = self.gallery.best_match(_unit(7))
+        self.assertEqual(student['roll'], 'A1')
+        score, student = self.gallery.best_match(_unit(1))
+        self.assertLess(score, 0.5)
+
+    def test_top_matches_one_entry_per_student(self):
+        matches = self.gallery.top_matches(np.stack([_unit(2), _unit(5)]), k=5)
+        self.assertEqual([[s['roll'] for _, s in m] for m in matches], [['A1', 'B2'], ['B2', 'A1']])
+        self.assertAlmostEqual(matches[0][0][0], 1.0, places=5)
+
+    def test_empty_gallery(self):
+        score, student = Gallery().best_match(_unit(1))
+        self.assertEqual(score, -1.0)
+        self.assertIsNone(student)
+
+
+class TestTwoStageMatching(unittest.TestCase):
+    def setUp(self):
+        self.students = [({'roll': f'S{i}', 'name': f'Student {i}', 'course': 'CS101'},
+                          [_unit(10 * i + j) for j in range(3)]) for i in range(20)]
+        self.exact = Gallery()
+        self.exact.build(self.students)
+        self.gallery = Gallery(prefilter_k=5)
+        self.gallery.build(self.students)
+
+    def test_max_fusion_matches_exact_search(self):
+        probes = np.stack([_unit(10 * i + 1) + 0.3 * _unit(500 + i) for i in range(20)])
+        exact = self.exact.best_matches(probes)
+        reranked = self.gallery.best_matches(probes)
+        self.assertEqual([s['roll'] for _, s in reranked], [s['roll'] for _, s in exact])
+        for (a, _), (b, _) in zip(exact, reranked):
+            self.assertAlmostEqual(a, b, places=5)
+
+    def test_fusion_modes(self):
+        probe = _unit(30)
+        scores = self.exact.matrix[self.exact.owners == 3] @ probe
+        for fusion, expected in (('mean', scores.mean()),
+                                 ('weighted', 0.25 * scores.max() + 0.75 * scores.mean())):
+            gallery = Gallery(prefilter_k=5, fusion=fusion, fusion_weight=0.25)
+            gallery.build(self.students)
+            score, student = gallery.best_match(probe)
+            self.assertEqual(student['roll'], 'S3')
+            self.assertAlmostEqual(score, float(expected), places=5)
+        with self.assertRaises(ValueError):
+            Gallery(fusion='median')
+
+    def test_upsert_and_remove_keep_centroids_in_sync(self):
+        self.gallery.upsert({'roll': 'S3', 'name': 'Student 3', 'course': 'CS101'}, [_unit(900), _unit(901)])
+        self.gallery.upsert({'roll': 'N1', 'name': 'New', 'course': 'CS102'}, [_unit(902)])
+        self.gallery.remove('S5')
+        self.assertEqual(self.gallery.centroids.shape[0], 20)
+        self.assertEqual(self.gallery.best_match(_unit(901))[1]['roll'], 'S3')
+        self.assertEqual(self.gallery.best_match(_unit(902))[1]['roll'], 'N1')
+        self.assertNotEqual(self.gallery.best_match(_unit(51))[1]['roll'], 'S5')
+        matches = self.gallery.top_matches(_unit(31), k=3)[0]
+        self.assertEqual(len(matches), 3)
+        self.assertLess(matches[0][0], 0.5)  # S3's old templates are gone
+
+
+class TestPartitions(unittest.TestCase):
+    def setUp(self):
+        self.gallery = Gallery()
+        self.gallery.build([
+            ({'roll': 'A1', 'name': 'Alice', 'course': 'CS101'}, [_unit(1), _unit(2)]),
+            ({'roll': 'B2', 'name': 'Bob', 'course': 'CS102'}, [_unit(3)]),
+            ({'roll': 'C3', 'name': 'Carol', 'course': 'CS101'}, [_unit(4)]),
+        ])
+
+    def test_partition_holds_only_course_students(self):
+        part = self.gallery.partition(['CS101'])
+        self.assertEqual(len(part), 2)
+        self.assertEqual(part.size, 3)
+        self.assertEqual(part.best_match(_unit(4))[1]['roll'], 'C3')
+        self.assertNotEqual(part.best_match(_unit(3))[1]['roll'], 'B2')
+        self.assertIs(self.gallery.partition(['CS101', 'CS101']), part)
+        self.assertEqual(len(self.gallery.partition(['CS102', 'CS101'])), 3)
+
+    def test_changes_drop_affected_partitions(self):
+        cs101, cs102 = self.gallery.partition(['CS101']), self.gallery.partition(['CS102'])
+        self.gallery.upsert({'roll': 'B2', 'name': 'Bob', 'course': 'CS101'}, [_unit(5)])
+        self.assertIsNot(self.gallery.partition(['CS101']), cs101)
+        self.assertEqual(len(self.gallery.partition(['CS102'])), 0)
+        self.assertEqual(self.gallery.partition(['CS101']).best_match(_unit(5))[1]['roll'], 'B2')
+        self.gallery.remove('A1')
+        self.assertEqual(len(self.gallery.partition(['CS101'])), 2)
+        self.assertIsNot(cs102, self.gallery.partition(['CS102']))
+
+
+class TestCompactTemplates(unittest.TestCase):
+    def test_scores_close_to_float32(self):
+        matrix = np.stack([_unit(i) for i in range(50)]).astype(np.float32)
+        queries = np.stack([_unit(i) for i in range(100, 105)])
+        reference = queries @ matrix.T
+        for precision, tolerance in (('int16', 1e-4), ('int8', 1e-2)):
+            compact = TemplateMatrix.encode(matrix, precision)
+            np.testing.assert_allclose(compact.scores(queries), reference, atol=tolerance)
+            self.assertLess(compact.nbytes, matrix.nbytes)
+
+    def test_float16_is_an_alias_of_int16(self):
+        with self.assertLogs('gallery', 'WARNING'):
+            gallery = Gallery(precision='float16')
+        self.assertEqual(gallery.precision, 'int16')
+        self.assertEqual(gallery.matrix.dtype, np.int16)
+        with self.assertRaises(ValueError):
+            TemplateMatrix.encode(np.zeros((1, 4)), 'float8')
+
+    def test_int8_gallery_updates(self):
+        gallery = Gallery(precision='int8')
+        gallery.build([({'roll': 'A1', 'name': 'Alice', 'course': 'CS101'}, [_unit(1), _unit(2)])])
+        gallery.upsert({'roll': 'B2', 'name': 'Bob', 'course': 'CS102'}, [_unit(3)])
+        self.assertEqual(gallery.matrix.dtype, np.int8)
+        score, student = gallery.best_match(_unit(3))
+        self.assertEqual(student['roll'], 'B2')
+        self.assertAlmostEqual(score, 1.0, places=2)
+
+
+class TestGalleryListener(unittest.TestCase):
+    def setUp(self):
+        self.gallery = Gallery()
+        self.gallery.build([({'roll': 'A1', 'name': 'Alice', 'course': 'CS101'}, [_unit(1)])])
+        self.rows = {}
+        self.listener = GalleryListener(self.gallery, connect=None,
+                                        fetch_student=lambda cur, roll: self.rows.get(roll))
+
+    def test_insert_fetches_row(self):
+        self.rows['B2'] = ({'roll': 'B2', 'name': 'Bob', 'course': 'CS102'}, [_unit(2)])
+        self.listener.apply(None, 'B2', 'INSERT')
+        _, student = self.gallery.best_match(_unit(2))
+        self.assertEqual(student['roll'], 'B2')
+
+    def test_delete_removes_templates(self):
+        self.listener.apply(None, 'A1', 'DELETE')
+        self.assertEqual(len(self.gallery), 0)
+        self.assertEqual(self.gallery.best_match(_unit(1)), (-1.0, None))
+
+    def test_update_of_missing_row_removes(self):
+        self.listener.apply(None, 'A1', 'UPDATE')
+        self.assertEqual(self.gallery.size, 0)
+
+
+class TestIVFIndex(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.matrix = rng.standard_normal((2000, 512)).astype(np.float32)
+        self.matrix /= np.linalg.norm(self.matrix, axis=1, keepdims=True)
+        self.index = IVFFlatIndex(nlist=16, nprobe=16, min_train=100).build(self.matrix)
+
+    def test_full_probe_equals_exact(self):
+        queries = self.matrix[:20] + 0.01
+        _, exact_rows = ExactIndex().search(self.matrix, queries, 3)
+        _, ivf_rows = self.index.search(self.matrix, queries, 3)
+        np.testing.assert_array_equal(exact_rows, ivf_rows)
+
+    def test_updated_tracks_removed_and_added_rows(self):
+        keep = np.ones(len(self.matrix), dtype=bool)
+        keep[0] = False
+        matrix = np.vstack([self.matrix[keep], self.matrix[:1]])
+        index = self.index.updated(matrix, keep, 1)
+        _, rows = index.search(matrix, self.matrix[0], 1)
+        self.assertEqual(rows[0, 0], len(matrix) - 1)
+
+    def test_untrained_falls_back_to_exact(self):
+        gallery = Gallery(index=IVFFlatIndex(min_train=10**6))
+        gallery.build([({'roll': 'A1', 'name': 'Alice', 'course': 'CS101'}, [_unit(1)])])
+        self.assertFalse(gallery.index.trained)
+        self.assertEqual(gallery.best_match(_unit(1))[1]['roll'], 'A1')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,30 @@
+import unittest
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from group import assign_identities
+
+ALICE = {'roll': 'A1', 'name': 'Alice'}
+BOB = {'roll': 'B2', 'name': 'Bob'}
+
+
+class TestAssignIdentities(unittest.TestCase):
+    def test_no_student_matched_twice(self):
+        # Both faces prefer Alice; the second face is the better Alice
+        candidates = [[(0.80, ALICE), (0.75, BOB)], [(0.90, ALICE), (0.50, BOB)]]
+        result = assign_identities(candidates, threshold=0.6)
+        self.assertEqual([s['roll'] for _, s in result], ['B2', 'A1'])
+        self.assertEqual([score for score, _ in result], [0.75, 0.90])
+
+    def test_below_threshold_left_unassigned(self):
+        candidates = [[(0.9, ALICE)], [(0.85, ALICE), (0.55, BOB)], []]
+        result = assign_identities(candidates, threshold=0.6)
+        self.assertEqual(result[0], (0.9, ALICE))
+        self.assertEqual(result[1], (0.85, None))
+        self.assertEqual(result[2], (-1.0, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+import unittest
+import tempfile
+import threading
+import time
+import numpy as np
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+try:
+    import torch
+    from facenet_pytorch import InceptionResnetV1
+    from inference_backends import make_backend, build_artifact, model_key, calibration_key
+    HAVE_TORCH = isinstance(torch.__version__, str)  # not a test mock
+except ImportError:
+    HAVE_TORCH = False
+
+try:
+    import onnxruntime  # noqa: F401
+    import onnx  # noqa: F401
+    HAVE_ORT = True
+except ImportError:
+    HAVE_ORT = False
+
+
+def _cosine(a, b):
+    a = a / np.linalg.norm(a, axis=1, keepdims=True)
+    b = b / np.linalg.norm(b, axis=1, keepdims=True)
+    return np.sum(a * b, axis=1)
+
+
+@unittest.skipUnless(HAVE_TORCH, "torch and facenet-pytorch are required")
+class TestInferenceBackends(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        torch.manual_seed(0)
+        # Random weights: parity does not depend on the pretrained checkpoint
+        cls.model = InceptionResnetV1(pretrained=None).eval()
+        cls.batch = np.random.default_rng(0).random((3, 3, 160, 160), dtype=np.float32)
+        cls.reference = make_backend("eager", cls.model)(cls.batch)
+
+    def assertParity(self, embs):
+        self.assertEqual(embs.shape, (3, 512))
+        self.assertLess(np.abs(embs - self.reference).max(), 1e-3)
+        self.assertGreater(_cosine(embs, self.reference).min(), 0.9999)
+
+    def test_torchscript_matches_eager(self):
+        self.assertParity(make_backend("torchscript", self.model)(self.batch))
+
+    @unittest.skipUnless(HAVE_ORT, "onnx and onnxruntime are required")
+    def test_onnx_matches_eager(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            backend = make_backend("onnx", self.model, artifact_dir=tmp, intra_op_threads=1)
+            self.assertParity(backend(self.batch))
+            # Single-face batches go through the same dynamic batch axis
+            self.assertParity(np.concatenate([backend(self.batch[i:i + 1]) for i in range(3)]))
+
+    @unittest.skipUnless(HAVE_ORT, "onnx and onnxruntime are required")
+    def test_int8_close_to_eager_and_cached(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            calibration = os.path.join(tmp, "calibration.npy")
+            np.save(calibration, np.random.default_rng(1).random((8, 3, 160, 160), dtype=np.float32))
+            backend = make_backend("onnx-int8", self.model, artifact_dir=tmp, calibration_path=calibration)
+            embs = backend(self.batch)
+            self.assertEqual(embs.shape, (3, 512))
+            # Quantization trades a small accuracy delta, not parity
+            self.assertGreater(_cosine(embs, self.reference).min(), 0.9)
+
+            artifact = os.path.join(tmp, f"facenet_vggface2.{model_key(self.model)}.{calibration_key(calibration)}"
+                                         ".int8.onnx")
+            mtime = os.path.getmtime(artifact)
+            make_backend("onnx-int8", self.model, artifact_dir=tmp, calibration_path=calibration)
+            self.assertEqual(os.path.getmtime(artifact), mtime)
+
+            # New calibration crops build a new artifact next to the old one
+            np.save(calibration, np.random.default_rng(2).random((8, 3, 160, 160), dtype=np.float32))
+            make_backend("onnx-int8", self.model, artifact_dir=tmp, calibration_path=calibration)
+            self.assertEqual(len([n for n in os.listdir(tmp) if n.endswith(".int8.onnx")]), 2)
+
+    @unittest.skipUnless(HAVE_ORT, "onnx and onnxruntime are required")
+    def test_artifact_keys(self):
+        key = model_key(self.model)
+        self.assertEqual(model_key(self.model), key)
+        changed = InceptionResnetV1(pretrained=None).eval()
+        changed.load_state_dict(self.model.state_dict())
+        with torch.no_grad():
+            changed.last_linear.weight[0, 0] += 1
+        self.assertNotEqual(model_key(changed), key)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            calibration = os.path.join(tmp, "calibration.npy")
+            self.assertEqual(calibration_key(None), "dynamic")
+            self.assertEqual(calibration_key(calibration), "dynamic")
+            np.save(calibration, np.zeros((2, 3, 160, 160), dtype=np.float32))
+            first = calibration_key(calibration)
+            np.save(calibration, np.ones((2, 3, 160, 160), dtype=np.float32))
+            self.assertNotEqual(calibration_key(calibration), first)
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            make_backend("tensorrt", self.model)
+
+
+@unittest.skipUnless(HAVE_TORCH, "torch is required")
+class TestBuildArtifact(unittest.TestCase):
+    def test_concurrent_builders_build_once(self):
+        calls = []
+
+        def build(tmp):
+            calls.append(tmp)
+            with open(tmp, "w") as f:
+                f.write("half")
+                time.sleep(0.2)
+                f.write(" and whole")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "model.onnx")
+            threads = [threading.Thread(target=build_artifact, args=(path, build)) for _ in range(4)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            self.assertEqual(len(calls), 1)
+            with open(path) as f:
+                self.assertEqual(f.read(), "half and whole")
+            self.assertEqual(sorted(os.listdir(tmp)), ["model.onnx", "model.onnx.lock"])
+
+    def test_failed_build_leaves_no_artifact(self):
+        def build(tmp):
+            raise RuntimeError("export failed")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "model.onnx")
+            with self.assertRaises(RuntimeError):
+                build_artifact(path, build)
+            self.assertEqual(os.listdir(tmp), ["model.onnx.lock"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+import threading
+import numpy as np
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from inference_scheduler import InferenceScheduler
+
+
+class TestInferenceScheduler(unittest.TestCase):
+    def test_results_returned_in_order(self):
+        scheduler = InferenceScheduler(lambda batch: batch * 2, max_batch_size=4, max_wait_ms=1)
+        out = scheduler.submit([np.full(3, i, dtype=np.float32) for i in range(6)])
+        self.assertEqual([float(o[0]) for o in out], [0, 2, 4, 6, 8, 10])
+        self.assertLessEqual(max(int(k) for k in scheduler.metrics()['batch_size_histogram']), 4)
+
+    def test_concurrent_requests_share_batches(self):
+        gate = threading.Event()
+
+        def run_batch(batch):
+            gate.wait(1)
+            return batch + 1
+
+        scheduler = InferenceScheduler(run_batch, max_batch_size=8, max_wait_ms=50)
+        results = {}
+
+        def worker(i):
+            results[i] = scheduler.submit([np.array([i], dtype=np.float32)])[0]
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+        for t in threads:
+            t.start()
+        gate.set()
+        for t in threads:
+            t.join()
+
+        self.assertEqual({i: float(r[0]) for i, r in results.items()}, {i: i + 1.0 for i in range(8)})
+        metrics = scheduler.metrics()
+        self.assertEqual(metrics['items'], 8)
+        self.assertLess(metrics['batches'], 8)
+
+    def test_errors_reach_every_caller(self):
+        def run_batch(batch):
+            raise RuntimeError("boom")
+
+        scheduler = InferenceScheduler(run_batch, max_wait_ms=1)
+        with self.assertRaises(RuntimeError):
+            scheduler.submit([np.zeros(1)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+import unittest
+import os
+import sys
+import tempfile
+from contextlib import nullcontext
+from unittest.mock import MagicMock, patch
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import jobs
+
+
+class TestJobQueue(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.conn = jobs.connect(os.path.join(self.tmp.name, "jobs.sqlite3"))
+
+    def tearDown(self):
+        self.conn.close()
+        self.tmp.cleanup()
+
+    def test_submit_claim_finish(self):
+        first = jobs.submit(self.conn, 'identify', b'jpeg-1')
+        second = jobs.submit(self.conn, 'identify', b'jpeg-2')
+        self.assertEqual(jobs.get(self.conn, second)['position'], 1)
+
+        self.assertEqual(jobs.claim(self.conn, 'w0'), (first, 'identify', b'jpeg-1', {}))
+        self.assertEqual(jobs.get(self.conn, first)['status'], 'running')
+        jobs.finish(self.conn, first, result={'status': 'success'})
+
+        job = jobs.get(self.conn, first)
+        self.assertEqual((job['status'], job['result']), ('done', {'status': 'success'}))
+        self.assertEqual(jobs.claim(self.conn, 'w0')[0], second)
+        self.assertIsNone(jobs.claim(self.conn, 'w0'))
+        self.assertIsNone(jobs.get(self.conn, 'missing'))
+
+    def test_options_travel_with_the_job(self):
+        jobs.submit(self.conn, 'identify', b'jpeg', {'scope': 'session', 'course': 'CS101'})
+        self.assertEqual(jobs.claim(self.conn, 'w0')[3], {'scope': 'session', 'course': 'CS101'})
+
+    def test_queue_created_before_options_column(self):
+        path = os.path.join(self.tmp.name, "old.sqlite3")
+        old = jobs.sqlite3.connect(path)
+        old.executescript(jobs.SCHEMA_SQL.replace("options TEXT,", ""))
+        old.close()
+        conn = jobs.connect(path)
+        try:
+            jobs.submit(conn, 'identify', b'jpeg', {'scope': 'global'})
+            self.assertEqual(jobs.claim(conn, 'w0')[3], {'scope': 'global'})
+        finally:
+            conn.close()
+
+    def test_stale_running_job_requeued(self):
+        job_id = jobs.submit(self.conn, 'identify', b'jpeg')
+        jobs.claim(self.conn, 'dead-worker')
+        with patch.object(jobs.time, 'time', return_value=jobs.time.time() + jobs.JOB_TIMEOUT + 1):
+            self.assertEqual(jobs.claim(self.conn, 'w1')[0], job_id)
+
+    def test_queue_limit(self):
+        with patch.object(jobs, 'JOB_QUEUE_LIMIT', 1):
+            jobs.submit(self.conn, 'identify', b'a')
+            with self.assertRaises(jobs.QueueFull):
+                jobs.submit(self.conn, 'identify', b'b')
+        self.assertEqual(jobs.stats(self.conn)['queued'], 1)
+
+    def test_workers_alive(self):
+        self.assertEqual(jobs.workers_alive(self.conn), 0)
+        jobs.heartbeat(self.conn, 'w0')
+        jobs.heartbeat(self.conn, 'w0')
+        self.assertEqual(jobs.workers_alive(self.conn), 1)
+        later = jobs.time.time() + jobs.JOB_HEARTBEAT_TIMEOUT + 1
+        with patch.object(jobs.time, 'time', return_value=later):
+            self.assertEqual(jobs.workers_alive(self.conn), 0)
+
+    def test_busy_worker_counts_as_alive(self):
+        # A long job keeps the worker from polling; it is alive until the job times out
+        jobs.heartbeat(self.conn, 'w0')
+        jobs.submit(self.conn, 'identify', b'jpeg')
+        jobs.claim(self.conn, 'w0')
+        with patch.object(jobs.time, 'time', return_value=jobs.time.time() + jobs.JOB_HEARTBEAT_TIMEOUT + 1):
+            self.assertEqual(jobs.workers_alive(self.conn), 1)
+        with patch.object(jobs.time, 'time', return_value=jobs.time.time() + jobs.JOB_TIMEOUT + 1):
+            self.assertEqual(jobs.workers_alive(self.conn), 0)
+
+    def test_worker_loop_heartbeat(self):
+        stop = MagicMock()
+        stop.is_set.side_effect = [False, True]
+        path = os.path.join(self.tmp.name, "jobs.sqlite3")
+        with patch.object(jobs, 'JOBS_DB', path), patch.object(jobs, 'JOB_POLL_INTERVAL', 0):
+            jobs.worker_loop('w0', stop=stop)
+        self.assertEqual(jobs.workers_alive(self.conn), 1)
+
+
+class TestJobMode(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        from flask import Flask
+        # face_routes imports logic; keep torch and facenet out of the test
+        with patch.dict(sys.modules, {'torch': MagicMock(), 'facenet_pytorch': MagicMock()}):
+            import face_routes
+        cls.face_routes = face_routes
+        app = Flask(__name__)
+        app.register_blueprint(face_routes.blp)
+        cls.client = app.test_client()
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "jobs.sqlite3")
+        self.identify = MagicMock(return_value={'status': 'success', 'data': {'roll': 'A1'}})
+        self.patches = [patch.object(jobs, 'JOBS_DB', self.path),
+                        patch.object(self.face_routes, 'db_cursor', lambda: nullcontext(MagicMock())),
+                        patch.object(self.face_routes, 'identify_student_web', self.identify)]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        self.tmp.cleanup()
+
+    def post(self):
+        return self.client.post('/api/identify?mode=job', data=b'jpeg', content_type='application/octet-stream')
+
+    def test_queued_while_a_worker_is_alive(self):
+        conn = jobs.connect(self.path)
+        try:
+            jobs.heartbeat(conn, 'w0')
+            response = self.post()
+            self.assertEqual(response.status_code, 202)
+            self.assertEqual(jobs.stats(conn)['queued'], 1)
+        finally:
+            conn.close()
+        self.identify.assert_not_called()
+
+    def test_synchronous_without_workers(self):
+        with self.assertLogs(self.face_routes.logger, 'WARNING'):
+            response = self.post()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['data'], {'roll': 'A1'})
+        self.identify.assert_called_once()
+        conn = jobs.connect(self.path)
+        try:
+            self.assertEqual(jobs.stats(conn)['queued'], 0)
+        finally:
+            conn.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
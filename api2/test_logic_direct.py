@@ -1,8 +1,10 @@
 import unittest
 from unittest.mock import MagicMock, patch
 import numpy as np
+import base64
 import sys
 import os
+from datetime import datetime
 
 # Add the directory to path to import logic
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
@@ -22,16 +24,16 @@ class TestRegisterStudentWeb(unittest.TestCase):
         self.mock_cur = MagicMock()
         self.mock_conn = MagicMock()
         
-        # Setup mock for process_web_image
-        self.original_process_web_image = logic.process_web_image
-        logic.process_web_image = MagicMock()
+        # Setup mock for embed_images
+        self.original_embed_images = logic.embed_images
+        logic.embed_images = MagicMock()
         
     def tearDown(self):
-        logic.process_web_image = self.original_process_web_image
+        logic.embed_images = self.original_embed_images
 
     def test_register_student_success(self):
         # Mock embeddings
-        logic.process_web_image.side_effect = [
+        logic.embed_images.return_value = [
             np.array([0.1]*512), # center
             np.array([0.2]*512), # left
             np.array([0.3]*512)  # right
@@ -57,7 +59,7 @@ class TestRegisterStudentWeb(unittest.TestCase):
         
     def test_register_student_missing_face(self):
         # Mock embedding return None for center
-        logic.process_web_image.return_value = None
+        logic.embed_images.return_value = [None, None, None]
         
         images = {'center': 'base64data'}
         
@@ -74,7 +76,7 @@ class TestRegisterStudentWeb(unittest.TestCase):
 
     def test_register_student_single_image(self):
         # Mock embeddings (center used for all)
-        logic.process_web_image.side_effect = [
+        logic.embed_images.return_value = [
             np.array([0.1]*512), # center -> center
             np.array([0.1]*512), # center -> left
             np.array([0.1]*512)  # center -> right
@@ -94,6 +96,184 @@ class TestRegisterStudentWeb(unittest.TestCase):
         # Check if left and right were populated
         self.assertIn('left', images)
         self.assertIn('right', images)
+        logic.embed_images.assert_called_once_with(['base64data'] * 3)
+
+class TestEmbedImages(unittest.TestCase):
+    def setUp(self):
+        self.originals = (logic.decode_image, logic.detect_faces, logic.get_embeddings)
+        logic.decode_image = MagicMock(side_effect=lambda image: image)
+        logic.detect_faces = MagicMock(side_effect=lambda frames: [None if f == 'blank' else f for f in frames])
+        logic.get_embeddings = MagicMock(side_effect=lambda faces: np.stack([np.full(512, len(f), dtype=np.float32) for f in faces]))
+        logic.embedding_cache.clear()
+
+    def tearDown(self):
+        logic.decode_image, logic.detect_faces, logic.get_embeddings = self.originals
+
+    def test_duplicate_images_embedded_once(self):
+        embs = logic.embed_images(['data:image/jpeg;base64,aaaa', 'aaaa', 'bbbbbb=='])
+
+        logic.get_embeddings.assert_called_once()
+        self.assertEqual(len(logic.get_embeddings.call_args[0][0]), 2)
+        np.testing.assert_array_equal(embs[0], embs[1])
+        self.assertEqual(embs[2][0], 4)
+
+    def test_resubmitted_images_served_from_cache(self):
+        first = logic.embed_images(['aaaa', 'bbbbbb=='])
+        again = logic.embed_images([b'i\xa6\x9a', 'bbbbbb=='])  # raw bytes of 'aaaa'
+
+        logic.get_embeddings.assert_called_once()
+        np.testing.assert_array_equal(first[0], again[0])
+        self.assertEqual(logic.embedding_cache.metrics()['hits'], 2)
+
+    def test_missing_face_and_missing_image(self):
+        embs = logic.embed_images(['aaaa', 'blank', None])
+        self.assertIsNotNone(embs[0])
+        self.assertIsNone(embs[1])
+        self.assertIsNone(embs[2])
+
+class TestScopedBestMatch(unittest.TestCase):
+    def setUp(self):
+        self.originals = (logic.active_courses, logic.roster_match, logic.best_match, logic.SCOPE_FALLBACK)
+        self.alice = {'roll': 'A1', 'name': 'Alice', 'course': 'CS101'}
+        self.bob = {'roll': 'B2', 'name': 'Bob', 'course': 'CS102'}
+        logic.active_courses = MagicMock(return_value=['CS101'])
+        logic.roster_match = MagicMock(return_value=(0.9, self.alice))
+        logic.best_match = MagicMock(return_value=(0.8, self.bob))
+
+    def tearDown(self):
+        logic.active_courses, logic.roster_match, logic.best_match, logic.SCOPE_FALLBACK = self.originals
+
+    def test_session_scope_searches_active_roster(self):
+        score, student, scope = logic.scoped_best_match(None, 'emb', 'session')
+        self.assertEqual((student, scope), (self.alice, 'session'))
+        logic.roster_match.assert_called_once_with(None, 'emb', ['CS101'])
+        logic.best_match.assert_not_called()
+
+    def test_explicit_course_skips_session_lookup(self):
+        logic.scoped_best_match(None, 'emb', 'session', course='CS102')
+        logic.active_courses.assert_not_called()
+        logic.roster_match.assert_called_once_with(None, 'emb', ['CS102'])
+
+    def test_falls_back_to_global_search(self):
+        logic.roster_match.return_value = (0.3, self.alice)
+        self.assertEqual(logic.scoped_best_match(None, 'emb', 'session'), (0.8, self.bob, 'global'))
+        logic.active_courses.return_value = []
+        self.assertEqual(logic.scoped_best_match(None, 'emb', 'session'), (0.8, self.bob, 'global'))
+
+    def test_fallback_disabled(self):
+        logic.SCOPE_FALLBACK = False
+        logic.roster_match.return_value = (0.3, self.alice)
+        self.assertEqual(logic.scoped_best_match(None, 'emb', 'session'), (0.3, self.alice, 'session'))
+        logic.active_courses.return_value = []
+        self.assertEqual(logic.scoped_best_match(None, 'emb', 'session'), (-1.0, None, 'session'))
+        logic.best_match.assert_not_called()
+
+class TestIdentifyBatch(unittest.TestCase):
+    FACES = {b'alice-1': 1, b'alice-2': 1, b'bob': 2, b'stranger': 3}
+
+    def setUp(self):
+        self.originals = (logic.decode_image, logic.detect_faces, logic.get_embeddings, logic.mark_attendance)
+        logic.decode_image = MagicMock(side_effect=self._decode)
+        logic.detect_faces = MagicMock(side_effect=lambda frames: [f if f in self.FACES else None for f in frames])
+        logic.get_embeddings = MagicMock(side_effect=lambda faces: np.stack(
+            [self._unit(self.FACES[f]) for f in faces]) if faces else np.empty((0, 512), dtype=np.float32))
+        logic.mark_attendance = MagicMock(return_value={'id': 1, 'time': datetime(2024, 1, 1, 9, 0)})
+        logic.embedding_cache.clear()
+        self.gallery = logic.Gallery()
+        self.gallery.build([({'roll': 'A1', 'name': 'Alice', 'course': 'CS101'}, [self._unit(1)]),
+                            ({'roll': 'B2', 'name': 'Bob', 'course': 'CS101'}, [self._unit(2)])])
+        self.patches = [patch.object(logic, 'use_pgvector', return_value=False),
+                        patch.object(logic, 'get_gallery', return_value=self.gallery)]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        logic.decode_image, logic.detect_faces, logic.get_embeddings, logic.mark_attendance = self.originals
+
+    @staticmethod
+    def _unit(seed):
+        v = np.random.default_rng(seed).standard_normal(512).astype(np.float32)
+        return v / np.linalg.norm(v)
+
+    @staticmethod
+    def _decode(data):
+        if data == b'corrupt':
+            raise ValueError("not an image")
+        return data
+
+    @staticmethod
+    def _images(*payloads):
+        return [base64.b64encode(p).decode() for p in payloads]
+
+    def test_results_keep_image_order(self):
+        images = self._images(b'alice-1', b'blank', b'corrupt', b'bob', b'stranger', b'alice-2')
+        result = logic.identify_batch_web(None, images)
+
+        self.assertEqual([r['index'] for r in result['results']], list(range(6)))
+        self.assertEqual([r['status'] for r in result['results']],
+                         ['success', 'error', 'error', 'success', 'error', 'success'])
+        self.assertEqual([r.get('roll') for r in result['results']], ['A1', None, None, 'B2', None, 'A1'])
+        self.assertEqual(result['results'][1]['message'], 'No face detected')
+        self.assertEqual(result['results'][2]['message'], 'No face detected')
+        self.assertEqual(result['results'][4]['message'], 'Student not recognized')
+        # One forward pass for the frames with a face
+        logic.get_embeddings.assert_called_once()
+        self.assertEqual(len(logic.get_embeddings.call_args[0][0]), 4)
+
+        # The fused embedding (two of four frames are Alice) is matched once
+        self.assertTrue(result['fused'])
+        self.assertEqual((result['status'], result['data']['roll']), ('success', 'A1'))
+        logic.mark_attendance.assert_called_once()
+
+    def test_most_confident_frame_without_fusion(self):
+        result = logic.identify_batch_web(None, self._images(b'stranger', b'bob', b'blank'), fuse=False)
+        self.assertFalse(result['fused'])
+        self.assertEqual(result['data']['roll'], 'B2')
+        self.assertAlmostEqual(result['data']['confidence'], 1.0, places=5)
+
+    def test_no_face_in_any_image(self):
+        result = logic.identify_batch_web(None, self._images(b'blank', b'corrupt'))
+        self.assertEqual(result['status'], 'error')
+        self.assertEqual([r['index'] for r in result['results']], [0, 1])
+        logic.mark_attendance.assert_not_called()
+
+class TestSaveTemplates(unittest.TestCase):
+    def setUp(self):
+        self.cur = MagicMock()
+        self.embs = [np.full(512, v, dtype=np.float32) for v in (0.1, 0.2, 0.3)]
+
+    def test_reregistering_after_migrate_clears_packed_templates(self):
+        # migrate.py filled tpl_* from the old templates; they must not outlive the re-registration
+        with patch.object(logic.template_storage, 'TEMPLATE_FORMAT', 'array'):
+            logic.save_templates(self.cur, 'R1', 'Name', 'CS101', *self.embs)
+        sql, params = self.cur.execute.call_args[0]
+        for col in ('tpl_left', 'tpl_center', 'tpl_right'):
+            self.assertIn(f'{col} = NULL', sql)
+        self.assertEqual(params[3:], tuple(e.tolist() for e in self.embs))
+
+    def test_bytea_clears_arrays_without_pgvector(self):
+        with patch.object(logic.template_storage, 'TEMPLATE_FORMAT', 'bytea'), \
+                patch.object(logic, 'MATCH_ENGINE', 'memory'):
+            logic.save_templates(self.cur, 'R1', 'Name', 'CS101', *self.embs)
+        params = self.cur.execute.call_args[0][1]
+        self.assertEqual(params[6:], (None, None, None))
+
+class TestRowEmbeddings(unittest.TestCase):
+    def test_packed_templates_preferred(self):
+        packed = memoryview(np.arange(512, dtype='<f4').tobytes())
+        row = {'tpl_left': None, 'tpl_center': packed, 'tpl_right': packed,
+               'emb_left': None, 'emb_center': [0.5] * 512, 'emb_right': None, 'face_embeddings': None}
+        embs = logic.row_embeddings(row)
+        self.assertEqual(len(embs), 2)
+        self.assertEqual(embs[0].dtype, np.float32)
+        np.testing.assert_array_equal(embs[0], np.arange(512))
+
+    def test_array_columns_without_packed(self):
+        row = {'emb_left': [0.1] * 512, 'emb_center': [0.2] * 512, 'emb_right': [0.3] * 512,
+               'face_embeddings': None}
+        self.assertEqual(len(logic.row_embeddings(row)), 3)
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,87 @@
+import unittest
+from unittest.mock import MagicMock, patch
+import numpy as np
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+# Mock the model libraries before importing the registry
+sys.modules['torch'] = MagicMock()
+sys.modules['facenet_pytorch'] = MagicMock()
+
+import model_registry
+from model_registry import ModelRegistry
+
+
+class TestModelRegistry(unittest.TestCase):
+    def setUp(self):
+        self.backend = MagicMock(name='backend')
+        self.make_backend = MagicMock(return_value=self.backend)
+        self.mtcnn_cls = MagicMock(name='MTCNN')
+        self.facenet_cls = MagicMock(name='InceptionResnetV1')
+        self.patches = [patch.object(model_registry, 'MTCNN', self.mtcnn_cls),
+                        patch.object(model_registry, 'InceptionResnetV1', self.facenet_cls),
+                        patch.object(model_registry, 'make_backend', self.make_backend)]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+
+    def test_nothing_loaded_until_first_use(self):
+        registry = ModelRegistry(backend='onnx')
+        self.assertFalse(registry.loaded)
+        self.mtcnn_cls.assert_not_called()
+        self.facenet_cls.assert_not_called()
+
+        self.assertIs(registry.facenet(), self.backend)
+        self.assertTrue(registry.loaded)
+        self.facenet_cls.assert_called_once_with(pretrained='vggface2')
+        self.assertEqual(self.make_backend.call_args[0][:2], ('onnx', registry._facenet))
+
+    def test_preload_loads_weights_without_running_them(self):
+        registry = ModelRegistry()
+        registry.preload()
+        registry.preload()
+        self.assertTrue(registry.loaded)
+        self.facenet_cls.assert_called_once()
+        self.make_backend.assert_not_called()
+
+    def test_without_warmup_backend_is_built_but_not_run(self):
+        registry = ModelRegistry(warmup=False)
+        self.assertIs(registry.mtcnn(), self.mtcnn_cls.return_value)
+        self.assertIs(registry.facenet(), self.backend)
+        self.make_backend.assert_called_once()
+        self.backend.assert_not_called()
+        self.mtcnn_cls.return_value.detect.assert_not_called()
+        self.assertFalse(registry.status()['warm'])
+
+    def test_warmup_runs_once(self):
+        registry = ModelRegistry()
+        registry.warmup()
+        registry.warmup()
+        registry.facenet()
+        self.make_backend.assert_called_once()
+        self.backend.assert_called_once()
+        self.assertEqual(self.backend.call_args[0][0].shape, (1, *model_registry.INPUT_SHAPE))
+        self.assertEqual(self.backend.call_args[0][0].dtype, np.float32)
+        self.mtcnn_cls.return_value.detect.assert_called_once()
+
+    def test_status(self):
+        registry = ModelRegistry(backend='torchscript', pretrained=None)
+        self.assertEqual(registry.status(), {
+            'loaded': False, 'warm': False, 'backend': 'torchscript',
+            'load_seconds': None, 'backend_seconds': None, 'warmup_seconds': None,
+        })
+        registry.warmup()
+        status = registry.status()
+        self.assertTrue(status['loaded'] and status['warm'])
+        for key in ('load_seconds', 'backend_seconds', 'warmup_seconds'):
+            self.assertGreaterEqual(status[key], 0)
+        self.facenet_cls.assert_called_once_with(pretrained=None)
+
+
+if __name__ == '__main__':
+    unittest.main()
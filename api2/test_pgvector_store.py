@@ -0,0 +1,181 @@
+import unittest
+import os
+import sys
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pgvector_store
+from fake_db import FakeCursor
+
+try:
+    import psycopg2
+    import psycopg2.extras
+    HAVE_PSYCOPG2 = True
+except ImportError:
+    HAVE_PSYCOPG2 = False
+
+# e.g. "dbname=face_test user=postgres" on a server with the vector extension
+PGVECTOR_TEST_DSN = os.getenv("PGVECTOR_TEST_DSN")
+
+
+def _row(roll, score):
+    return {'roll': roll, 'name': f'Student {roll}', 'course': 'CS101', 'score': score}
+
+
+class TestPgvectorStore(unittest.TestCase):
+    def test_vector_literal(self):
+        self.assertEqual(pgvector_store.vector_literal([1, -0.5, 1e-9]), '[1,-0.5,1e-09]')
+        self.assertEqual(pgvector_store.vector_literal(np.float32([1 / 3])), '[0.33333334]')
+        self.assertEqual(pgvector_store.vector_literal([]), '[]')
+
+    def test_top_matches_one_entry_per_student(self):
+        cur = FakeCursor([_row('A1', 0.9), _row('A1', 0.8), _row('B2', 0.7), _row('A1', 0.6), _row('C3', 0.5)])
+        matches = pgvector_store.top_matches(cur, [0.5] * 512, k=2)
+        self.assertEqual([(score, s['roll']) for score, s in matches], [(0.9, 'A1'), (0.7, 'B2')])
+        # Templates per student are over-fetched so k students survive de-duplication
+        self.assertEqual(cur.executed[0][1]['k'], 6)
+
+    def test_best_match_without_templates(self):
+        self.assertEqual(pgvector_store.best_match(FakeCursor(), [0.5] * 512), (-1.0, None))
+
+    def test_best_match(self):
+        score, student = pgvector_store.best_match(FakeCursor([_row('A1', 0.75)]), [0.5] * 512)
+        self.assertEqual((score, student['roll']), (0.75, 'A1'))
+        self.assertNotIn('score', student)
+
+    def test_setup_without_extension(self):
+        cur = FakeCursor(fail_on='CREATE EXTENSION')
+        with self.assertLogs(pgvector_store.logger, 'WARNING'):
+            self.assertFalse(pgvector_store.setup_pgvector(cur))
+        self.assertEqual(cur.executed, [])
+
+    def test_setup_with_extension(self):
+        cur = FakeCursor()
+        self.assertTrue(pgvector_store.setup_pgvector(cur))
+        self.assertIs(cur.executed[-1][0], pgvector_store.TEMPLATES_SETUP_SQL)
+
+
+class TestScopedSearch(unittest.TestCase):
+    def test_courses_select_the_roster_query(self):
+        cur = FakeCursor([{'roll': 'A1', 'name': 'Alice', 'course': 'CS101', 'score': 0.9}])
+        matches = pgvector_store.search(cur, [0.5] * 512, 3, courses=('CS101',))
+        sql, params = cur.executed[0]
+        self.assertIs(sql, pgvector_store.SCOPED_SEARCH_SQL)
+        self.assertEqual(params['courses'], ['CS101'])
+        self.assertEqual(matches, [(0.9, {'roll': 'A1', 'name': 'Alice', 'course': 'CS101'})])
+
+    def test_roster_is_filtered_before_it_is_ordered(self):
+        sql = pgvector_store.SCOPED_SEARCH_SQL
+        self.assertIn('AS MATERIALIZED', sql)
+        self.assertLess(sql.index('= ANY(%(courses)s)'), sql.index('ORDER BY'))
+
+    def test_global_search_unchanged(self):
+        cur = FakeCursor()
+        pgvector_store.search(cur, [0.5] * 512, 1)
+        self.assertIs(cur.executed[0][0], pgvector_store.SEARCH_SQL)
+
+
+class TestLegacyTemplates(unittest.TestCase):
+    def test_trigger_and_backfill_read_the_jsonb_fallback(self):
+        setup, backfill = pgvector_store.TEMPLATES_SETUP_SQL, pgvector_store.BACKFILL_SQL
+        self.assertIn('student_template_rows(NEW.emb_left, NEW.emb_center, NEW.emb_right, NEW.face_embeddings)',
+                      setup)
+        self.assertIn('student_template_rows(s.emb_left, s.emb_center, s.emb_right, s.face_embeddings)', backfill)
+        self.assertIn('UPDATE OF emb_left, emb_center, emb_right, face_embeddings', setup)
+        # The helper exists before the trigger function that calls it
+        self.assertLess(setup.index('FUNCTION student_template_rows'), setup.index('FUNCTION sync_student_templates'))
+
+
+@unittest.skipUnless(HAVE_PSYCOPG2 and PGVECTOR_TEST_DSN, "set PGVECTOR_TEST_DSN to a Postgres with pgvector")
+class TestLegacyTemplatesPostgres(unittest.TestCase):
+    def setUp(self):
+        self.conn = psycopg2.connect(PGVECTOR_TEST_DSN)
+        self.cur = self.conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        self.cur.execute("CREATE EXTENSION IF NOT EXISTS vector")
+        self.cur.execute("CREATE SCHEMA pgvector_legacy_test; SET search_path TO pgvector_legacy_test, public")
+        self.cur.execute("""
+            CREATE TABLE students (roll TEXT PRIMARY KEY, name TEXT, course TEXT,
+                                   emb_left FLOAT8[], emb_center FLOAT8[], emb_right FLOAT8[], face_embeddings JSONB)
+        """)
+        rng = np.random.default_rng(0)
+        self.emb = lambda: [float(x) for x in rng.standard_normal(pgvector_store.EMBEDDING_DIM)]
+
+    def tearDown(self):
+        self.conn.rollback()
+        self.conn.close()
+
+    def insert(self, roll, center=None, legacy=None):
+        self.cur.execute("INSERT INTO students (roll, name, emb_center, face_embeddings) VALUES (%s, %s, %s, %s)",
+                         (roll, roll, center, None if legacy is None else psycopg2.extras.Json(legacy)))
+
+    def templates(self):
+        self.cur.execute("SELECT roll, pose FROM student_templates ORDER BY roll, pose")
+        return [(r['roll'], r['pose']) for r in self.cur.fetchall()]
+
+    def test_backfill_and_trigger_cover_jsonb_only_students(self):
+        self.insert('ARRAY', center=self.emb(), legacy={'left': self.emb()})
+        self.insert('DICT', legacy={'center': self.emb(), 'right': self.emb()})
+        self.insert('LIST', legacy=[self.emb(), self.emb()])
+        pgvector_store.setup_pgvector(self.cur)
+        pgvector_store.backfill_templates(self.cur)
+        expected = [('ARRAY', 'center'), ('DICT', 'center'), ('DICT', 'right'), ('LIST', 'face1'), ('LIST', 'face2')]
+        self.assertEqual(self.templates(), expected)
+
+        # Writers that still only fill the JSONB are picked up by the trigger
+        probe = self.emb()
+        self.insert('NEW', legacy={'center': probe})
+        self.assertIn(('NEW', 'center'), self.templates())
+        score, student = pgvector_store.best_match(self.cur, probe)
+        self.assertEqual(student['roll'], 'NEW')
+        self.assertAlmostEqual(score, 1.0, places=5)
+
+
+@unittest.skipUnless(HAVE_PSYCOPG2 and PGVECTOR_TEST_DSN, "set PGVECTOR_TEST_DSN to a Postgres with pgvector")
+class TestScopedSearchPostgres(unittest.TestCase):
+    DIM = 8
+
+    def setUp(self):
+        self.conn = psycopg2.connect(PGVECTOR_TEST_DSN)
+        self.cur = self.conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        self.cur.execute("CREATE EXTENSION IF NOT EXISTS vector")
+        self.cur.execute("CREATE SCHEMA pgvector_scope_test; SET search_path TO pgvector_scope_test, public")
+        self.cur.execute(f"""
+            CREATE TABLE students (roll TEXT PRIMARY KEY, name TEXT, course TEXT);
+            CREATE TABLE student_templates (roll TEXT, pose TEXT, embedding vector({self.DIM}));
+            CREATE INDEX ON student_templates USING hnsw (embedding vector_cosine_ops);
+        """)
+        rng = np.random.default_rng(0)
+        self.probe = np.ones(self.DIM)
+        students, templates = [], []
+        # 2000 students close to the probe, and a roster of 5 pointing away from it
+        for i in range(2005):
+            roster = i >= 2000
+            students.append((f"S{i}", f"Student {i}", 'ROSTER' if roster else 'OTHER'))
+            for pose in ('left', 'center', 'right'):
+                emb = rng.standard_normal(self.DIM) * 0.1 + (-self.probe if roster else self.probe)
+                templates.append((f"S{i}", pose, pgvector_store.vector_literal(emb)))
+        psycopg2.extras.execute_values(self.cur, "INSERT INTO students VALUES %s", students)
+        psycopg2.extras.execute_values(self.cur, "INSERT INTO student_templates VALUES %s", templates)
+        self.cur.execute("ANALYZE students; ANALYZE student_templates")
+        # The plan an index-friendly query would get on a large table
+        self.cur.execute("SET enable_seqscan = off; SET hnsw.ef_search = 10")
+
+    def tearDown(self):
+        self.conn.rollback()
+        self.conn.close()
+
+    def test_roster_search_is_exact(self):
+        matches = pgvector_store.search(self.cur, self.probe, 15, courses=['ROSTER'])
+        self.assertEqual(len(matches), 15)
+        self.assertEqual({s['course'] for _, s in matches}, {'ROSTER'})
+        self.assertEqual({s['roll'] for _, s in matches}, {f"S{i}" for i in range(2000, 2005)})
+
+    def test_best_match_finds_roster_member(self):
+        score, student = pgvector_store.best_match(self.cur, self.probe, ['ROSTER'])
+        self.assertEqual(student['course'], 'ROSTER')
+        self.assertLess(score, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+import unittest
+import numpy as np
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from tracking import FaceTracker, iou
+
+
+class TestFaceTracker(unittest.TestCase):
+    def test_iou(self):
+        self.assertAlmostEqual(iou([0, 0, 10, 10], [5, 0, 15, 10]), 1 / 3)
+        self.assertEqual(iou([0, 0, 10, 10], [20, 20, 30, 30]), 0.0)
+
+    def test_embeds_new_tracks_and_refreshes(self):
+        tracker = FaceTracker(refresh_frames=10)
+        due = [len(tracker.update([[100 + i, 100, 200 + i, 200]], i)) for i in range(25)]
+        # One person drifting slowly: embedded at frames 0, 10 and 20 only
+        self.assertEqual([i for i, n in enumerate(due) if n], [0, 10, 20])
+        self.assertEqual(len(tracker.all_tracks()), 1)
+
+    def test_separate_people_and_centroid_fallback(self):
+        tracker = FaceTracker(refresh_frames=100)
+        first = tracker.update([[0, 0, 100, 100], [300, 0, 400, 100]], 0)
+        self.assertEqual(len(first), 2)
+        # Both moved 40px: the left face no longer overlaps enough but is still nearest
+        self.assertEqual(tracker.update([[70, 0, 170, 100], [310, 0, 410, 100]], 5), [])
+        self.assertEqual(len(tracker.tracks), 2)
+
+    def test_lost_tracks_finish_and_votes(self):
+        tracker = FaceTracker(max_missing=3)
+        track = tracker.update([[0, 0, 100, 100]], 0)[0]
+        student = {'roll': 'R1', 'name': 'A'}
+        track.vote(np.ones(512), 0.8, student, 0.6)
+        track.vote(np.ones(512), 0.4, {'roll': 'R2'}, 0.6)
+        self.assertEqual(track.identity(), (0.8, student, 1))
+
+        tracker.update([], 10)
+        self.assertEqual(tracker.tracks, [])
+        self.assertEqual(tracker.all_tracks(), [track])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,180 @@
+import unittest
+from unittest.mock import MagicMock, patch
+import io
+import os
+import sys
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+# Mock the model libraries before importing video (video -> logic -> torch)
+sys.modules['torch'] = MagicMock()
+sys.modules['facenet_pytorch'] = MagicMock()
+
+import video
+from video import FrameSampler, VideoTooLarge, spool_to_file, identify_video
+from tracking import FaceTracker
+
+
+def _frame(level):
+    return np.full((120, 160, 3), level, dtype=np.uint8)
+
+
+class TestFrameSampler(unittest.TestCase):
+    def test_near_duplicates_skipped_until_max_gap(self):
+        sampler = FrameSampler(min_gap=1, max_gap=10, diff_threshold=5)
+        taken = [i for i in range(25) if sampler.due(i) and sampler.accept(i, _frame(100))]
+        self.assertEqual(taken, [0, 10, 20])
+
+    def test_scene_change_sampled(self):
+        sampler = FrameSampler(min_gap=2, max_gap=100, diff_threshold=5)
+        self.assertTrue(sampler.accept(0, _frame(100)))
+        self.assertFalse(sampler.due(1))
+        self.assertFalse(sampler.accept(2, _frame(101)))
+        self.assertTrue(sampler.accept(3, _frame(160)))
+
+
+class TestSpool(unittest.TestCase):
+    def test_spool_and_limit(self):
+        path = spool_to_file(io.BytesIO(b"x" * 100), limit=100)
+        try:
+            self.assertEqual(os.path.getsize(path), 100)
+        finally:
+            os.remove(path)
+        with self.assertRaises(VideoTooLarge):
+            spool_to_file(io.BytesIO(b"x" * 101), limit=100)
+
+
+class FakeCapture:
+    def __init__(self, frames, opened=True):
+        self.frames = frames
+        self.opened = opened
+        self.index = -1
+        self.released = False
+
+    def isOpened(self):
+        return self.opened
+
+    def grab(self):
+        self.index += 1
+        return self.index < len(self.frames)
+
+    def retrieve(self):
+        return True, self.frames[self.index]
+
+    def release(self):
+        self.released = True
+
+
+class EverySampler:
+    def due(self, index):
+        return True
+
+    def accept(self, index, frame):
+        return True
+
+
+BOX = np.array([10, 10, 50, 50], dtype=np.float32)
+
+
+class TestIdentifyVideo(unittest.TestCase):
+    def setUp(self):
+        self.cur = MagicMock()
+        self.capture = FakeCapture([_frame(i) for i in range(10)])
+        self.student = {'roll': 'R1', 'name': 'Alice'}
+        self.matches = []  # one (score, student) per embedding, in order
+        self.emb = lambda i: np.eye(4, dtype=np.float32)[i % 4]
+        self.embedded = 0
+
+        def get_embeddings(crops):
+            embs = np.stack([self.emb(self.embedded + i) for i in range(len(crops))])
+            self.embedded += len(crops)
+            return embs
+
+        def best_matches(cur, embs):
+            start = self.embedded - len(embs)
+            return [self.matches[start + i] if start + i < len(self.matches) else (0.1, None)
+                    for i in range(len(embs))]
+
+        self.best_match = MagicMock(return_value=(0.9, self.student))
+        self.patches = [
+            patch.object(video.cv2, 'VideoCapture', return_value=self.capture),
+            patch.object(video.logic, 'detect_boxes', return_value=[BOX]),
+            patch.object(video.logic, 'crop_face', return_value=np.zeros((160, 160, 3))),
+            patch.object(video.logic, 'get_embeddings', side_effect=get_embeddings),
+            patch.object(video.logic, 'best_matches', side_effect=best_matches),
+            patch.object(video.logic, 'best_match', self.best_match),
+            patch.object(video.logic, 'identification_result',
+                         side_effect=lambda cur, score, student: {'status': 'success', 'score': score,
+                                                                  'student': student}),
+            patch.object(video.logic, 'IDENTIFY_THRESHOLD', 0.5),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+
+    def identify(self, **kwargs):
+        # Re-embed the single track on every sampled frame
+        return identify_video(self.cur, 'clip.webm', sampler=EverySampler(),
+                              tracker=FaceTracker(refresh_frames=1), **kwargs)
+
+    def test_early_stop_after_agreeing_votes(self):
+        self.matches = [(0.8, self.student)] * 10
+        result = self.identify(match_frames=3, max_inferences=20)
+        self.assertEqual(result['status'], 'success')
+        self.assertIs(result['student'], self.student)
+        self.assertAlmostEqual(result['score'], 0.8)
+        self.assertTrue(result['stopped_early'])
+        self.assertEqual(result['frames_read'], 3)
+        self.assertEqual(result['inferences'], 3)
+        self.best_match.assert_not_called()
+        self.assertTrue(self.capture.released)
+
+    def test_votes_below_threshold_do_not_count(self):
+        self.matches = [(0.8, self.student), (0.3, self.student), (0.8, self.student), (0.8, self.student)]
+        result = self.identify(match_frames=3, max_inferences=20)
+        self.assertTrue(result['stopped_early'])
+        self.assertEqual(result['frames_read'], 4)
+
+    def test_max_inferences_cap(self):
+        two_faces = [BOX, np.array([100, 10, 140, 50], dtype=np.float32)]
+        with patch.object(video.logic, 'detect_boxes', return_value=two_faces):
+            result = self.identify(match_frames=3, max_inferences=5)
+        self.assertEqual(result['inferences'], 5)
+        self.assertEqual(self.embedded, 5)
+        # Two faces per frame: the third frame only has room for one crop
+        self.assertEqual(result['frames_read'], 3)
+        self.assertFalse(result['stopped_early'])
+        self.assertEqual(result['tracks'], 2)
+
+    def test_fused_fallback_averages_most_embedded_track(self):
+        # No match clears the threshold, so every frame is read and the
+        # track's embeddings are averaged into one final match
+        result = self.identify(match_frames=3, max_inferences=4)
+        self.assertFalse(result['stopped_early'])
+        self.assertEqual(result['inferences'], 4)
+        self.best_match.assert_called_once()
+        fused = self.best_match.call_args[0][1]
+        np.testing.assert_allclose(fused, np.full(4, 0.5, dtype=np.float32), rtol=1e-6)
+        self.assertEqual(result['score'], 0.9)
+
+    def test_no_face_detected(self):
+        with patch.object(video.logic, 'detect_boxes', return_value=[]):
+            result = self.identify()
+        self.assertEqual(result['status'], 'error')
+        self.assertEqual(result['message'], 'No face detected')
+        self.assertEqual(result['frames_read'], 10)
+        self.best_match.assert_not_called()
+
+    def test_unreadable_video(self):
+        self.capture.opened = False
+        result = self.identify()
+        self.assertEqual(result, {'status': 'error', 'message': 'Could not read video'})
+        video.logic.get_embeddings.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+import numpy as np
+
+
+def iou(a, b):
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0.0, x2 - x1) * max(0.0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def _centroid(box):
+    return np.array([(box[0] + box[2]) / 2, (box[1] + box[3]) / 2])
+
+
+class Track:
+    """One person followed across frames, with the identity votes of its embeddings."""
+
+    def __init__(self, track_id, box, index):
+        self.id = track_id
+        self.box = np.asarray(box, dtype=np.float32)
+        self.first_seen = index
+        self.last_seen = index
+        self.last_embedded = None
+        self.embeddings = []
+        self.votes = {}  # roll -> (student, [scores above threshold])
+
+    def vote(self, emb, score, student, threshold):
+        self.embeddings.append(emb)
+        if student is not None and score > threshold:
+            self.votes.setdefault(student['roll'], (student, []))[1].append(float(score))
+
+    def identity(self):
+        """(mean score, student, votes) of the most voted student, or None."""
+        if not self.votes:
+            return None
+        student, scores = max(self.votes.values(), key=lambda v: (len(v[1]), np.mean(v[1])))
+        return float(np.mean(scores)), student, len(scores)
+
+
+class FaceTracker:
+    """Greedy IoU tracker with a centroid fallback for sparsely sampled frames.
+
+    ``update`` assigns each detected box to a track and returns the tracks
+    that need a (new) embedding: tracks that just started, and tracks whose
+    last embedding is at least ``refresh_frames`` frames old. Tracks unseen
+    for more than ``max_missing`` frames are dropped, so facenet runs per
+    distinct person rather than per frame.
+    """
+
+    def __init__(self, iou_threshold=0.3, refresh_frames=15, max_missing=30):
+        self.iou_threshold = iou_threshold
+        self.refresh_frames = refresh_frames
+        self.max_missing = max_missing
+        self.tracks = []
+        self.finished = []
+        self._next_id = 1
+
+    def _match(self, boxes):
+        pairs = sorted(((iou(t.box, b), ti, bi) for ti, t in enumerate(self.tracks) for bi, b in enumerate(boxes)),
+                       reverse=True)
+        matched, used_t, used_b = {}, set(), set()
+        for overlap, ti, bi in pairs:
+            if overlap < self.iou_threshold:
+                break
+            if ti not in used_t and bi not in used_b:
+                matched[bi] = ti
+                used_t.add(ti)
+                used_b.add(bi)
+
+        # Faces that moved further than the boxes overlap: nearest centroid
+        # within half the track's box diagonal
+        for bi, b in enumerate(boxes):
+            if bi in used_b:
+                continue
+            best, best_dist = None, None
+            for ti, t in enumerate(self.tracks):
+                if ti in used_t:
+                    continue
+                dist = np.linalg.norm(_centroid(b) - _centroid(t.box))
+                if dist <= np.linalg.norm(t.box[2:] - t.box[:2]) / 2 and (best is None or dist < best_dist):
+                    best, best_dist = ti, dist
+            if best is not None:
+                matched[bi] = best
+                used_t.add(best)
+                used_b.add(bi)
+        return matched
+
+    def update(self, boxes, index):
+        matched = self._match(boxes)
+        due = []
+        for bi, box in enumerate(boxes):
+            if bi in matched:
+                track = self.tracks[matched[bi]]
+                track.box = np.asarray(box, dtype=np.float32)
+                track.last_seen = index
+            else:
+                track = Track(self._next_id, box, index)
+                self._next_id += 1
+                self.tracks.append(track)
+            if track.last_embedded is None or index - track.last_embedded >= self.refresh_frames:
+                track.last_embedded = index
+                due.append(track)
+
+        alive = []
+        for track in self.tracks:
+            (alive if index - track.last_seen <= self.max_missing else self.finished).append(track)
+        self.tracks = alive
+        return due
+
+    def all_tracks(self):
+        return self.finished + self.tracks
@@ -0,0 +1,159 @@
+"""Identification from an uploaded video clip.
+
+Frames are decoded one at a time from a spooled temporary file, so memory
+stays flat regardless of clip length. ``FrameSampler`` picks the frames
+worth detection and facenet: frames closer than ``min_gap`` to the last
+sample are skipped without being retrieved, near-duplicates of the last
+sample are dropped by comparing 32x32 grayscale thumbnails, and a frame is
+taken at least every ``max_gap`` frames.
+
+Faces in sampled frames are followed by a ``FaceTracker``; facenet runs
+only for new tracks and every ``VIDEO_TRACK_REFRESH`` frames per track, and
+each embedding votes for the identity of its track. Processing stops as
+soon as one track has been matched to the same student above the
+threshold ``match_frames`` times.
+"""
+import os
+import tempfile
+import cv2
+import numpy as np
+import logging
+
+try:
+    from . import logic
+    from .tracking import FaceTracker
+except ImportError:
+    import logic
+    from tracking import FaceTracker
+
+logger = logging.getLogger(__name__)
+
+VIDEO_MAX_BYTES = int(os.getenv("VIDEO_MAX_BYTES", str(200 * 1024 * 1024)))
+VIDEO_MIN_GAP = int(os.getenv("VIDEO_MIN_GAP", "3"))
+VIDEO_MAX_GAP = int(os.getenv("VIDEO_MAX_GAP", "30"))
+VIDEO_DIFF_THRESHOLD = float(os.getenv("VIDEO_DIFF_THRESHOLD", "6.0"))  # mean abs grey-level change
+VIDEO_MATCH_FRAMES = int(os.getenv("VIDEO_MATCH_FRAMES", "3"))
+VIDEO_MAX_INFERENCES = int(os.getenv("VIDEO_MAX_INFERENCES", "20"))
+VIDEO_MAX_FRAMES = int(os.getenv("VIDEO_MAX_FRAMES", "9000"))  # 5 minutes at 30 fps
+VIDEO_TRACK_IOU = float(os.getenv("VIDEO_TRACK_IOU", "0.3"))
+VIDEO_TRACK_REFRESH = int(os.getenv("VIDEO_TRACK_REFRESH", "15"))  # frames between re-embeddings of a track
+VIDEO_TRACK_MAX_MISSING = int(os.getenv("VIDEO_TRACK_MAX_MISSING", "30"))
+
+THUMB_SIZE = 32
+
+
+class VideoTooLarge(Exception):
+    pass
+
+
+class FrameSampler:
+    def __init__(self, min_gap=VIDEO_MIN_GAP, max_gap=VIDEO_MAX_GAP, diff_threshold=VIDEO_DIFF_THRESHOLD):
+        self.min_gap = max(1, min_gap)
+        self.max_gap = max(self.min_gap, max_gap)
+        self.diff_threshold = diff_threshold
+        self._last_index = None
+        self._last_thumb = None
+
+    def due(self, index):
+        """Whether frame ``index`` is far enough from the last sample to be looked at."""
+        return self._last_index is None or index - self._last_index >= self.min_gap
+
+    def accept(self, index, frame):
+        """Whether to run detection on ``frame``; call only for frames that are ``due``."""
+        thumb = cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), (THUMB_SIZE, THUMB_SIZE),
+                           interpolation=cv2.INTER_AREA).astype(np.float32)
+        if (self._last_thumb is not None and index - self._last_index < self.max_gap
+                and np.abs(thumb - self._last_thumb).mean() < self.diff_threshold):
+            return False
+        self._last_index, self._last_thumb = index, thumb
+        return True
+
+
+def spool_to_file(stream, suffix=".webm", limit=VIDEO_MAX_BYTES):
+    """Copy an upload stream to a temporary file in chunks; the caller removes it."""
+    fd, path = tempfile.mkstemp(suffix=suffix)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            written = 0
+            while True:
+                chunk = stream.read(1024 * 1024)
+                if not chunk:
+                    break
+                written += len(chunk)
+                if written > limit:
+                    raise VideoTooLarge(f"Video exceeds {limit} bytes")
+                out.write(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
+
+
+def identify_video(cur, path, sampler=None, tracker=None, match_frames=VIDEO_MATCH_FRAMES,
+                   max_inferences=VIDEO_MAX_INFERENCES, max_frames=VIDEO_MAX_FRAMES):
+    """Identify one student from a video file and mark attendance once.
+
+    Without an early decision, the embeddings of the track that was
+    embedded most often are averaged and matched once, as in fused batch
+    identification.
+    """
+    sampler = sampler or FrameSampler()
+    tracker = tracker or FaceTracker(VIDEO_TRACK_IOU, VIDEO_TRACK_REFRESH, VIDEO_TRACK_MAX_MISSING)
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        return {'status': 'error', 'message': 'Could not read video'}
+
+    stats = {'frames_read': 0, 'frames_sampled': 0, 'inferences': 0, 'stopped_early': False}
+    decided = None
+    try:
+        while stats['frames_read'] < max_frames and stats['inferences'] < max_inferences:
+            if not cap.grab():
+                break
+            index = stats['frames_read']
+            stats['frames_read'] += 1
+            if not sampler.due(index):
+                continue
+            ok, frame = cap.retrieve()
+            if not ok or not sampler.accept(index, frame):
+                continue
+
+            stats['frames_sampled'] += 1
+            due = tracker.update(logic.detect_boxes(frame), index)
+            crops = [(t, logic.crop_face(frame, [t.box])) for t in due]
+            crops = [(t, c) for t, c in crops if c is not None][:max_inferences - stats['inferences']]
+            if not crops:
+                continue
+
+            # One forward pass and one gallery product for every track due
+            embs = logic.get_embeddings([c for _, c in crops])
+            stats['inferences'] += len(crops)
+            for (track, _), emb, (score, student) in zip(crops, embs, logic.best_matches(cur, embs)):
+                track.vote(emb, score, student, logic.IDENTIFY_THRESHOLD)
+                identity = track.identity()
+                if identity and identity[2] >= match_frames and decided is None:
+                    decided = identity[:2]
+            if decided is not None:
+                stats['stopped_early'] = True
+                break
+    finally:
+        cap.release()
+
+    tracks = [t for t in tracker.all_tracks() if t.embeddings]
+    stats['tracks'] = len(tracks)
+    if not tracks:
+        return {'status': 'error', 'message': 'No face detected', **stats}
+    if decided is None:
+        track = max(tracks, key=lambda t: len(t.embeddings))
+        decided = logic.best_match(cur, logic.normalize(np.mean(track.embeddings, axis=0)))
+    result = logic.identification_result(cur, *decided)
+    result.update(stats)
+    logger.info(f"Video identification: {stats}")
+    return result
+
+
+def identify_video_stream(cur, stream, suffix=".webm"):
+    path = spool_to_file(stream, suffix)
+    try:
+        return identify_video(cur, path)
+    finally:
+        os.remove(path)
@@ -1,10 +1,13 @@
 from flask_smorest import Blueprint, abort
-from flask import jsonify, current_app
+from flask import jsonify, current_app, request
+from marshmallow import ValidationError
 import logging
 try:
     from .services import AttendanceService
+    from .uploads import UploadError, read_octet_stream, multipart_files
 except ImportError:
     from services import AttendanceService
+    from uploads import UploadError, read_octet_stream, multipart_files
 try:
     from .schemas import (
         IdentifyRequestSchema, IdentifyResponseSchema,
@@ -18,12 +21,33 @@ except ImportError:
 
 blp = Blueprint('attendance', __name__, description='Attendance operations')
 
+def identify_image():
+    # Raw bytes (octet-stream body or multipart 'image' part) or JSON base64
+    try:
+        if request.mimetype == 'multipart/form-data':
+            image = multipart_files(('image',)).get('image')
+            if not image:
+                abort(422, errors={'files': {'image': ['Missing data for required field.']}})
+            return image
+        if request.mimetype == 'application/octet-stream':
+            return read_octet_stream()
+    except UploadError as e:
+        abort(e.status, message=e.message)
+    try:
+        return IdentifyRequestSchema().load(request.get_json(silent=True) or {})['image']
+    except ValidationError as e:
+        abort(422, errors={'json': e.messages})
+
 @blp.route('/api/identify', methods=['POST'])
-@blp.arguments(IdentifyRequestSchema)
+@blp.doc(requestBody={'content': {
+    'application/json': {'schema': IdentifyRequestSchema},
+    'application/octet-stream': {'schema': {'type': 'string', 'format': 'binary'}},
+    'multipart/form-data': {'schema': {'type': 'object', 'properties': {'image': {'type': 'string', 'format': 'binary'}}}},
+}})
 @blp.response(200, IdentifyResponseSchema)
-def identify(data):
+def identify():
     current_app.logger.info("Identify request received")
-    return AttendanceService.identify_user(data['image'])
+    return AttendanceService.identify_user(identify_image())
 
 @blp.route('/api/mark-attendance', methods=['POST'])
 @blp.arguments(MarkAttendanceRequestSchema)
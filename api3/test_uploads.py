@@ -0,0 +1,95 @@
+import unittest
+import io
+import os
+import sys
+from flask import Flask
+from werkzeug.test import EnvironBuilder
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import uploads
+
+LIMIT = 1024
+
+
+class UploadTests:
+    """Same cases as api2/test_uploads.py; api3 reads one image per multipart body."""
+    module = None
+
+    def setUp(self):
+        self.app = Flask(__name__)
+
+    def context(self, data=b'', content_type='application/octet-stream', chunked=False):
+        if not chunked:
+            return self.app.test_request_context('/api/identify', method='POST', content_type=content_type, data=data)
+        # Chunked transfer: no Content-Length, the body is read until the stream ends
+        environ = EnvironBuilder('/api/identify', method='POST', content_type=content_type,
+                                 input_stream=io.BytesIO(data)).get_environ()
+        del environ['CONTENT_LENGTH']
+        environ['wsgi.input_terminated'] = True
+        return self.app.request_context(environ)
+
+    def assertUploadError(self, status, read):
+        with self.assertRaises(self.module.UploadError) as cm:
+            read()
+        self.assertEqual(cm.exception.status, status)
+        return cm.exception
+
+    def test_octet_stream(self):
+        with self.context(b'\xff\xd8jpeg'):
+            body = self.module.read_octet_stream(LIMIT)
+        self.assertIsInstance(body, bytearray)
+        self.assertEqual(body, b'\xff\xd8jpeg')
+
+    def test_octet_stream_over_limit(self):
+        with self.context(b'x' * (LIMIT + 1)):
+            error = self.assertUploadError(413, lambda: self.module.read_octet_stream(LIMIT))
+        self.assertIn(str(LIMIT), error.message)
+
+    def test_chunked_octet_stream(self):
+        with self.context(b'jpeg' * 10, chunked=True):
+            self.assertEqual(self.module.read_octet_stream(LIMIT), b'jpeg' * 10)
+        with self.context(b'x' * (LIMIT + 1), chunked=True):
+            self.assertUploadError(413, lambda: self.module.read_octet_stream(LIMIT))
+
+    def test_empty_body(self):
+        for chunked in (False, True):
+            with self.context(b'', chunked=chunked):
+                error = self.assertUploadError(400, lambda: self.module.read_octet_stream(LIMIT))
+            self.assertEqual(error.message, "Empty request body")
+
+    def test_multipart_image(self):
+        with self.context({'image': (io.BytesIO(b'jpeg'), 'face.jpg')}, 'multipart/form-data'):
+            self.assertEqual(self.module.multipart_files(('image',), LIMIT), {'image': b'jpeg'})
+
+    def test_multipart_image_over_limit(self):
+        with self.context({'image': (io.BytesIO(b'x' * (LIMIT + 1)), 'face.jpg')}, 'multipart/form-data'):
+            error = self.assertUploadError(413, lambda: self.module.multipart_files(('image',), LIMIT))
+        self.assertIn("'image'", error.message)
+
+    def test_multipart_body_over_limit_rejected_before_parsing(self):
+        size = LIMIT * self.module.MAX_MULTIPART_FILES + self.module.MULTIPART_OVERHEAD + 1
+        with self.context({'image': (io.BytesIO(b'x' * size), 'face.jpg')}, 'multipart/form-data') as ctx:
+            self.assertUploadError(413, lambda: self.module.multipart_files(('image',), LIMIT))
+            self.assertNotIn('form', ctx.request.__dict__)
+
+    def test_multipart_without_content_length(self):
+        with self.context(b'--x--\r\n', 'multipart/form-data; boundary=x', chunked=True):
+            self.assertUploadError(411, lambda: self.module.multipart_files(('image',), LIMIT))
+
+    def test_wrong_content_type_has_no_files(self):
+        # Empty file parts, text fields and non-multipart bodies carry no image
+        with self.context({'image': (io.BytesIO(b''), 'face.jpg')}, 'multipart/form-data'):
+            self.assertEqual(self.module.multipart_files(('image',), LIMIT), {})
+        with self.context({'image': 'not-a-file'}, 'multipart/form-data'):
+            self.assertEqual(self.module.multipart_files(('image',), LIMIT), {})
+        with self.context(b'{"image": "aGk="}', 'application/json'):
+            self.assertEqual(self.module.multipart_files(('image',), LIMIT), {})
+
+
+class TestApi3Uploads(UploadTests, unittest.TestCase):
+    module = uploads
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+"""Raw image bodies for the identify endpoint.
+
+Images can arrive as base64 strings in JSON, as multipart file parts or as
+the whole ``application/octet-stream`` body. Binary uploads are checked
+against the size limit from ``Content-Length`` before anything is read, and
+octet-stream bodies are read straight into one preallocated buffer that
+``cv2.imdecode`` consumes through ``np.frombuffer`` without further copies.
+"""
+import os
+from flask import request
+
+# Per image; multipart bodies may carry up to MAX_MULTIPART_FILES images
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(10 * 1024 * 1024)))
+MAX_MULTIPART_FILES = 1
+# Room for boundaries and the text fields of a multipart body
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class UploadError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def _check_length(limit):
+    length = request.content_length
+    if length is not None and length > limit:
+        raise UploadError(f"Upload exceeds {limit} bytes", 413)
+    return length
+
+
+def read_octet_stream(limit=None):
+    """The request body as a bytearray, refusing bodies over ``limit`` bytes."""
+    limit = limit or UPLOAD_MAX_BYTES
+    length = _check_length(limit)
+    stream = request.stream
+    if length is not None:
+        buf = bytearray(length)
+        view = memoryview(buf)
+        filled = 0
+        while filled < length:
+            n = stream.readinto(view[filled:])
+            if not n:
+                raise UploadError("Request body ended early")
+            filled += n
+        return buf
+
+    # Chunked transfer: no length up front, so enforce the limit while reading
+    buf = bytearray()
+    while True:
+        chunk = stream.read(64 * 1024)
+        if not chunk:
+            break
+        buf += chunk
+        if len(buf) > limit:
+            raise UploadError(f"Upload exceeds {limit} bytes", 413)
+    if not buf:
+        raise UploadError("Empty request body")
+    return buf
+
+
+def multipart_files(names, limit=None):
+    """Bytes of the named file parts that are present (checked before parsing)."""
+    limit = limit or UPLOAD_MAX_BYTES
+    if request.content_length is None:
+        raise UploadError("Content-Length is required for multipart uploads", 411)
+    _check_length(limit * MAX_MULTIPART_FILES + MULTIPART_OVERHEAD)
+
+    images = {}
+    for name in names:
+        storage = request.files.get(name)
+        if storage is None:
+            continue
+        data = storage.stream.read()
+        if len(data) > limit:
+            raise UploadError(f"Image '{name}' exceeds {limit} bytes", 413)
+        if len(data):
+            images[name] = data
+    return images